@@ -66,7 +66,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'geojson.middleware.MetricsMiddleware',
+    'geojson.middleware.ServerTimingMiddleware',
+    'geojson.middleware.SlowQueryMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Serves the precompressed static files itself, so it stays ahead of CompressionMiddleware.
+    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'geojson.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -111,11 +117,61 @@ DATABASES = {
 
 DATABASES['default']['ENGINE'] = 'django.contrib.gis.db.backends.postgis'
 
+# Read replicas for the dashboard's read-only models, see geojson.routers.
+for i, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[])):
+    DATABASES[f'replica_{i}'] = env.db_url_config(url)
+    DATABASES[f'replica_{i}']['ENGINE'] = 'django.contrib.gis.db.backends.postgis'
+    DATABASES[f'replica_{i}']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['geojson.routers.ReadReplicaRouter']
+# Replicas further behind the primary than this are skipped, and for this long after a data change none are used.
+REPLICA_MAX_LAG_SECONDS = env.float('REPLICA_MAX_LAG_SECONDS', default=30)
+
 GEOSERVER_URL = env('GEOSERVER_URL')
 GEOSERVER_USER = env('GEOSERVER_USER')
 GEOSERVER_PASS = env('GEOSERVER_PASS')
 GEOSERVER_WORKSPACE = env('GEOSERVER_WORKSPACE')
 
+# JSON encoder of the API responses, 'orjson' or 'json'. Defaults to orjson when installed.
+API_JSON_ENCODER = env('API_JSON_ENCODER', default=None)
+
+# Who may read /metrics besides staff users: these client addresses or networks,
+# and requests sending "Authorization: Bearer <METRICS_TOKEN>" when it is set.
+METRICS_ALLOWED_IPS = env.list('METRICS_ALLOWED_IPS', default=['127.0.0.1', '::1'])
+METRICS_TOKEN = env('METRICS_TOKEN', default='')
+
+# Send per-phase Server-Timing headers and log a timing line per request. Off in
+# production unless enabled, as the header reveals query and encoding times.
+SERVER_TIMING = env.bool('SERVER_TIMING', default=DEBUG)
+
+# Queries slower than this are stored with their plan in the SlowQuery admin,
+# keeping the newest SLOW_QUERY_BUFFER_SIZE. 0 disables it. SLOW_QUERY_EXPLAIN is
+# 'analyze' (EXPLAIN (ANALYZE, BUFFERS), which runs the query again inside the
+# request, once per query shape and process), 'plan' (plain EXPLAIN) or 'off'.
+SLOW_QUERY_THRESHOLD_MS = env.float('SLOW_QUERY_THRESHOLD_MS', default=500)
+SLOW_QUERY_BUFFER_SIZE = env.int('SLOW_QUERY_BUFFER_SIZE', default=200)
+SLOW_QUERY_EXPLAIN = env('SLOW_QUERY_EXPLAIN', default='analyze')
+
+# Generated /api/export/ files, kept for the current data version only.
+EXPORT_CACHE_DIR = env('EXPORT_CACHE_DIR', default=os.path.join(BASE_DIR, 'exports'))
+
+# Time series written by import_pypsa_network and served by /api/timeseries/.
+TIMESERIES_DIR = env('TIMESERIES_DIR', default=os.path.join(BASE_DIR, 'timeseries'))
+
+# Also coalesce identical cold API requests across worker processes with a PostgreSQL advisory lock.
+# The response cache (CACHES below) is shared, so one query then fills it for all workers.
+SINGLE_FLIGHT_DATABASE_LOCK = env.bool('SINGLE_FLIGHT_DATABASE_LOCK', default=False)
+
+# Version of the loaded data, part of every cache key. A file, so that a bump by
+# any worker or management command is seen by all processes at once.
+DATA_VERSION_FILE = env('DATA_VERSION_FILE', default=os.path.join(BASE_DIR, 'data_version'))
+
+# Pre-encoded full-dataset responses shared by all workers, rebuilt on every data change.
+SNAPSHOT_DIR = env('SNAPSHOT_DIR', default=os.path.join(BASE_DIR, 'snapshots'))
+
+# Country whose summary the index page inlines and whose API requests it preloads; empty disables both.
+INDEX_SUMMARY_COUNTRY = env('INDEX_SUMMARY_COUNTRY', default='United States')
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -158,6 +214,17 @@ STATICFILES_DIRS = [
 # STATICFILES_DIRS = [
 #     os.path.join(BASE_DIR, 'PyPSAEarthDashboard/static'),
 # ]
+
+# collectstatic writes content-hashed copies with .gz/.br siblings, which
+# WhiteNoise serves with far-future immutable cache headers.
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'geojson.storage.ModuleManifestStaticFilesStorage',
+    },
+}
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -197,15 +264,28 @@ LOGGING = {
     },
 }
 
-# CACHES = {
-#     "default": {
-#         "BACKEND": "django_redis.cache.RedisCache",
-#         "LOCATION": env('REDIS_URL', default="redis://127.0.0.1:6379/1"),
-#         "OPTIONS": {
-#             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-#         }
-#     }
-# }
+# The API response cache has to be shared by all worker processes, otherwise each
+# one computes and stores every response itself. Redis when REDIS_URL is set,
+# else files under CACHE_DIR, which the workers of one host share.
+if env('REDIS_URL', default=''):
+    CACHES = {
+        "default": {
+            "BACKEND": "django_redis.cache.RedisCache",
+            "LOCATION": env('REDIS_URL'),
+            "OPTIONS": {
+                "CLIENT_CLASS": "django_redis.client.DefaultClient",
+            }
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": env('CACHE_DIR', default=os.path.join(BASE_DIR, 'cache')),
+            # Every response is stored once per content coding.
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
 
 # setting to allow session caching in Redis
 # SESSION_ENGINE = "django.contrib.sessions.backends.cache"
@@ -33,6 +33,28 @@ let chartInitialized = {
   lineDataChart: false,
 };
 
+// Charts drawn from the summary the index page inlines, until the per-bus data arrives.
+const summaryCharts = {
+  nominal_generators: ["nominalGeneratorCapacityChart", "Nominal Generation Capacity by Carrier"],
+  optimal_generators: ["optimalGeneratorCapacityChart", "Optimal Generation Capacity by Carrier"],
+  nominal_storage: ["nominalStorageCapacityChart", "Nominal Storage Capacity by Carrier"],
+  optimal_storage: ["optimalStorageCapacityChart", "Optimal Storage Capacity by Carrier"],
+};
+
+export function renderCapacitySummary(summary) {
+  if (!summary || !summary.capacity) return;
+  Object.entries(summary.capacity).forEach(([layer, totals]) => {
+    if (!summaryCharts[layer]) return;
+    const [chartId, title] = summaryCharts[layer];
+    const pieChartData = Object.entries(totals)
+      .filter(([carrier, value]) => carrier !== "load" && value > 0)
+      .map(([carrier, value]) => ({ label: carrier, value: value }));
+    if (pieChartData.length > 0) {
+      createPieChart(chartId, pieChartData, title);
+    }
+  });
+}
+
 // Reset charts function
 export function resetCharts(country) {
   console.log(`Resetting charts for country: ${country}`);
@@ -40,6 +40,105 @@ const wmsLayers = {
   },
 };
 
+// Point layers drawn as server-side clusters (/api/clusters/) up to this zoom,
+// where the individual points are too dense to read.
+const CLUSTER_MAX_ZOOM = 8;
+const clusterLayers = {
+  nominal_generators: "#235ebc",
+  nominal_storage: "#b8ea04",
+};
+let clusterListenerKeys = [];
+
+function clusterStyle(feature, color) {
+  const { count, capacity } = feature.getProperties();
+  return new ol.style.Style({
+    image: new ol.style.Circle({
+      radius: 6 + 3 * Math.log10(1 + capacity),
+      fill: new ol.style.Fill({ color: color }),
+      stroke: new ol.style.Stroke({ color: "#ffffff", width: 1 }),
+    }),
+    text: new ol.style.Text({
+      text: String(count),
+      fill: new ol.style.Fill({ color: "#ffffff" }),
+      font: "bold 11px sans-serif",
+    }),
+  });
+}
+
+function createClusterLayer(map, country, clusterLayer, color) {
+  const format = new ol.format.GeoJSON();
+  const source = new ol.source.Vector({
+    strategy: ol.loadingstrategy.bbox,
+    loader: function (extent, resolution, projection, success, failure) {
+      const zoom = Math.round(map.getView().getZoom());
+      const params = new URLSearchParams({
+        layer: clusterLayer,
+        zoom: zoom,
+        bbox: ol.proj.transformExtent(extent, projection, "EPSG:4326").join(","),
+      });
+      fetch(`/api/clusters/${country}/?${params}`)
+        .then((response) => {
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
+          return response.json();
+        })
+        .then((data) => {
+          source.set("zoom", zoom);
+          const features = format.readFeatures(data, { featureProjection: projection });
+          source.addFeatures(features);
+          success(features);
+        })
+        .catch((error) => {
+          console.error(`Error loading ${clusterLayer} clusters for ${country}:`, error);
+          source.removeLoadedExtent(extent);
+          failure();
+        });
+    },
+  });
+
+  const layer = new ol.layer.Vector({
+    source: source,
+    maxZoom: CLUSTER_MAX_ZOOM,
+    style: (feature) => clusterStyle(feature, color),
+  });
+  layer.set("name", `${clusterLayer}_clusters`);
+  layer.set("cluster", true);
+  return layer;
+}
+
+// Clusters of the country's generators and storage units, refetched when
+// the zoom level changes; clicking one zooms to the units it holds.
+function addClusterLayers(map, country) {
+  const layers = Object.entries(clusterLayers)
+    // Storage data is not available for the United States.
+    .filter(([clusterLayer]) => !(clusterLayer.endsWith("storage") && country === "United States"))
+    .map(([clusterLayer, color]) => createClusterLayer(map, country, clusterLayer, color));
+  layers.forEach((layer) => map.addLayer(layer));
+
+  clusterListenerKeys = [
+    map.on("moveend", () => {
+      const zoom = Math.round(map.getView().getZoom());
+      layers.forEach((layer) => {
+        const source = layer.getSource();
+        if (source.get("zoom") !== undefined && source.get("zoom") !== zoom) {
+          source.set("zoom", undefined);
+          source.clear();
+        }
+      });
+    }),
+    map.on("singleclick", (evt) => {
+      const feature = map.forEachFeatureAtPixel(evt.pixel, (feature) => feature, {
+        layerFilter: (layer) => layer.get("cluster") === true,
+      });
+      if (feature) {
+        const bbox = ol.proj.transformExtent(feature.get("bbox"), "EPSG:4326", "EPSG:3857");
+        map.getView().fit(bbox, { padding: [40, 40, 40, 40], maxZoom: CLUSTER_MAX_ZOOM + 1, duration: 300 });
+      }
+    }),
+  ];
+}
+
 export function loadLayers(map, country) {
   if (!map) {
     console.error("Map is undefined in loadLayers");
@@ -77,14 +176,17 @@ export function loadLayers(map, country) {
     console.log(`Layer loaded: ${layerName}, Identifier: ${layerIdentifier}`);
   }
 
+  addClusterLayers(map, country);
   return loadedLayers;
 }
 
 export function clearLayers(map) {
   const layers = map.getLayers().getArray().slice();
   layers.forEach((layer) => {
-    if (layer instanceof ol.layer.Image) {
+    if (layer instanceof ol.layer.Image || layer.get("cluster")) {
       map.removeLayer(layer);
     }
   });
+  ol.Observable.unByKey(clusterListenerKeys);
+  clusterListenerKeys = [];
 }
@@ -21,6 +21,7 @@ import {
 } from "./uiControls.js";
 import {
   setCurrentCountry,
+  renderCapacitySummary,
   loadNominalGeneratorCapacityData,
   loadOptimalGeneratorCapacityData,
   loadNominalStorageCapacityData,
@@ -43,6 +44,12 @@ function onCountrySelected(country) {
   updateEconomicCharts('map2');
 }
 
+// The summary the index page inlines for the initial country, or null.
+function initialSummary(country) {
+  const summary = window.INITIAL_SUMMARY;
+  return summary && summary.country === country.toLowerCase() ? summary : null;
+}
+
 function setupLayerToggleListeners(layers) {
   document.querySelectorAll('.layer-toggle input[type="checkbox"]').forEach(checkbox => {
     checkbox.addEventListener('change', () => {
@@ -67,6 +74,14 @@ window.onload = async () => {
     console.log(`Default country set to: ${defaultCountry}`);
     let layers = loadLayers(map, defaultCountry);
 
+    const summary = initialSummary(defaultCountry);
+    if (summary && summary.extent) {
+      // Fitted before the URL handling, so a view given in the URL still wins.
+      map.getView().fit(ol.proj.transformExtent(summary.extent, "EPSG:4326", "EPSG:3857"), {
+        padding: [20, 20, 20, 20],
+      });
+    }
+
     addDownloadEventListeners();
     addMapEventHandlers(
       map,
@@ -100,6 +115,7 @@ window.onload = async () => {
 
     setupLayerToggleListeners(layers);
 
+    renderCapacitySummary(summary);
     loadNominalGeneratorCapacityData(defaultCountry);
     loadOptimalGeneratorCapacityData(defaultCountry);
     loadNominalStorageCapacityData(defaultCountry);
@@ -125,7 +141,7 @@ window.onload = async () => {
     }
 
     setTimeout(() => {
-      createScenarioControls();
+      createScenarioControls(summary ? summary.scenarios : []);
       setupScenarioListeners();
       updateEconomicCharts('chart1');
       updateEconomicCharts('chart2');
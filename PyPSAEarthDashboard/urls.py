@@ -22,18 +22,33 @@ from django.contrib import admin
 from django.urls import path
 from geojson.views import (
     index, nominal_generator_capacity_json, optimal_generator_capacity_json,
-    nominal_storage_capacity_json, optimal_storage_capacity_json, line_data_json, economic_data_json
+    nominal_storage_capacity_json, optimal_storage_capacity_json, line_data_json, economic_data_json,
+    scenario_features_json, choropleth_statistics_json, metrics,
+    network_neighbors_json, network_components_json, network_path_json, identify_json,
+    regions_json, line_metrics_json, export_dataset, timeseries_json, clusters_json
 )
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', index, name='index'),
+    path('metrics', metrics, name='metrics'),
     path('api/line-data/<str:country>/', line_data_json, name='line_data_json'),
     path('api/optimal-storage-capacity/<str:country>/', optimal_storage_capacity_json, name='optimal_storage_capacity_json'),
     path('api/nominal-storage-capacity/<str:country>/', nominal_storage_capacity_json, name='nominal_storage_capacity_json'),
     path('api/optimal-generator-capacity/<str:country>/', optimal_generator_capacity_json, name='optimal_generator_capacity_json'),
     path('api/nominal-generator-capacity/<str:country>/', nominal_generator_capacity_json, name='nominal_generator_capacity_json'),
     path('api/economic-data/<str:country>/<str:scenario>/', economic_data_json, name='economic_data_json'),
+    path('api/scenario-features/<str:country>/<str:scenario>/', scenario_features_json, name='scenario_features_json'),
+    path('api/stats/<str:country>/<str:scenario>/<str:carrier>/<str:variable>/', choropleth_statistics_json, name='choropleth_statistics_json'),
+    path('api/network/<str:country>/neighbors/<str:bus>/', network_neighbors_json, name='network_neighbors_json'),
+    path('api/network/<str:country>/components/', network_components_json, name='network_components_json'),
+    path('api/network/<str:country>/path/<str:source>/<str:target>/', network_path_json, name='network_path_json'),
+    path('api/identify/<str:country>/', identify_json, name='identify_json'),
+    path('api/clusters/<str:country>/', clusters_json, name='clusters_json'),
+    path('api/regions/<str:country>/', regions_json, name='regions_json'),
+    path('api/line-metrics/<str:country>/', line_metrics_json, name='line_metrics_json'),
+    path('api/timeseries/<str:country>/<str:scenario>/<str:component>/<str:attribute>/', timeseries_json, name='timeseries_json'),
+    path('api/export/<str:dataset>/<str:country>/', export_dataset, name='export_dataset'),
 ]
 
 
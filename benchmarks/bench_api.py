@@ -0,0 +1,119 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import numpy as np
+import pytest
+from django.core.cache import cache
+from django.urls import reverse
+
+from geojson import encoders
+from geojson.views import GENERATOR_FIELD_PRECISION
+
+from .conftest import run_benchmark
+
+COUNTRIES = ['colombia', 'united states']
+ENDPOINTS = [
+    (name, {'country': country}, None)
+    for name in ['nominal_generator_capacity_json', 'optimal_generator_capacity_json',
+                 'nominal_storage_capacity_json', 'optimal_storage_capacity_json',
+                 'line_data_json']
+    for country in COUNTRIES
+] + [
+    ('index', {}, None),
+    ('economic_data_json', {'country': 'united states', 'scenario': '2021'}, None),
+    ('scenario_features_json', {'country': 'united states', 'scenario': '2021'},
+     {'carrier': 'solar', 'properties': 'carrier,cf,crt,usdpt'}),
+    ('scenario_features_json', {'country': 'united states', 'scenario': '2021'},
+     {'bbox': '-105,35,-95,45', 'carrier': 'solar'}),
+    ('choropleth_statistics_json',
+     {'country': 'united states', 'scenario': '2021', 'carrier': 'solar', 'variable': 'cf'}, None),
+    ('network_neighbors_json', {'country': 'united states', 'bus': 'bus_0'}, {'hops': 3}),
+    ('network_components_json', {'country': 'united states'}, None),
+    ('network_path_json', {'country': 'united states', 'source': 'bus_0', 'target': 'bus_1'},
+     {'weight': 'length'}),
+    ('identify_json', {'country': 'united states'}, {'lon': -100, 'lat': 40}),
+    ('clusters_json', {'country': 'united states'}, {'zoom': 4}),
+    ('clusters_json', {'country': 'united states'},
+     {'layer': 'optimal_generators', 'zoom': 7, 'bbox': '-105,35,-95,45'}),
+    ('line_metrics_json', {'country': 'united states'}, {'order_by': '-expansion', 'limit': 100}),
+    ('timeseries_json',
+     {'country': 'united states', 'scenario': '2021', 'component': 'generators', 'attribute': 'p'},
+     {'names': 'gen_0,gen_1,gen_2', 'width': 800}),
+    ('timeseries_json',
+     {'country': 'united states', 'scenario': '2021', 'component': 'generators', 'attribute': 'p'},
+     {'names': 'gen_0', 'start': '2013-06-01', 'end': '2013-06-30', 'method': 'mean', 'width': 200}),
+]
+
+
+def endpoint_id(endpoint):
+    name, kwargs, query = endpoint
+    parts = [name] + [str(v).replace(' ', '_') for v in kwargs.values()]
+    if query:
+        parts += [f'{k}={v}' for k, v in query.items()]
+    return '-'.join(parts)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('cache_state', ['cold', 'warm'])
+@pytest.mark.parametrize('endpoint', ENDPOINTS, ids=endpoint_id)
+def bench_endpoint(benchmark, benchmark_results, client, request, endpoint, cache_state):
+    name, kwargs, query = endpoint
+    url = reverse(name, kwargs=kwargs)
+
+    def get():
+        return client.get(url, query)
+
+    setup = cache.clear if cache_state == 'cold' else None
+    if setup is None:
+        get()
+
+    response, timings, peak = run_benchmark(
+        benchmark, get, request.config.getoption('bench_rounds'), setup=setup)
+    assert response.status_code in (200, 204)
+
+    compressed = client.get(url, query, HTTP_ACCEPT_ENCODING='br, gzip')
+    benchmark_results.record(
+        f'api/{endpoint_id(endpoint)}/{cache_state}', timings,
+        status=response.status_code,
+        payload_bytes=len(response.content),
+        compressed_bytes=len(compressed.content),
+        content_encoding=compressed.get('Content-Encoding', 'identity'),
+        peak_memory_bytes=peak,
+    )
+
+
+def generator_rows(size, rng):
+    """Rows shaped like those the generator capacity endpoints encode."""
+    lon, lat = rng.uniform(-120, -70, size), rng.uniform(25, 50, size)
+    return [{'Generator': f'gen_{i}', 'Bus': f'bus_{i}', 'carrier': 'solar', 'p_nom': p_nom,
+             'capital_cost': cost, 'efficiency': efficiency, 'build_year': 2020,
+             'x': x, 'y': y, 'geom': (x, y)}
+            for i, (p_nom, cost, efficiency, x, y) in enumerate(zip(
+                (rng.random(size) * 5000).tolist(), rng.lognormal(5, 3, size).tolist(),
+                rng.random(size).tolist(), lon.tolist(), lat.tolist()))]
+
+
+def line_rows(size, rng):
+    """Rows shaped like those the line endpoint encodes, with 2 to 12 vertices per line."""
+    return [{'Line': f'line_{i}', 's_nom': float(rng.random() * 5000), 'x': float(rng.random()),
+             'length': float(rng.random() * 500),
+             'line_geom': [tuple(point) for point in rng.uniform(-120, 50, (rng.integers(2, 13), 2)).tolist()]}
+            for i in range(size)]
+
+
+@pytest.mark.parametrize('rows', ['generators', 'lines'])
+@pytest.mark.parametrize('rounding', ['round_numbers', 'round_records'])
+def bench_rounding(benchmark, benchmark_results, request, network_size, rounding, rows):
+    """Float rounding before encoding, value by value against column-wise."""
+    rng = np.random.default_rng(0)
+    data = generator_rows(network_size, rng) if rows == 'generators' else line_rows(network_size, rng)
+    field_precision = GENERATOR_FIELD_PRECISION if rows == 'generators' else None
+    round_data = getattr(encoders, rounding)
+
+    # Rounding rounded values costs the same, so the in-place round_records needs no fresh copy.
+    _, timings, peak = run_benchmark(
+        benchmark, lambda: round_data(data, field_precision=field_precision),
+        request.config.getoption('bench_rounds'))
+    benchmark_results.record(f'encode/{rounding}/{rows}', timings, peak_memory_bytes=peak)
@@ -0,0 +1,90 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import json
+import os
+
+import geopandas as gpd
+import numpy as np
+import pytest
+from django.conf import settings
+from django.db import connection
+
+from geojson import models
+from geojson.models import Bus, JSONBus, publish_data, publish_json_data
+
+from .conftest import run_benchmark
+from .synthetic import economic_frame, scenario_frame
+
+INGEST_ROUNDS = 3
+
+
+class StubCatalog:
+    """Stands in for the GeoServer catalog so ingest is timed without any network calls."""
+
+    def create_featurestore(self, *args, **kwargs):
+        pass
+
+    def publish_featurestore(self, *args, **kwargs):
+        pass
+
+
+@pytest.fixture
+def stub_geoserver(monkeypatch):
+    monkeypatch.setattr(models, 'geo', StubCatalog())
+
+
+def media_file(relative_path):
+    path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def row_count(table_name):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM "{table_name}"')
+        return cursor.fetchone()[0]
+
+
+@pytest.mark.django_db
+def bench_publish_data(benchmark, benchmark_results, network_size, stub_geoserver):
+    frame = scenario_frame(network_size, np.random.default_rng(1)).drop(columns=['geom'])
+    relative_path = 'geojson_files/benchmark_generators.geojson'
+    gdf = gpd.GeoDataFrame(frame, geometry=gpd.points_from_xy(frame['x'], frame['y']), crs=4326)
+    gdf.to_file(media_file(relative_path), driver='GeoJSON')
+    bus = Bus(name='benchmark_generators', geojson_file=relative_path)
+
+    _, timings, peak = run_benchmark(
+        benchmark, lambda: publish_data(sender=Bus, instance=bus, created=True), INGEST_ROUNDS)
+    assert row_count('geojson_benchmark_generators') == network_size
+
+    benchmark_results.record(
+        'ingest/publish_data', timings,
+        rows=network_size,
+        file_bytes=os.path.getsize(bus.geojson_file.path),
+        peak_memory_bytes=peak,
+    )
+
+
+@pytest.mark.django_db
+def bench_publish_json_data(benchmark, benchmark_results, network_size):
+    frame = economic_frame('benchmark', np.random.default_rng(2))
+    frame = frame.iloc[np.arange(network_size) % len(frame)].reset_index(drop=True)
+    relative_path = 'json_files/benchmark_statistics.json'
+    with open(media_file(relative_path), 'w') as file:
+        json.dump(json.loads(frame.to_json(orient='split', index=False)), file)
+    json_bus = JSONBus(name='benchmark_statistics', json_file=relative_path)
+
+    _, timings, peak = run_benchmark(
+        benchmark, lambda: publish_json_data(sender=JSONBus, instance=json_bus, created=True),
+        INGEST_ROUNDS)
+    assert row_count('json_benchmark_statistics') == network_size
+
+    benchmark_results.record(
+        'ingest/publish_json_data', timings,
+        rows=network_size,
+        file_bytes=os.path.getsize(json_bus.json_file.path),
+        peak_memory_bytes=peak,
+    )
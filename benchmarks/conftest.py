@@ -0,0 +1,106 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import datetime
+import json
+import os
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--network-size', type=int,
+                     default=int(os.environ.get('BENCHMARK_NETWORK_SIZE', 10_000)),
+                     help="Number of lines and generators per synthetic network (10k-1M).")
+    parser.addoption('--bench-rounds', type=int, default=20,
+                     help="Timed rounds per API benchmark.")
+    parser.addoption('--results-file', default=None,
+                     help="JSON results file, defaults to benchmarks/results/<commit>-<size>.json.")
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+class BenchmarkResults:
+    """Latency percentiles, peak memory and payload sizes of every benchmark in the session."""
+
+    def __init__(self, commit, network_size):
+        self.commit = commit
+        self.network_size = network_size
+        self.results = {}
+
+    def record(self, name, timings, **extra):
+        timings = np.asarray(timings) * 1000
+        self.results[name] = {
+            'rounds': len(timings),
+            'mean_ms': float(timings.mean()),
+            'p50_ms': float(np.percentile(timings, 50)),
+            'p95_ms': float(np.percentile(timings, 95)),
+            'p99_ms': float(np.percentile(timings, 99)),
+            'max_ms': float(timings.max()),
+            **extra,
+        }
+
+    def write(self, path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as file:
+            json.dump({
+                'commit': self.commit,
+                'network_size': self.network_size,
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'results': self.results,
+            }, file, indent=2, sort_keys=True)
+
+
+@pytest.fixture(scope='session')
+def network_size(request):
+    return request.config.getoption('network_size')
+
+
+@pytest.fixture(scope='session')
+def django_db_setup(django_db_blocker, network_size):
+    """Migrate and seed the BENCHMARK_DATABASE_URL database instead of creating a test database."""
+    from django.core.management import call_command
+    from django.db import connection
+
+    from .synthetic import seed_database
+
+    with django_db_blocker.unblock():
+        call_command('migrate', verbosity=0)
+        seed_database(connection, network_size)
+
+
+@pytest.fixture(scope='session')
+def benchmark_results(request, network_size):
+    commit = current_commit()
+    results = BenchmarkResults(commit, network_size)
+    yield results
+    path = request.config.getoption('results_file')
+    results.write(Path(path) if path else RESULTS_DIR / f'{commit}-{network_size}.json')
+
+
+def run_benchmark(benchmark, func, rounds, setup=None):
+    """Time ``func`` with pytest-benchmark, then measure its Python heap peak in one extra call."""
+    result = benchmark.pedantic(func, setup=setup, rounds=rounds, iterations=1)
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, benchmark.stats.stats.data, peak
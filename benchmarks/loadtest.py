@@ -0,0 +1,343 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+End-to-end load test replaying dashboard sessions against a running server.
+
+Every virtual user loops over sessions modelled on the frontend: opening the
+dashboard for a country (the index page, the five ``dataLoaders.js``
+fetches and the WMS images), clicking on buses, and comparing scenarios.
+Like a browser, a user fetches the requests of one step in parallel, at
+most six at a time. ``--stages 10:60,50:60,200:120`` runs 10, then 50, then
+200 concurrent users for the given seconds; throughput, latency
+percentiles and error rates are reported per stage and endpoint.
+
+Against a server of your own (seeded by the benchmark suite, for example):
+
+    python -m benchmarks.loadtest --url http://127.0.0.1:8000
+
+Or seed BENCHMARK_DATABASE_URL and start a server with a stub GeoServer:
+
+    python -m benchmarks.loadtest --serve gunicorn --workers 4 --network-size 100000
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from urllib.parse import quote
+
+import numpy as np
+import requests
+
+from .conftest import current_commit
+from .stub_geoserver import start_stub_geoserver
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+# Countries and scenarios of the synthetic networks, and the areas users click in.
+COUNTRIES = ['colombia', 'united states']
+SCENARIOS = ['2021', '2050']
+EXTENTS = {
+    'colombia': (-79.0, -4.2, -66.9, 12.5),
+    'united states': (-124.7, 25.1, -66.9, 49.4),
+}
+# The fetches of dataLoaders.js when a country is selected, by URL name.
+DATA_LOADERS = [
+    ('nominal_generator_capacity_json', 'nominal-generator-capacity'),
+    ('optimal_generator_capacity_json', 'optimal-generator-capacity'),
+    ('nominal_storage_capacity_json', 'nominal-storage-capacity'),
+    ('optimal_storage_capacity_json', 'optimal-storage-capacity'),
+    ('line_data_json', 'line-data'),
+]
+WMS_IMAGES = 4
+BROWSER_CONNECTIONS = 6
+GEOSERVER_URL_RE = re.compile(r"window\.GEOSERVER_URL = '([^']*)'")
+SERVER_START_TIMEOUT = 120
+
+
+class Recorder:
+    """Latencies and failures of every request, by stage and endpoint."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stage = 0
+        self.samples = {}
+
+    def record(self, stage, endpoint, seconds, ok):
+        with self.lock:
+            self.samples.setdefault(stage, {}).setdefault(endpoint, []).append((seconds, ok))
+
+    def summary(self, stage, duration):
+        """``{endpoint: statistics}`` of one stage, including an ``all`` row."""
+        endpoints = dict(self.samples.get(stage, {}))
+        # The stub GeoServer's images are part of the sessions, but not of the dashboard's totals.
+        endpoints['all'] = [s for endpoint, samples in endpoints.items()
+                            if not endpoint.startswith('geoserver_') for s in samples]
+        summary = {}
+        for endpoint, samples in endpoints.items():
+            if not samples:
+                continue
+            latencies = np.array([s[0] for s in samples]) * 1000
+            errors = sum(1 for s in samples if not s[1])
+            summary[endpoint] = {
+                'requests': len(samples),
+                'throughput_rps': len(samples) / duration,
+                'p50_ms': float(np.percentile(latencies, 50)),
+                'p95_ms': float(np.percentile(latencies, 95)),
+                'p99_ms': float(np.percentile(latencies, 99)),
+                'error_rate': errors / len(samples),
+            }
+        return summary
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, base_url, recorder, think_time, timeout, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.recorder = recorder
+        self.think_time = think_time
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+        self.stop = threading.Event()
+        self.http = requests.Session()
+        self.http.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=BROWSER_CONNECTIONS))
+        self.geoserver_url = None
+        self.country = None
+
+    def get(self, endpoint, url, params=None):
+        if not url.startswith('http'):
+            url = self.base_url + url
+        stage = self.recorder.stage
+        start = time.perf_counter()
+        try:
+            response = self.http.get(url, params=params, timeout=self.timeout)
+            body = response.content
+            ok = response.status_code < 400
+        except requests.RequestException:
+            body, ok = b'', False
+        self.recorder.record(stage, endpoint, time.perf_counter() - start, ok)
+        return body
+
+    def get_all(self, requests_):
+        """Fetch ``(endpoint, url, params)`` requests in parallel, like a browser."""
+        with ThreadPoolExecutor(BROWSER_CONNECTIONS) as pool:
+            list(pool.map(lambda r: self.get(*r), requests_))
+
+    def run(self):
+        # Spread the first sessions so users added together do not start in lockstep.
+        if self.stop.wait(self.rng.uniform(0, self.think_time)):
+            return
+        sessions, weights = zip(*SESSIONS)
+        while not self.stop.is_set():
+            if self.country is None:
+                open_dashboard(self)
+            else:
+                self.rng.choices(sessions, weights)[0](self)
+            self.stop.wait(self.rng.expovariate(1 / self.think_time) if self.think_time else 0)
+        self.http.close()
+
+
+def open_dashboard(user):
+    """Select a country: the page, its API data and the map images."""
+    user.country = user.rng.choice(COUNTRIES)
+    page = user.get('index', '/').decode(errors='replace')
+    match = GEOSERVER_URL_RE.search(page)
+    user.geoserver_url = match.group(1) if match else None
+
+    country = quote(user.country)
+    user.get_all([(name, f'/api/{path}/{country}/') for name, path in DATA_LOADERS])
+
+    if user.geoserver_url:
+        minx, miny, maxx, maxy = EXTENTS[user.country]
+        user.get_all([('geoserver_wms', f'{user.geoserver_url}/wms', {
+            'SERVICE': 'WMS', 'REQUEST': 'GetMap', 'FORMAT': 'image/png', 'TRANSPARENT': 'true',
+            'WIDTH': 1024, 'HEIGHT': 768, 'CRS': 'EPSG:4326', 'BBOX': f'{miny},{minx},{maxy},{maxx}',
+            'LAYERS': f'PyPSAEarthDashboard:layer_{i}',
+        }) for i in range(WMS_IMAGES)])
+
+
+def click_bus(user):
+    """Click-to-inspect somewhere in the selected country."""
+    minx, miny, maxx, maxy = EXTENTS[user.country]
+    user.get('identify_json', f'/api/identify/{quote(user.country)}/', {
+        'lon': round(user.rng.uniform(minx, maxx), 4),
+        'lat': round(user.rng.uniform(miny, maxy), 4),
+    })
+
+
+def compare_scenarios(user):
+    """The scenario comparison charts, which only exist for the United States."""
+    user.get_all([('economic_data_json', f'/api/economic-data/united%20states/{scenario}/', None)
+                  for scenario in SCENARIOS])
+
+
+# Sessions after the dashboard is open, with their relative frequencies.
+SESSIONS = [
+    (open_dashboard, 1),
+    (click_bus, 4),
+    (compare_scenarios, 1),
+]
+
+
+def parse_stages(value):
+    """``users:seconds`` pairs, comma separated."""
+    try:
+        stages = [tuple(int(v) for v in stage.split(':')) for stage in value.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid stages '{value}', expected e.g. 10:60,50:60")
+    if any(len(stage) != 2 or stage[0] < 0 or stage[1] <= 0 for stage in stages):
+        raise argparse.ArgumentTypeError(f"Invalid stages '{value}', expected e.g. 10:60,50:60")
+    return stages
+
+
+def run_load(base_url, stages, recorder, think_time, timeout, seed=0):
+    """Run ``stages`` of ``(users, seconds)``; returns each stage's measured duration."""
+    users = []
+    durations = []
+    try:
+        for i, (count, seconds) in enumerate(stages):
+            recorder.stage = i
+            start = time.perf_counter()
+            while len(users) < count:
+                user = VirtualUser(base_url, recorder, think_time, timeout, seed * 100_003 + len(users))
+                users.append(user)
+                user.start()
+            while len(users) > count:
+                users.pop().stop.set()
+            print(f"Stage {i + 1}/{len(stages)}: {count} users for {seconds} s", file=sys.stderr)
+            time.sleep(seconds)
+            durations.append(time.perf_counter() - start)
+    finally:
+        for user in users:
+            user.stop.set()
+        for user in users:
+            user.join(timeout)
+    return durations
+
+
+def print_report(stages, results):
+    columns = f"{'endpoint':<34}{'requests':>10}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>9}"
+    for (users, _), summary in zip(stages, results):
+        print(f"\n{users} users")
+        print(columns)
+        for endpoint, s in sorted(summary.items(), key=lambda item: (item[0] == 'all', item[0])):
+            print(f"{endpoint:<34}{s['requests']:>10}{s['throughput_rps']:>9.1f}{s['p50_ms']:>10.1f}"
+                  f"{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['error_rate']:>9.2%}")
+
+
+def seed(network_size):
+    """Migrate and seed the benchmark database; run in the server's environment."""
+    import django
+
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connection
+
+    from .synthetic import seed_database
+
+    call_command('migrate', verbosity=0)
+    seed_database(connection, network_size)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def local_server(server, workers, network_size):
+    """Seed the benchmark database and serve it with a stub GeoServer; yields the base URL."""
+    stub, geoserver_url = start_stub_geoserver()
+    port = free_port()
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE='benchmarks.settings', GEOSERVER_URL=geoserver_url,
+               BENCHMARK_STATE_DIR=tempfile.mkdtemp(prefix='dashboard-loadtest-'))
+    print(f"Seeding a network of {network_size} rows", file=sys.stderr)
+    subprocess.run([sys.executable, '-c', f'from benchmarks.loadtest import seed; seed({network_size})'],
+                   cwd=ROOT, env=env, check=True)
+
+    if server == 'gunicorn':
+        command = [sys.executable, '-m', 'gunicorn', 'PyPSAEarthDashboard.wsgi',
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(workers)]
+    else:
+        command = [sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}']
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"{server} exited with status {process.returncode}")
+            try:
+                requests.get(f'{base_url}/metrics', timeout=5)
+                break
+            except requests.ConnectionError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError(f"{server} did not start within {SERVER_START_TIMEOUT} s")
+                time.sleep(0.5)
+        yield base_url
+    finally:
+        process.terminate()
+        process.wait(30)
+        stub.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay dashboard sessions against a server and "
+                                                 "report latency and errors per endpoint.")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="Base URL of a running server.")
+    target.add_argument('--serve', choices=['runserver', 'gunicorn'],
+                        help="Seed BENCHMARK_DATABASE_URL and start this server with a stub GeoServer.")
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes of --serve gunicorn.")
+    parser.add_argument('--network-size', type=int, default=10_000,
+                        help="Rows per synthetic network seeded for --serve.")
+    parser.add_argument('--stages', type=parse_stages, default=parse_stages('10:60,50:60,200:120'),
+                        help="Concurrent users and seconds per stage, e.g. 10:60,50:60,200:120.")
+    parser.add_argument('--think-time', type=float, default=2.0,
+                        help="Mean pause between a user's sessions, in seconds.")
+    parser.add_argument('--timeout', type=float, default=30.0,
+                        help="Seconds before a request counts as failed.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the users' random choices.")
+    parser.add_argument('--results-file', default=None,
+                        help="JSON results file, defaults to benchmarks/results/load-<commit>.json.")
+    args = parser.parse_args()
+
+    recorder = Recorder()
+    with (local_server(args.serve, args.workers, args.network_size) if args.serve
+          else nullcontext(args.url)) as base_url:
+        durations = run_load(base_url, args.stages, recorder, args.think_time, args.timeout, args.seed)
+
+    results = [recorder.summary(i, duration) for i, duration in enumerate(durations)]
+    print_report(args.stages, results)
+
+    commit = current_commit()
+    path = Path(args.results_file) if args.results_file else RESULTS_DIR / f'load-{commit}.json'
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'commit': commit,
+        'server': args.serve or args.url,
+        'workers': args.workers if args.serve == 'gunicorn' else None,
+        'network_size': args.network_size if args.serve else None,
+        'think_time': args.think_time,
+        'stages': [{'users': users, 'seconds': seconds, 'endpoints': summary}
+                   for (users, seconds), summary in zip(args.stages, results)],
+    }, indent=2))
+    print(f"\nResults written to {path}", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Django settings for the benchmark suite.
+
+The suite drops and reseeds the dashboard tables, so it only runs against the
+database in BENCHMARK_DATABASE_URL (a local PostGIS container), never against
+the DATABASE_URL of the .env file.
+"""
+
+import os
+import tempfile
+
+if 'BENCHMARK_DATABASE_URL' not in os.environ:
+    raise RuntimeError("Set BENCHMARK_DATABASE_URL to a disposable PostGIS database to run the benchmarks")
+
+os.environ['DATABASE_URL'] = os.environ['BENCHMARK_DATABASE_URL']
+os.environ.setdefault('SECRET_KEY', 'benchmarks')
+os.environ.setdefault('GEOSERVER_URL', 'http://127.0.0.1:8080/geoserver')
+os.environ.setdefault('GEOSERVER_USER', 'admin')
+os.environ.setdefault('GEOSERVER_PASS', 'geoserver')
+os.environ.setdefault('GEOSERVER_WORKSPACE', 'PyPSAEarthDashboard')
+for name in ('DATABASE_HOST', 'DATABASE_PORT', 'DATABASE_NAME', 'DATABASE_USER', 'DATABASE_PASS'):
+    os.environ.setdefault(name, '')
+
+from PyPSAEarthDashboard.settings import *  # noqa: E402,F401,F403
+
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost', 'testserver']
+
+# The load test shares BENCHMARK_STATE_DIR between the seeding process and the server.
+STATE_DIR = os.environ.get('BENCHMARK_STATE_DIR') or tempfile.mkdtemp(prefix='dashboard-benchmarks-')
+MEDIA_ROOT = os.path.join(STATE_DIR, 'media')
+TIMESERIES_DIR = os.path.join(STATE_DIR, 'timeseries')
+SNAPSHOT_DIR = os.path.join(STATE_DIR, 'snapshots')
+DATA_VERSION_FILE = os.path.join(STATE_DIR, 'data_version')
+if CACHES['default']['BACKEND'].endswith('FileBasedCache'):
+    CACHES['default']['LOCATION'] = os.path.join(STATE_DIR, 'cache')
+
+LOGGING['loggers']['geojson']['level'] = 'WARNING'
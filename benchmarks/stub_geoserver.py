@@ -0,0 +1,79 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Minimal stand-in for GeoServer, so load tests need neither GeoServer nor network access.
+
+WMS requests (map images and legends) get a small PNG, WFS/OWS requests an
+empty FeatureCollection, and REST calls succeed with an empty JSON body.
+Run it alone with ``python -m benchmarks.stub_geoserver --port 8080``.
+"""
+
+import argparse
+import base64
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# A transparent 1x1 PNG.
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg==')
+EMPTY_FEATURES = json.dumps({'type': 'FeatureCollection', 'features': []}).encode()
+
+
+class StubGeoServerHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {k.lower(): v[0] for k, v in parse_qs(url.query).items()}
+        service = query.get('service', '').lower()
+        if url.path.endswith('/wms') or service == 'wms' or 'legendgraphic' in query.get('request', '').lower():
+            self.reply(200, PNG, 'image/png')
+        elif url.path.endswith(('/wfs', '/ows')) or service == 'wfs':
+            self.reply(200, EMPTY_FEATURES, 'application/json')
+        else:
+            self.reply(200, b'{}', 'application/json')
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.reply(201, b'{}', 'application/json')
+
+    do_PUT = do_POST
+
+    def do_DELETE(self):
+        self.reply(200, b'{}', 'application/json')
+
+    def reply(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_geoserver(host='127.0.0.1', port=0):
+    """Serve the stub from a daemon thread; returns the server and its GEOSERVER_URL."""
+    server = ThreadingHTTPServer((host, port), StubGeoServerHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_port}/geoserver'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), StubGeoServerHandler)
+    print(f"Stub GeoServer at http://{args.host}:{server.server_port}/geoserver")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Synthetic PyPSA-Earth networks for the benchmark suite.
+
+Every frame is derived from the Django model it stands in for, so a new field
+on ``LinesBase`` or the capacity models is picked up without touching this
+module. The same ``seed`` and ``size`` always produce the same network.
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+from django.contrib.gis.db.models import GeometryField
+from django.db import models
+
+from geojson.models import (
+    CombinedGeneratorData, EconomicData,
+    LinesCo, LinesUS,
+    NominalGeneratorCapacityCo, NominalGeneratorCapacityUS,
+    NominalStorageCapacityCo, OptimalGeneratorCapacityCo, OptimalGeneratorCapacityUS,
+    OptimalStorageCapacityCo,
+)
+
+CARRIERS = ['solar', 'onwind', 'offwind-ac', 'offwind-dc', 'ror', 'CCGT', 'coal', 'nuclear', 'load']
+SCENARIO_CARRIERS = ['solar', 'onwind', 'offwind-ac', 'offwind-dc', 'ror']
+SCENARIOS = ['2021', '2050']
+EXTENTS = {
+    'colombia': (-79.0, -4.2, -66.9, 12.5),
+    'united states': (-124.7, 25.1, -66.9, 49.4),
+}
+COUNTRY_MODELS = {
+    'colombia': {
+        'lines': LinesCo,
+        'generators': [NominalGeneratorCapacityCo, OptimalGeneratorCapacityCo],
+        'storage': [NominalStorageCapacityCo, OptimalStorageCapacityCo],
+    },
+    'united states': {
+        'lines': LinesUS,
+        'generators': [NominalGeneratorCapacityUS, OptimalGeneratorCapacityUS],
+        'storage': [],
+    },
+}
+COPY_CHUNK_SIZE = 100_000
+SNAPSHOTS = pd.date_range('2013-01-01', periods=8760, freq='h')
+
+
+def geometry_column(model):
+    return next(f.column for f in model._meta.concrete_fields if isinstance(f, GeometryField))
+
+
+def frame_for_model(model, size, rng, values):
+    """Random column values for every field of ``model`` not given in ``values``."""
+    columns = {}
+    for field in model._meta.concrete_fields:
+        if field.column in values:
+            columns[field.column] = values[field.column]
+        elif isinstance(field, GeometryField):
+            raise ValueError(f"No geometry given for {model.__name__}.{field.name}")
+        elif isinstance(field, models.BooleanField):
+            columns[field.column] = rng.random(size) < 0.5
+        elif isinstance(field, models.IntegerField):
+            columns[field.column] = rng.integers(1990, 2050, size)
+        elif isinstance(field, models.FloatField):
+            columns[field.column] = rng.random(size) * 100
+        else:
+            columns[field.column] = [f'{field.column}_{i}' for i in range(size)]
+    return pd.DataFrame(columns)
+
+
+def points(x, y):
+    return [f'SRID=4326;POINT({a} {b})' for a, b in zip(x, y)]
+
+
+def network_frames(country, size, rng):
+    """Lines, generator and storage frames of a network with ``size`` lines and generators."""
+    minx, miny, maxx, maxy = EXTENTS[country]
+    n_buses = max(2, size // 2)
+    bus_names = np.array([f'bus_{i}' for i in range(n_buses)])
+    bus_x = rng.uniform(minx, maxx, n_buses)
+    bus_y = rng.uniform(miny, maxy, n_buses)
+    country_models = COUNTRY_MODELS[country]
+    frames = {}
+
+    bus0 = rng.integers(0, n_buses, size)
+    bus1 = (bus0 + rng.integers(1, n_buses, size)) % n_buses
+    lines = country_models['lines']
+    s_nom = rng.random(size) * 1000
+    frames[lines] = frame_for_model(lines, size, rng, {
+        'Line': [f'line_{i}' for i in range(size)],
+        'bus0': bus_names[bus0],
+        'bus1': bus_names[bus1],
+        'carrier': 'AC',
+        's_nom': s_nom,
+        's_nom_opt': s_nom * (1 + rng.random(size)),
+        'sub_network': '0',
+        geometry_column(lines): [
+            f'SRID=4326;LINESTRING({x0} {y0}, {x1} {y1})'
+            for x0, y0, x1, y1 in zip(bus_x[bus0], bus_y[bus0], bus_x[bus1], bus_y[bus1])
+        ],
+    })
+
+    bus = rng.integers(0, n_buses, size)
+    for generators in country_models['generators']:
+        frames[generators] = frame_for_model(generators, size, rng, {
+            'id': [f'gen_{i}' for i in range(size)],
+            'Bus': bus_names[bus],
+            'country': country,
+            'x': bus_x[bus],
+            'y': bus_y[bus],
+            'carrier': rng.choice(CARRIERS, size),
+            'sub_network': '0',
+            'geom': points(bus_x[bus], bus_y[bus]),
+        })
+
+    n_storage = max(1, min(size // 10, n_buses))
+    storage_bus = rng.choice(n_buses, n_storage, replace=False)
+    for storage in country_models['storage']:
+        frames[storage] = frame_for_model(storage, n_storage, rng, {
+            'Bus': bus_names[storage_bus],
+            'carrier': rng.choice(['battery', 'H2', 'PHS'], n_storage),
+            'geom': points(bus_x[storage_bus], bus_y[storage_bus]),
+        })
+    return frames
+
+
+class SyntheticSeries:
+    """Hourly generator dispatch in the shape ``store_network_series`` reads from a network."""
+
+    def __init__(self, size, rng):
+        self.names = np.array([f'gen_{i}' for i in range(size)])
+        self.rng = rng
+
+    def series(self, component, attribute):
+        if (component, attribute) != ('generators', 'p'):
+            return None
+        daily = np.sin(np.arange(len(SNAPSHOTS)) * 2 * np.pi / 24)[:, None]
+        values = np.clip(daily + self.rng.random((len(SNAPSHOTS), len(self.names))), 0, None)
+        return SNAPSHOTS, self.names, values.astype(np.float32)
+
+
+def scenario_frame(size, rng):
+    """A ``geojson_generators_combined_data_US_<scenario>`` table as published by the Bus upload."""
+    minx, miny, maxx, maxy = EXTENTS['united states']
+    x = rng.uniform(minx, maxx, size)
+    y = rng.uniform(miny, maxy, size)
+    frame = frame_for_model(CombinedGeneratorData, size, rng, {
+        'name': [f'gen_{i}' for i in range(size)],
+        'x': x,
+        'y': y,
+        'country': 'US',
+        'carrier': rng.choice(SCENARIO_CARRIERS, size),
+        'cf': rng.random(size),
+        'crt': rng.random(size),
+        'usdpt': rng.random(size),
+        'geom': points(x, y),
+    })
+    return frame.drop(columns=['id'])
+
+
+def economic_frame(scenario, rng):
+    frame = frame_for_model(EconomicData, len(CARRIERS), rng, {
+        'index': CARRIERS,
+        'scenario': scenario,
+    })
+    return frame
+
+
+def sql_type(series):
+    if series.name == 'geom' or series.name == 'line_geom':
+        return 'geometry(Geometry, 4326)'
+    if pd.api.types.is_bool_dtype(series):
+        return 'boolean'
+    if pd.api.types.is_integer_dtype(series):
+        return 'bigint'
+    if pd.api.types.is_float_dtype(series):
+        return 'double precision'
+    return 'text'
+
+
+def replace_table(cursor, table, frame):
+    """Drop ``table`` (or a view of that name), recreate it for ``frame`` and COPY the rows in."""
+    cursor.execute(f'DROP VIEW IF EXISTS "{table}" CASCADE')
+    cursor.execute(f'DROP TABLE IF EXISTS "{table}" CASCADE')
+    columns = ', '.join(f'"{name}" {sql_type(frame[name])}' for name in frame.columns)
+    cursor.execute(f'CREATE TABLE "{table}" ({columns})')
+
+    column_list = ', '.join(f'"{name}"' for name in frame.columns)
+    for start in range(0, len(frame), COPY_CHUNK_SIZE):
+        buffer = io.StringIO()
+        frame.iloc[start:start + COPY_CHUNK_SIZE].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        cursor.copy_expert(f'COPY "{table}" ({column_list}) FROM STDIN WITH (FORMAT csv)', buffer)
+
+    for name in frame.columns:
+        if name in ('geom', 'line_geom'):
+            cursor.execute(f'CREATE INDEX ON "{table}" USING GIST ("{name}")')
+    cursor.execute(f'ANALYZE "{table}"')
+
+
+def seed_database(connection, size, seed=0):
+    """Replace every table the API reads with a synthetic network of ``size`` rows."""
+    from geojson.line_metrics import refresh_country
+    from geojson.models import store_choropleth_statistics
+    from geojson.timeseries import store_network_series
+    from geojson.views import scenario_feature_table
+
+    rng = np.random.default_rng(seed)
+    with connection.cursor() as cursor:
+        for country in COUNTRY_MODELS:
+            for model, frame in network_frames(country, size, rng).items():
+                replace_table(cursor, model._meta.db_table, frame)
+        for country in COUNTRY_MODELS:
+            refresh_country(country)
+        # Dispatch of the first generators only; the store itself is sized by snapshots, not rows.
+        store_network_series(SyntheticSeries(min(size, 100), rng), 'united states', SCENARIOS[0])
+
+        for scenario in SCENARIOS:
+            table_name = scenario_feature_table('united states', scenario)
+            frame = scenario_frame(size, rng)
+            replace_table(cursor, table_name, frame)
+            store_choropleth_statistics(table_name, frame)
+            replace_table(cursor, f'json_statistics_{scenario}_US', economic_frame(scenario, rng))
@@ -3,13 +3,65 @@
 # SPDX-License-Identifier: AGPL-3.0-or-later
 #
 
-from django.contrib import admin
-from .models import Bus, JSONBus
+from django.contrib import admin, messages
+
+from .models import Bus, JSONBus, Region, SlowQuery, ingest_bus, ingest_json_bus
+
+
+def reingest(modeladmin, request, queryset, ingest):
+    ingested = sum(ingest(instance, force=True) for instance in queryset.order_by('uploaded_time', 'pk'))
+    failed = queryset.count() - ingested
+    modeladmin.message_user(request, f"Re-ingested {ingested} upload(s)")
+    if failed:
+        modeladmin.message_user(request, f"{failed} upload(s) could not be ingested, see the logs",
+                                level=messages.WARNING)
 
 # Register your models here.
-admin.site.register(Bus)
+@admin.register(Bus)
+class BusAdmin(admin.ModelAdmin):
+    list_display = ['name', 'uploaded_time', 'loaded_time', 'short_hash']
+    search_fields = ['name']
+    actions = ['force_reingest']
+
+    @admin.display(description='Content hash')
+    def short_hash(self, obj):
+        return obj.content_hash[:12]
+
+    @admin.action(description='Re-ingest and re-publish, even if unchanged')
+    def force_reingest(self, request, queryset):
+        reingest(self, request, queryset, ingest_bus)
 
 @admin.register(JSONBus)
 class JSONBusAdmin(admin.ModelAdmin):
-    list_display = ['name', 'uploaded_time']
+    list_display = ['name', 'uploaded_time', 'loaded_time', 'short_hash']
     search_fields = ['name']
+    actions = ['force_reingest']
+
+    @admin.display(description='Content hash')
+    def short_hash(self, obj):
+        return obj.content_hash[:12]
+
+    @admin.action(description='Re-ingest, even if unchanged')
+    def force_reingest(self, request, queryset):
+        reingest(self, request, queryset, ingest_json_bus)
+
+@admin.register(Region)
+class RegionAdmin(admin.ModelAdmin):
+    list_display = ['name', 'code', 'country']
+    list_filter = ['country']
+    search_fields = ['name', 'code']
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ['recorded_time', 'duration_ms', 'path', 'short_sql']
+    list_filter = ['path']
+    search_fields = ['sql', 'path']
+    readonly_fields = ['sql', 'params', 'duration_ms', 'plan', 'path', 'recorded_time']
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    def has_add_permission(self, request):
+        return False
+
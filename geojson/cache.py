@@ -0,0 +1,182 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import gzip
+import hashlib
+import os
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .metrics import RESPONSE_CACHE
+from .profiling import timed
+from .singleflight import advisory_lock, single_flight
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+# (st_ino, st_mtime_ns) of the version file and the version read from it.
+_version = (None, None)
+
+
+def data_version_file():
+    return getattr(settings, 'DATA_VERSION_FILE', os.path.join(settings.BASE_DIR, 'data_version'))
+
+
+def _write_version(path, version):
+    # Replaced in one rename, so every process reads either the old or the new version.
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    staging = f'{path}.{uuid.uuid4().hex}'
+    with open(staging, 'w') as file:
+        file.write(str(version))
+    os.replace(staging, path)
+
+
+def get_data_version():
+    """
+    Version of the uploaded data, changed by every ingest or delete.
+
+    It is kept in DATA_VERSION_FILE rather than the cache, so a bump by any
+    worker or management command reaches all processes. The file is only
+    re-read when it has been replaced.
+    """
+    global _version
+    path = data_version_file()
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        _write_version(path, time.time_ns())
+        stat = os.stat(path)
+
+    identity = (stat.st_ino, stat.st_mtime_ns)
+    if _version[0] != identity:
+        with open(path) as file:
+            _version = (identity, int(file.read().strip()))
+    return _version[1]
+
+
+def bump_data_version():
+    from .export import prune_exports
+    from .snapshots import refresh_snapshot
+
+    version = time.time_ns()
+    _write_version(data_version_file(), version)
+    logger.info(f"Data version bumped to {version}")
+    refresh_snapshot(version)
+    prune_exports(version)
+    return version
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts, from ``Accept-Encoding`` (q=0 excluded)."""
+    encodings = set()
+    for part in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = part.strip().partition(';')
+        params = params.replace(' ', '')
+        if coding and params not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            encodings.add(coding.lower())
+    return encodings
+
+
+def negotiate_encoding(request):
+    """Pick brotli, then gzip, then the uncompressed body."""
+    encodings = accepted_encodings(request)
+    if brotli is not None and ('br' in encodings or '*' in encodings):
+        return 'br'
+    if 'gzip' in encodings or '*' in encodings:
+        return 'gzip'
+    return 'identity'
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+    return body
+
+
+def encoded_response(request, content, content_type, status=200):
+    """Build a response from cached ``{encoding: body}`` variants."""
+    encoding = negotiate_encoding(request)
+    if encoding not in content:
+        encoding = 'identity'
+    response = HttpResponse(content[encoding], content_type=content_type, status=status)
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(len(content[encoding]))
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def response_cache_key(request, version):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'geojson:response:{version}:{path}'
+
+
+def cached_api_response(view):
+    """
+    Cache successful GET responses of ``view`` per data version.
+
+    The body is stored once uncompressed and once per supported content
+    coding, so compression runs only when the data changes and each request
+    gets the variant matching its ``Accept-Encoding``. Concurrent misses of
+    the same response are coalesced into one call of ``view``.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view(request, *args, **kwargs)
+
+        with timed(request, 'cache'):
+            key = response_cache_key(request, get_data_version())
+            cached = cache.get(key)
+        if cached is not None:
+            RESPONSE_CACHE.labels('hit').inc()
+            return encoded_response(request, cached['content'], cached['content_type'])
+        RESPONSE_CACHE.labels('miss').inc()
+
+        def render():
+            with advisory_lock(key):
+                # Another process may have filled a shared cache while this one waited.
+                cached = cache.get(key)
+                if cached is not None:
+                    return cached
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200 or response.streaming:
+                    return response
+
+                body = response.content
+                with timed(request, 'compress'):
+                    content = {'identity': body, 'gzip': compress(body, 'gzip')}
+                    if brotli is not None:
+                        content['br'] = compress(body, 'br')
+                cached = {'content': content, 'content_type': response['Content-Type']}
+                with timed(request, 'cache'):
+                    cache.set(key, cached, timeout=RESPONSE_CACHE_TIMEOUT)
+                return cached
+
+        # Concurrent misses of the same key wait for one rendering; only cached bodies are shared.
+        result = single_flight(key, render, share=lambda result: isinstance(result, dict))
+        if not isinstance(result, dict):
+            return result
+        return encoded_response(request, result['content'], result['content_type'])
+
+    return wrapper
@@ -0,0 +1,91 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import numpy as np
+import pandas as pd
+
+CHOROPLETH_VARIABLES = ('cf', 'crt', 'usdpt')
+CHOROPLETH_CLASSES = 5
+HISTOGRAM_BINS = 20
+# Jenks is quadratic in the number of values, so it runs on an evenly spaced
+# sample of the sorted values instead of on every generator.
+JENKS_SAMPLE_SIZE = 1000
+
+
+def quantile_breaks(values, classes=CHOROPLETH_CLASSES):
+    return np.quantile(values, np.linspace(0, 1, classes + 1)).tolist()
+
+
+def jenks_breaks(values, classes=CHOROPLETH_CLASSES):
+    """Jenks natural breaks (Fisher's dynamic programming formulation)."""
+    values = np.sort(np.asarray(values, dtype=float))
+    if len(values) > JENKS_SAMPLE_SIZE:
+        values = np.quantile(values, np.linspace(0, 1, JENKS_SAMPLE_SIZE))
+    n = len(values)
+    classes = min(classes, len(np.unique(values)))
+    if classes < 2:
+        return [float(values[0]), float(values[-1])]
+
+    # Sum of squared deviations of values[i:j + 1] from their mean, from prefix sums.
+    cumsum = np.concatenate(([0.0], np.cumsum(values)))
+    cumsq = np.concatenate(([0.0], np.cumsum(values ** 2)))
+
+    def ssd(i, j):
+        count = j - i + 1
+        total = cumsum[j + 1] - cumsum[i]
+        return cumsq[j + 1] - cumsq[i] - total * total / count
+
+    cost = np.full((classes, n), np.inf)
+    lower = np.zeros((classes, n), dtype=int)
+    starts = np.arange(n)
+    cost[0] = ssd(np.zeros(n, dtype=int), starts)
+    for k in range(1, classes):
+        for j in range(k, n):
+            i = starts[k:j + 1]
+            candidates = cost[k - 1, i - 1] + ssd(i, j)
+            best = int(np.argmin(candidates))
+            cost[k, j] = candidates[best]
+            lower[k, j] = i[best]
+
+    breaks = [float(values[-1])]
+    j = n - 1
+    for k in range(classes - 1, 0, -1):
+        j = lower[k, j] - 1
+        breaks.append(float(values[j]))
+    breaks.append(float(values[0]))
+    return breaks[::-1]
+
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    counts, edges = np.histogram(values, bins=bins)
+    return {'counts': counts.tolist(), 'edges': edges.tolist()}
+
+
+def choropleth_statistics(df, variables=CHOROPLETH_VARIABLES):
+    """
+    Yield the legend statistics of every (carrier, variable) pair in ``df``.
+
+    Non-numeric and non-finite values are ignored, matching what the scenario
+    maps treat as missing data.
+    """
+    if 'carrier' not in df:
+        return
+    for variable in variables:
+        if variable not in df:
+            continue
+        column = pd.to_numeric(df[variable], errors='coerce')
+        finite = np.isfinite(column)
+        for carrier, values in column[finite].groupby(df['carrier'][finite]):
+            values = values.to_numpy(dtype=float)
+            yield {
+                'carrier': carrier,
+                'variable': variable,
+                'count': len(values),
+                'min_value': float(values.min()),
+                'max_value': float(values.max()),
+                'quantile_breaks': quantile_breaks(values),
+                'jenks_breaks': jenks_breaks(values),
+                'histogram': histogram(values),
+            }
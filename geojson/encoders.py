@@ -0,0 +1,226 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import json
+from decimal import Decimal
+
+import numpy as np
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Significant digits kept for the fields in SIGNIFICANT_FIELDS; other floats,
+# such as costs and prices, keep their full precision.
+DEFAULT_PRECISION = 6
+SIGNIFICANT_FIELDS = (
+    'p_nom', 'p_nom_opt', 'p_nom_min', 'p_nom_max', 's_nom', 's_nom_opt', 's_nom_min', 's_nom_max',
+    'capacity', 'installed_capacity', 'optimal_capacity',
+)
+# Decimal places kept for coordinates, roughly 0.1 m in EPSG:4326.
+DEFAULT_COORD_PRECISION = 6
+GEOMETRY_FIELDS = ('geom', 'line_geom', 'geometry', 'coordinates')
+
+
+def _orjson_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError
+
+
+def encode_orjson(data):
+    return orjson.dumps(data, default=_orjson_default,
+                        option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+
+
+def encode_json(data):
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+ENCODERS = {
+    'orjson': encode_orjson,
+    'json': encode_json,
+}
+
+
+def get_encoder():
+    """Encoder named by ``settings.API_JSON_ENCODER``, orjson when installed."""
+    name = getattr(settings, 'API_JSON_ENCODER', None)
+    if name is None:
+        name = 'orjson' if orjson is not None else 'json'
+    return ENCODERS[name]
+
+
+def _round_coords(value, digits):
+    if isinstance(value, float):
+        return round(value, digits)
+    if isinstance(value, (list, tuple)):
+        return [_round_coords(v, digits) for v in value]
+    if isinstance(value, dict):
+        return {k: _round_coords(v, digits) for k, v in value.items()}
+    return value
+
+
+def _round_significant(value, digits):
+    return float(format(value, f'.{digits}g'))
+
+
+def round_significant(values, digits):
+    """``values`` rounded to ``digits`` significant digits, element-wise."""
+    values = np.asarray(values, dtype=float)
+    exponent = np.zeros_like(values)
+    scaled = np.isfinite(values) & (values != 0)
+    exponent[scaled] = np.floor(np.log10(np.abs(values[scaled])))
+    # Multiplying or dividing by an exact power of ten keeps the shortest repr of the result short.
+    shift = np.clip(digits - 1 - exponent, -300, 300)
+    up = shift >= 0
+    rounded = np.empty_like(values)
+    rounded[up] = np.round(values[up] * 10.0 ** shift[up]) / 10.0 ** shift[up]
+    rounded[~up] = np.round(values[~up] / 10.0 ** -shift[~up]) * 10.0 ** -shift[~up]
+    return rounded
+
+
+def _round_geometry(value, digits):
+    try:
+        return np.round(np.asarray(value, dtype=float), digits).tolist()
+    except (TypeError, ValueError):
+        # Ragged coordinates, as in multi-part geometries.
+        return _round_coords(value, digits)
+
+
+def _round_parts(column, digits):
+    """Round a column of coordinate sequences of different lengths, such as lines, as one array."""
+    lengths = [len(value) for value in column]
+    points = np.round(np.asarray([point for value in column for point in value], dtype=float), digits)
+    points = points.tolist()
+    bounds = np.cumsum([0] + lengths).tolist()
+    return [points[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+def _round_geometry_column(records, key, digits):
+    column = [record[key] for record in records]
+    try:
+        if None in column:
+            raise TypeError
+        try:
+            # Points, or lines of one length, round as a single array.
+            rounded = np.round(np.asarray(column, dtype=float), digits).tolist()
+        except ValueError:
+            rounded = _round_parts(column, digits)
+    except (TypeError, ValueError):
+        rounded = [None if value is None else _round_geometry(value, digits) for value in column]
+    for record, value in zip(records, rounded):
+        record[key] = value
+
+
+def _round_value_column(records, key, precision, coord_precision, field_precision, significant_fields):
+    column = [record[key] for record in records]
+    types = set(map(type, column))
+    significant = key in significant_fields and precision is not None
+    if significant and types == {float}:
+        for record, value in zip(records, round_significant(column, precision).tolist()):
+            record[key] = value
+        return
+
+    if types & {dict, list}:
+        for record in records:
+            if isinstance(record[key], (dict, list)):
+                record[key] = round_numbers(record[key], precision, coord_precision, field_precision,
+                                            significant_fields)
+    if significant and float in types:
+        # Mixed with None or other types: round only the floats.
+        floats = [record for record in records if isinstance(record[key], float)]
+        rounded = round_significant([record[key] for record in floats], precision)
+        for record, value in zip(floats, rounded.tolist()):
+            record[key] = value
+
+
+def round_records(records, precision=DEFAULT_PRECISION, coord_precision=DEFAULT_COORD_PRECISION,
+                  field_precision=None, significant_fields=SIGNIFICANT_FIELDS):
+    """
+    Round ``records``, dicts sharing their keys such as ``values()`` rows, one column at a time.
+
+    Follows the rules of ``round_numbers``, but each column is rounded as one
+    NumPy array rather than value by value. The records are updated in place.
+    """
+    field_precision = field_precision or {}
+    for key in records[0] if records else ():
+        if key in field_precision:
+            _round_geometry_column(records, key, field_precision[key])
+        elif key in GEOMETRY_FIELDS:
+            if coord_precision is not None:
+                _round_geometry_column(records, key, coord_precision)
+        else:
+            _round_value_column(records, key, precision, coord_precision, field_precision,
+                                significant_fields)
+    return records
+
+
+def is_records(data):
+    """Whether ``data`` is a non-empty list of dicts that all have the same keys."""
+    if not isinstance(data, list) or not data or not isinstance(data[0], dict):
+        return False
+    keys = data[0].keys()
+    return all(isinstance(item, dict) and item.keys() == keys for item in data)
+
+
+def round_numbers(data, precision=DEFAULT_PRECISION, coord_precision=DEFAULT_COORD_PRECISION,
+                  field_precision=None, significant_fields=SIGNIFICANT_FIELDS):
+    """
+    Round the floats of ``data`` before it is encoded.
+
+    Geometry fields are rounded to ``coord_precision`` decimal places, the
+    fields named in ``significant_fields`` to ``precision`` significant
+    digits, and ``field_precision`` maps field names to the decimal places to
+    use instead. Any other float is left as it is, as is everything a
+    precision of None applies to.
+    """
+    field_precision = field_precision or {}
+
+    def round_value(key, value):
+        if key in field_precision:
+            return _round_coords(value, field_precision[key])
+        if key in GEOMETRY_FIELDS:
+            return value if coord_precision is None else _round_coords(value, coord_precision)
+        if isinstance(value, float):
+            if key in significant_fields and precision is not None:
+                return _round_significant(value, precision)
+            return value
+        if isinstance(value, (dict, list)):
+            return round_numbers(value, precision, coord_precision, field_precision, significant_fields)
+        return value
+
+    if isinstance(data, dict):
+        return {key: round_value(key, value) for key, value in data.items()}
+    if isinstance(data, list):
+        return [round_numbers(item, precision, coord_precision, field_precision, significant_fields)
+                if isinstance(item, (dict, list)) else item
+                for item in data]
+    return data
+
+
+class ApiJsonResponse(HttpResponse):
+    """
+    JSON response encoded with the configured fast encoder.
+
+    Unlike ``JsonResponse`` any JSON value is accepted, and coordinates and
+    capacities are rounded according to ``precision``, ``coord_precision``,
+    ``field_precision`` and ``significant_fields`` (see ``round_numbers``) so
+    payloads stay small. Lists of rows are rounded column-wise by
+    ``round_records``.
+    """
+
+    def __init__(self, data, precision=DEFAULT_PRECISION, coord_precision=DEFAULT_COORD_PRECISION,
+                 field_precision=None, significant_fields=SIGNIFICANT_FIELDS, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        if is_records(data):
+            data = round_records(data, precision, coord_precision, field_precision, significant_fields)
+        else:
+            data = round_numbers(data, precision, coord_precision, field_precision, significant_fields)
+        super().__init__(content=get_encoder()(data), **kwargs)
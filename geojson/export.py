@@ -0,0 +1,325 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Bulk export of the layer tables as GeoPackage, GeoParquet or zipped CSV.
+
+Rows are read through a server-side cursor ``EXPORT_CHUNK_ROWS`` at a time
+and written out batch by batch, so memory stays flat whatever the table
+size. Each generated file is kept under ``EXPORT_CACHE_DIR`` for the
+current data version and served from disk on later requests.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import shutil
+import uuid
+import zipfile
+
+import fiona
+from django.conf import settings
+from django.db import connections
+from shapely import wkb
+from shapely.geometry import mapping
+
+from .cache import get_data_version
+from .routers import read_alias
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+PARQUET_AVAILABLE = pa is not None
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = 5000
+# Versions of cached exports kept besides the current one.
+KEEP_PREVIOUS_VERSIONS = 1
+
+# Tables behind the downloadable layers of the sidebar, keyed like ``layerMappings`` in downloads.js.
+EXPORT_DATASETS = {
+    'africa_shape': {
+        'nigeria': 'africa_shape',
+        'colombia': 'geojson_africa_shape_CO',
+        'united states': 'geojson_africa_shape_US',
+    },
+    'offshore_shapes': {
+        'nigeria': 'offshore_shapes',
+        'colombia': 'geojson_offshore_shapes_CO',
+        'united states': 'geojson_offshore_shapes_US',
+    },
+    'gadm_shapes': {
+        'nigeria': 'gadm_shapes',
+        'colombia': 'geojson_gadm_shapes_CO',
+        'united states': 'geojson_gadm_shapes_US',
+    },
+    'countries': {
+        'nigeria': 'country_shapes',
+        'colombia': 'geojson_country_shapes_CO',
+        'united states': 'geojson_country_shapes_US',
+    },
+    'all_clean_lines': {
+        'nigeria': 'all_clean_lines',
+        'colombia': 'geojson_all_clean_lines_CO',
+        'united states': 'geojson_all_clean_lines_US',
+    },
+    'lines': {
+        'nigeria': 'network_lines_view',
+        'colombia': 'geojson_network_lines_view_co_2',
+        'united states': 'geojson_network_lines_view_US',
+    },
+    'generators': {
+        'nigeria': 'All_clean_generators',
+        'colombia': 'geojson_all_clean_generators_CO',
+        'united states': 'geojson_all_clean_generators_US',
+    },
+    'substations': {
+        'nigeria': 'all_clean_substations',
+        'colombia': 'geojson_all_clean_substations_CO',
+        'united states': 'geojson_all_clean_substations_US',
+    },
+    'buses': {
+        'nigeria': 'Buses_geojson_data',
+        'colombia': 'geojson_Buses_geojson_data_CO_2',
+        'united states': 'geojson_Buses_geojson_data_US',
+    },
+}
+
+# Content type of each format; parquet needs pyarrow.
+EXPORT_FORMATS = {
+    'gpkg': 'application/geopackage+sqlite3',
+    'parquet': 'application/vnd.apache.parquet',
+    'csv.zip': 'application/zip',
+}
+
+FIONA_TYPES = {
+    'int2': 'int', 'int4': 'int', 'int8': 'int', 'bool': 'int',
+    'float4': 'float', 'float8': 'float', 'numeric': 'float',
+    'date': 'date', 'timestamp': 'datetime', 'timestamptz': 'datetime',
+}
+
+
+def _arrow_type(udt_name):
+    return {
+        'int2': pa.int16(), 'int4': pa.int32(), 'int8': pa.int64(), 'bool': pa.bool_(),
+        'float4': pa.float32(), 'float8': pa.float64(), 'numeric': pa.float64(),
+        'date': pa.date32(), 'timestamp': pa.timestamp('us'), 'timestamptz': pa.timestamp('us', tz='UTC'),
+    }.get(udt_name, pa.string())
+
+
+class ExportError(Exception):
+    pass
+
+
+class ChunkSink:
+    """Write-only file object whose content is taken out with ``pop`` after each batch."""
+
+    closed = False
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._position = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        return len(data)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+    def pop(self):
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+
+class Export:
+    """The rows of one dataset table, optionally limited to ``fields`` and a ``bbox``."""
+
+    def __init__(self, table, fields=None, bbox=None):
+        # The rows are read from the database the columns were looked up in.
+        self.alias = read_alias()
+        with connections[self.alias].cursor() as cursor:
+            cursor.execute("""
+                SELECT column_name, udt_name
+                FROM information_schema.columns
+                WHERE table_schema = 'public' AND table_name = %s
+                ORDER BY ordinal_position
+            """, [table])
+            columns = cursor.fetchall()
+        if not columns:
+            raise ExportError(f"Table '{table}' does not exist")
+
+        self.table = table
+        self.geometry = next((name for name, udt in columns if udt == 'geometry'), None)
+        types = {name: udt for name, udt in columns if name != self.geometry}
+        if fields:
+            unknown = [f for f in fields if f not in types]
+            if unknown:
+                raise ExportError(f"Unknown fields: {', '.join(unknown)}")
+            types = {f: types[f] for f in fields}
+        self.types = types
+        self.bbox = bbox if self.geometry else None
+
+    @property
+    def fields(self):
+        return list(self.types)
+
+    def batches(self, geometry_format='wkb'):
+        """Lists of row tuples, the geometry last as WKB (or WKT)."""
+        selected = [f'"{f}"' for f in self.fields]
+        if self.geometry:
+            function = 'ST_AsBinary' if geometry_format == 'wkb' else 'ST_AsText'
+            selected.append(f'{function}("{self.geometry}")')
+        where, params = '', []
+        if self.bbox:
+            where = f'WHERE "{self.geometry}" && ST_MakeEnvelope(%s, %s, %s, %s, 4326)'
+            params = list(self.bbox)
+
+        with connections[self.alias].chunked_cursor() as cursor:
+            cursor.execute(f'SELECT {", ".join(selected)} FROM "{self.table}" {where}', params)
+            while True:
+                rows = cursor.fetchmany(EXPORT_CHUNK_ROWS)
+                if not rows:
+                    break
+                yield rows
+
+
+def write_csv_zip(export, name):
+    """Chunks of a zip archive holding ``<name>.csv``, with the geometry as WKT."""
+    sink = ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        with archive.open(f'{name}.csv', 'w', force_zip64=True) as member:
+            text = io.TextIOWrapper(member, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(export.fields + (['geometry'] if export.geometry else []))
+            for rows in export.batches(geometry_format='wkt'):
+                writer.writerows(rows)
+                text.flush()
+                yield sink.pop()
+            text.flush()
+            text.detach()
+    yield sink.pop()
+
+
+def write_parquet(export):
+    """Chunks of a GeoParquet file with one row group per batch and WKB geometries."""
+    fields = [pa.field(name, _arrow_type(udt)) for name, udt in export.types.items()]
+    metadata = None
+    if export.geometry:
+        fields.append(pa.field('geometry', pa.binary()))
+        metadata = {b'geo': json.dumps({
+            'version': '1.0.0',
+            'primary_column': 'geometry',
+            'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': []}},
+        }).encode()}
+    schema = pa.schema(fields, metadata=metadata)
+    as_string = [i for i, field in enumerate(fields) if field.type == pa.string()]
+
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in export.batches():
+            columns = [list(column) for column in zip(*rows)]
+            for i in as_string:
+                columns[i] = [None if v is None else str(v) for v in columns[i]]
+            if export.geometry:
+                columns[-1] = [None if v is None else bytes(v) for v in columns[-1]]
+            writer.write_table(pa.Table.from_arrays(columns, schema=schema))
+            yield sink.pop()
+    yield sink.pop()
+
+
+def write_gpkg(export, path, name):
+    """Write a GeoPackage to ``path``; SQLite needs a seekable file, so it is not streamed."""
+    schema = {
+        'geometry': 'Unknown' if export.geometry else 'None',
+        'properties': {f: FIONA_TYPES.get(udt, 'str') for f, udt in export.types.items()},
+    }
+    as_string = {f for f, kind in schema['properties'].items() if kind in ('str', 'date', 'datetime')}
+    with fiona.open(path, 'w', driver='GPKG', layer=name, schema=schema, crs='EPSG:4326') as layer:
+        for rows in export.batches():
+            records = []
+            for row in rows:
+                properties = dict(zip(export.fields, row))
+                for f in as_string:
+                    value = properties[f]
+                    if value is not None and not isinstance(value, str):
+                        properties[f] = value.isoformat() if hasattr(value, 'isoformat') else str(value)
+                geometry = row[-1] if export.geometry else None
+                records.append({
+                    'geometry': mapping(wkb.loads(bytes(geometry))) if geometry is not None else None,
+                    'properties': properties,
+                })
+            layer.writerecords(records)
+
+
+def export_cache_dir():
+    return getattr(settings, 'EXPORT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'exports'))
+
+
+def artifact_path(dataset, country, fmt, fields, bbox):
+    """Cache path of an export for the current data version."""
+    directory = os.path.join(export_cache_dir(), str(get_data_version()))
+    os.makedirs(directory, exist_ok=True)
+
+    options = json.dumps({'fields': fields, 'bbox': bbox}, sort_keys=True)
+    digest = hashlib.md5(options.encode()).hexdigest()[:12]
+    return os.path.join(directory, f"{dataset}_{country.replace(' ', '_')}_{digest}.{fmt}")
+
+
+def prune_exports(version):
+    """
+    Remove the exports of versions before the one preceding ``version``.
+
+    Run on data changes rather than on requests. Exports of the previous
+    version are kept, because other workers may still be streaming them.
+    """
+    root = export_cache_dir()
+    if not os.path.isdir(root):
+        return
+    versions = sorted((int(e) for e in os.listdir(root) if e.isdigit() and int(e) < version), reverse=True)
+    for stale in versions[KEEP_PREVIOUS_VERSIONS:]:
+        shutil.rmtree(os.path.join(root, str(stale)), ignore_errors=True)
+
+
+def temporary_path(path):
+    return f'{path}.{uuid.uuid4().hex}.tmp'
+
+
+def stream_and_store(chunks, path):
+    """Yield ``chunks`` while writing them to ``path``, which only appears once complete."""
+    partial = temporary_path(path)
+    try:
+        with open(partial, 'wb') as file:
+            for chunk in chunks:
+                if chunk:
+                    file.write(chunk)
+                    yield chunk
+        try:
+            os.replace(partial, path)
+            logger.info(f"Stored export '{path}'")
+        except OSError as e:
+            # The version was pruned meanwhile; the client still got the full file.
+            logger.warning(f"Could not store export '{path}': {e}")
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Bus/line topology of a country's network as a CSR adjacency matrix.
+
+The graph is built from the ``Lines*`` tables once per data version and kept
+in process memory, so neighbourhood, component and shortest path queries
+never touch the database.
+"""
+
+import threading
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra
+
+from .cache import get_data_version
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS = ('x', 'length')
+# Lossless or compensated lines still need a positive weight to count as edges.
+MIN_WEIGHT = 1e-9
+
+_graphs = {}
+_lock = threading.Lock()
+
+
+class NetworkGraph:
+    """
+    Undirected bus graph; parallel lines collapse into the edge of least weight.
+
+    ``edges`` holds the position in ``lines`` of the line behind every stored
+    entry of the CSR matrix, so paths can be reported as line names.
+    """
+
+    def __init__(self, lines, bus0, bus1, weights):
+        self.lines = np.asarray(lines, dtype=object)
+        self.buses, inverse = np.unique(np.concatenate([bus0, bus1]).astype(str), return_inverse=True)
+        self.bus_index = {bus: i for i, bus in enumerate(self.buses)}
+        source, target = np.split(inverse, 2)
+
+        # Both directions of every line, then one entry per bus pair.
+        rows = np.concatenate([source, target])
+        cols = np.concatenate([target, source])
+        edge_ids = np.tile(np.arange(len(self.lines)), 2)
+        self.edges = {}
+        self.adjacency = {}
+        for name, values in weights.items():
+            values = np.maximum(np.abs(np.nan_to_num(np.asarray(values, dtype=float), nan=np.inf)),
+                                MIN_WEIGHT)
+            order = np.lexsort((values[edge_ids], cols, rows))
+            keep = np.ones(len(order), dtype=bool)
+            keep[1:] = (rows[order][1:] != rows[order][:-1]) | (cols[order][1:] != cols[order][:-1])
+            order = order[keep]
+            matrix = csr_matrix((values[edge_ids[order]], (rows[order], cols[order])),
+                                shape=(len(self.buses), len(self.buses)))
+            ids = csr_matrix((edge_ids[order] + 1, (rows[order], cols[order])),
+                             shape=(len(self.buses), len(self.buses)))
+            self.adjacency[name] = matrix
+            self.edges[name] = ids
+
+        self.component_count, self.component_labels = connected_components(
+            self.adjacency[WEIGHTS[0]], directed=False)
+
+    @classmethod
+    def from_model(cls, model):
+        rows = list(model.objects.values_list('Line', 'bus0', 'bus1', 'x', 'length'))
+        lines, bus0, bus1, x, length = zip(*rows) if rows else ((),) * 5
+        return cls(lines, np.asarray(bus0, dtype=object), np.asarray(bus1, dtype=object),
+                   {'x': np.asarray(x, dtype=float), 'length': np.asarray(length, dtype=float)})
+
+    def __contains__(self, bus):
+        return bus in self.bus_index
+
+    def neighbors(self, bus, hops=1):
+        """Buses within ``hops`` lines of ``bus``, mapped to their hop distance."""
+        adjacency = self.adjacency[WEIGHTS[0]]
+        distance = np.full(len(self.buses), -1)
+        start = self.bus_index[bus]
+        distance[start] = 0
+        frontier = np.array([start])
+        for hop in range(1, hops + 1):
+            reached = np.unique(adjacency[frontier].indices)
+            frontier = reached[distance[reached] < 0]
+            if not len(frontier):
+                break
+            distance[frontier] = hop
+        found = np.flatnonzero(distance > 0)
+        return {str(self.buses[i]): int(distance[i]) for i in found[np.argsort(distance[found], kind='stable')]}
+
+    def components(self):
+        """Connected components as lists of buses, largest first."""
+        order = np.argsort(self.component_labels, kind='stable')
+        labels = self.component_labels[order]
+        splits = np.flatnonzero(np.diff(labels)) + 1
+        groups = [self.buses[group].tolist() for group in np.split(order, splits)] if len(order) else []
+        return sorted(groups, key=len, reverse=True)
+
+    def component_of(self, bus):
+        label = self.component_labels[self.bus_index[bus]]
+        return self.buses[self.component_labels == label].tolist()
+
+    def shortest_path(self, source, target, weight='x'):
+        """
+        ``(buses, lines, total weight)`` of the cheapest path, or None if unconnected.
+
+        Lines without a value of ``weight`` keep the buses in one component
+        but cannot be crossed, so they may still leave ``target`` unreachable.
+        """
+        start, end = self.bus_index[source], self.bus_index[target]
+        if self.component_labels[start] != self.component_labels[end]:
+            return None
+        distances, predecessors = dijkstra(self.adjacency[weight], directed=False, indices=start,
+                                           return_predecessors=True)
+        if np.isinf(distances[end]):
+            return None
+        path = [end]
+        while path[-1] != start:
+            path.append(predecessors[path[-1]])
+        path.reverse()
+
+        edges = self.edges[weight]
+        lines = [str(self.lines[edges[a, b] - 1]) for a, b in zip(path[:-1], path[1:])]
+        return self.buses[path].tolist(), lines, float(distances[end])
+
+
+def network_graph(country, model):
+    """The graph of ``model``'s lines for the current data version, built on first use."""
+    key = (country, get_data_version())
+    graph = _graphs.get(key)
+    if graph is not None:
+        return graph
+
+    with _lock:
+        graph = _graphs.get(key)
+        if graph is None:
+            graph = NetworkGraph.from_model(model)
+            logger.info(f"Built network graph for {country}: {len(graph.buses)} buses, "
+                        f"{len(graph.lines)} lines, {graph.component_count} components")
+            # Graphs of older data versions are never read again.
+            for stale in [k for k in _graphs if k[0] == country]:
+                del _graphs[stale]
+            _graphs[key] = graph
+    return graph
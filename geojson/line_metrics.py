@@ -0,0 +1,70 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Line expansion, expansion cost and impedance ratio, computed column-wise with NumPy.
+"""
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import LineMetrics
+from .views import LINE_MODELS
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+SOURCE_COLUMNS = ['Line', 'bus0', 'bus1', 'carrier', 'length', 's_nom', 's_nom_opt',
+                  'capital_cost', 'x', 'r']
+
+
+def _ratio(numerator, denominator):
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = numerator / denominator
+    return ratio.where(np.isfinite(ratio))
+
+
+def line_metrics(df):
+    """Frame of the derived metrics of the lines in ``df``; undefined ratios are NaN."""
+    metrics = pd.DataFrame({
+        'line': df['Line'].astype(str),
+        'bus0': df['bus0'].astype(str),
+        'bus1': df['bus1'].astype(str),
+        'carrier': df['carrier'].fillna('').astype(str),
+    })
+    for column in ('length', 's_nom', 's_nom_opt', 'capital_cost', 'x', 'r'):
+        metrics[column] = pd.to_numeric(df[column], errors='coerce')
+
+    metrics['expansion'] = metrics['s_nom_opt'] - metrics['s_nom']
+    metrics['relative_expansion'] = _ratio(metrics['expansion'], metrics['s_nom'])
+    # PyPSA's line capital_cost is per MW of the whole line, its length already priced in.
+    metrics['expansion_cost'] = metrics['capital_cost'] * metrics['expansion']
+    metrics['x_r_ratio'] = _ratio(metrics['x'], metrics['r'])
+    return metrics.drop(columns=['capital_cost', 'x', 'r'])
+
+
+def refresh_country(country):
+    """Recompute the metrics of ``country``'s lines; returns the number of lines stored."""
+    model = LINE_MODELS[country]
+    df = pd.DataFrame.from_records(list(model.objects.values_list(*SOURCE_COLUMNS)),
+                                   columns=SOURCE_COLUMNS)
+    metrics = line_metrics(df).astype(object)
+    metrics = metrics.where(metrics.notna(), None)
+    rows = [LineMetrics(country=country, **record) for record in metrics.to_dict('records')]
+
+    with transaction.atomic():
+        LineMetrics.objects.filter(country=country).delete()
+        LineMetrics.objects.bulk_create(rows, batch_size=5000)
+    logger.info(f"Stored metrics of {len(rows)} lines for {country}")
+    return len(rows)
+
+
+def refresh_line_metrics():
+    for country in LINE_MODELS:
+        try:
+            refresh_country(country)
+        except Exception as e:
+            logger.error(f"Error computing line metrics for {country}: {e}")
@@ -0,0 +1,112 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import csv
+import io
+import re
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from geoalchemy2 import Geometry
+from sqlalchemy import create_engine
+
+from geojson.cache import bump_data_version
+from geojson.metrics import observe_ingest
+from geojson.models import conn_str, store_choropleth_statistics, update_derived_tables
+from geojson.partitions import compat_view, replace_partition
+from geojson.pypsa_network import PyPSANetwork, build_generators, build_lines, build_storage
+from geojson.timeseries import NAME_RE, store_network_series
+from geojson.views import (
+    LINE_MODELS, NOMINAL_GENERATOR_MODELS, NOMINAL_STORAGE_MODELS, OPTIMAL_GENERATOR_MODELS,
+    OPTIMAL_STORAGE_MODELS,
+)
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def copy_insert(table, conn, keys, data_iter):
+    """``to_sql`` method loading the rows with COPY instead of INSERT statements."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(data_iter)
+    buffer.seek(0)
+    columns = ', '.join(f'"{k}"' for k in keys)
+    with conn.connection.cursor() as cursor:
+        cursor.copy_expert(f'COPY "{table.name}" ({columns}) FROM STDIN WITH CSV', buffer)
+
+
+def model_columns(model):
+    return [field.column for field in model._meta.concrete_fields]
+
+
+class Command(BaseCommand):
+    help = ("Load the lines, generators and storage units of a solved PyPSA network (netCDF) "
+            "into the country and scenario partitions of the datasets and store its time series.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Network exported with PyPSA's export_to_netcdf.")
+        parser.add_argument('--country', required=True,
+                            help="Country name as used in the API URLs, e.g. 'colombia'.")
+        parser.add_argument('--scenario', required=True,
+                            help="Scenario partition to replace; the views of the country then show it.")
+
+    def handle(self, *args, path, country, scenario, **options):
+        country = country.lower()
+        if country not in LINE_MODELS:
+            raise CommandError(f"Unknown country '{country}', expected one of {', '.join(LINE_MODELS)}")
+        if not NAME_RE.match(scenario):
+            raise CommandError("The scenario may only contain letters, digits, '_' and '-'")
+        suffix = re.sub(r'[^a-z0-9]+', '_', f'{country}_{scenario}'.lower()).strip('_')
+
+        with observe_ingest('import_pypsa_network') as ingest, PyPSANetwork(path) as network:
+            frames = self.build_frames(network, country)
+            engine = create_engine(conn_str)
+            partitions = []
+            for kind, (model, frame, geometry_column) in frames.items():
+                upload = f'pypsa_{kind}_{suffix}_upload'
+                frame = frame.assign(**{geometry_column: 'SRID=4326;' + frame[geometry_column]})
+                frame.to_sql(name=upload, con=engine, if_exists='replace', index=False,
+                             method=copy_insert,
+                             dtype={geometry_column: Geometry('GEOMETRY', srid=4326, spatial_index=False)})
+                try:
+                    partitions.append(replace_partition(kind, country, scenario, upload, model))
+                finally:
+                    with connection.cursor() as cursor:
+                        cursor.execute(f'DROP TABLE IF EXISTS "{upload}"')
+                # Keyed like an upload's statistics, by the relation the layer reads.
+                store_choropleth_statistics(compat_view(model, scenario), frame)
+                ingest.rows += len(frame)
+                if options['verbosity']:
+                    self.stdout.write(f"Loaded {len(frame)} rows into {partitions[-1]}")
+
+            series = store_network_series(network, country, scenario)
+            if options['verbosity']:
+                self.stdout.write(f"Stored {series} time series")
+
+        call_command('optimize_spatial', tables=partitions, verbosity=0)
+        update_derived_tables()
+        bump_data_version()
+        self.stdout.write(f"Imported {path} as {country} ({scenario})")
+
+    def build_frames(self, network, country):
+        """``{kind: (model, frame, geometry column)}`` for every table the country has a view for."""
+        lines = LINE_MODELS[country]
+        line_columns = model_columns(lines)
+        line_geometry = 'geom' if 'geom' in line_columns else 'line_geom'
+        frames = {'lines': (lines, build_lines(network, line_columns, line_geometry), line_geometry)}
+
+        for kind, registry, capacity in (('nominal_generators', NOMINAL_GENERATOR_MODELS, 'p_nom'),
+                                         ('optimal_generators', OPTIMAL_GENERATOR_MODELS, 'p_nom_opt')):
+            model = registry[country]
+            frames[kind] = (model, build_generators(network, model_columns(model), capacity), 'geom')
+
+        for kind, registry, capacity in (('nominal_storage', NOMINAL_STORAGE_MODELS, 'p_nom'),
+                                         ('optimal_storage', OPTIMAL_STORAGE_MODELS, 'p_nom_opt')):
+            model = registry.get(country)
+            if model is not None:
+                frames[kind] = (model, build_storage(network, model_columns(model), capacity), 'geom')
+        return frames
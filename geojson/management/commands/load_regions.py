@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import geopandas as gpd
+from django.contrib.gis.geos import GEOSGeometry, MultiPolygon
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from geojson.cache import bump_data_version
+from geojson.models import Region
+from geojson.regions import aggregate_country
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def as_multipolygon(geometry):
+    geometry = GEOSGeometry(geometry.wkt, srid=4326)
+    if geometry.geom_type == 'Polygon':
+        return MultiPolygon(geometry, srid=4326)
+    if geometry.geom_type != 'MultiPolygon':
+        raise CommandError(f"Unsupported geometry type {geometry.geom_type}")
+    return geometry
+
+
+class Command(BaseCommand):
+    help = "Replace a country's administrative regions with those of a boundary file, then aggregate."
+
+    def add_arguments(self, parser):
+        parser.add_argument('country', help="Country name as used in the API URLs, e.g. 'colombia'.")
+        parser.add_argument('path', help="Any file readable by geopandas (GeoJSON, GeoPackage, shapefile).")
+        parser.add_argument('--name-field', default='name', help="Attribute holding the region name.")
+        parser.add_argument('--code-field', help="Attribute holding the region code, if any.")
+
+    def handle(self, *args, country, path, name_field, code_field, **options):
+        country = country.lower()
+        gdf = gpd.read_file(path)
+        if name_field not in gdf:
+            raise CommandError(f"'{name_field}' is not an attribute of {path}")
+        if code_field and code_field not in gdf:
+            raise CommandError(f"'{code_field}' is not an attribute of {path}")
+        gdf = gdf[gdf.geometry.notna()].to_crs(4326)
+
+        regions = [
+            Region(country=country, name=str(row[name_field]),
+                   code=str(row[code_field]) if code_field else '',
+                   geom=as_multipolygon(row.geometry))
+            for _, row in gdf.iterrows()
+        ]
+        with transaction.atomic():
+            Region.objects.filter(country=country).delete()
+            Region.objects.bulk_create(regions)
+        self.stdout.write(f"Loaded {len(regions)} regions for {country}")
+
+        stored = aggregate_country(country)
+        bump_data_version()
+        self.stdout.write(f"Stored {stored} region aggregates")
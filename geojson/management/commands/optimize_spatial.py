@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Create the indexes the dashboard queries rely on, then CLUSTER and ANALYZE.
+
+The view-backed models are unmanaged, so their ``db_index=True`` never
+reaches the database, and the ``geojson_*`` tables written by ``to_sql``
+have no index at all. This command resolves every unmanaged model to the
+tables behind its view, down to the partitions of partitioned datasets,
+and indexes those: GIST on geometry columns, B-tree on the join and filter
+columns.
+"""
+
+import hashlib
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+BTREE_COLUMNS = ('Bus', 'bus', 'carrier', 'bus0', 'bus1')
+
+# Follows views to the relations they read and partitioned tables to their
+# partitions, down to the leaves, which are where indexes and CLUSTER apply.
+BASE_TABLES_SQL = """
+    WITH RECURSIVE edges(parent, child) AS (
+        SELECT r.ev_class, d.refobjid
+        FROM pg_rewrite r
+        JOIN pg_depend d ON d.objid = r.oid
+            AND d.classid = 'pg_rewrite'::regclass
+            AND d.refclassid = 'pg_class'::regclass
+            AND d.refobjid <> r.ev_class
+        UNION ALL
+        SELECT inhparent, inhrelid FROM pg_inherits
+    ), deps(relid) AS (
+        SELECT to_regclass(quote_ident(%s))::oid
+        UNION
+        SELECT edges.child
+        FROM deps
+        JOIN edges ON edges.parent = deps.relid
+    )
+    SELECT c.relname
+    FROM deps
+    JOIN pg_class c ON c.oid = deps.relid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r', 'm') AND n.nspname = 'public'
+"""
+
+UPLOADED_TABLES_SQL = """
+    SELECT c.relname
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind = 'r' AND n.nspname = 'public' AND c.relname LIKE 'geojson\\_%'
+"""
+
+COLUMNS_SQL = """
+    SELECT a.attname, t.typname
+    FROM pg_attribute a
+    JOIN pg_type t ON t.oid = a.atttypid
+    WHERE a.attrelid = to_regclass(quote_ident(%s)) AND a.attnum > 0 AND NOT a.attisdropped
+    ORDER BY a.attnum
+"""
+
+# Name of an index whose leading column is the given one, if any.
+LEADING_INDEX_SQL = """
+    SELECT ic.relname
+    FROM pg_index i
+    JOIN pg_class ic ON ic.oid = i.indexrelid
+    JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+    JOIN pg_am am ON am.oid = ic.relam
+    WHERE i.indrelid = to_regclass(quote_ident(%s)) AND a.attname = %s AND am.amname = %s
+    LIMIT 1
+"""
+
+
+def index_name(table, column, suffix):
+    """A stable index name within PostgreSQL's 63 character limit."""
+    digest = hashlib.md5(f'{table}.{column}'.encode()).hexdigest()[:8]
+    return f'{table[:36]}_{column[:12]}_{digest}_{suffix}'
+
+
+def base_tables(view):
+    """
+    Tables and materialized views a view reads from, following nested views.
+
+    A partitioned table stands for its leaf partitions.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(BASE_TABLES_SQL, [view])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def default_tables():
+    """Tables behind every unmanaged model plus the uploaded ``geojson_*`` tables."""
+    tables = set()
+    for model in apps.get_app_config('geojson').get_models():
+        if not model._meta.managed:
+            tables.update(base_tables(model._meta.db_table))
+
+    with connection.cursor() as cursor:
+        cursor.execute(UPLOADED_TABLES_SQL)
+        tables.update(row[0] for row in cursor.fetchall())
+    # Tables of the app's own models are indexed by their migrations.
+    return sorted(tables - set(connection.introspection.django_table_names()))
+
+
+def ensure_index(cursor, table, column, method):
+    """Name of an index on ``column`` using ``method``, created when missing."""
+    cursor.execute(LEADING_INDEX_SQL, [table, column, method])
+    row = cursor.fetchone()
+    if row:
+        return row[0], False
+    name = index_name(table, column, method)
+    quote = connection.ops.quote_name
+    cursor.execute(f'CREATE INDEX IF NOT EXISTS {quote(name)} '
+                   f'ON {quote(table)} USING {method} ({quote(column)})')
+    return name, True
+
+
+def optimize_table(table, cluster=True):
+    """Index, cluster and analyze one table; returns the names of the created indexes."""
+    quote = connection.ops.quote_name
+    created = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(COLUMNS_SQL, [table])
+        columns = cursor.fetchall()
+
+        spatial_index = None
+        for column, type_name in columns:
+            if type_name in ('geometry', 'geography'):
+                name, new = ensure_index(cursor, table, column, 'gist')
+                spatial_index = spatial_index or name
+            elif column in BTREE_COLUMNS:
+                name, new = ensure_index(cursor, table, column, 'btree')
+            else:
+                continue
+            if new:
+                created.append(name)
+
+        if cluster and spatial_index:
+            cursor.execute(f'CLUSTER {quote(table)} USING {quote(spatial_index)}')
+        cursor.execute(f'ANALYZE {quote(table)}')
+    return created
+
+
+class Command(BaseCommand):
+    help = "Index, CLUSTER and ANALYZE the tables behind the dashboard's views and uploads."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--table', action='append', dest='tables',
+                            help="Only process this table (repeatable). Defaults to every backing table.")
+        parser.add_argument('--no-cluster', action='store_false', dest='cluster',
+                            help="Skip CLUSTER, which locks each table while it is rewritten.")
+
+    def handle(self, *args, tables=None, cluster=True, verbosity=1, **options):
+        for table in tables or default_tables():
+            try:
+                created = optimize_table(table, cluster=cluster)
+            except Exception as e:
+                logger.error(f"Error optimizing table '{table}': {e}", exc_info=True)
+                if verbosity:
+                    self.stderr.write(f"{table}: failed ({e})")
+                continue
+            summary = ', '.join(created) if created else 'no new indexes'
+            logger.info(f"Optimized table '{table}': {summary}")
+            if verbosity:
+                self.stdout.write(f"{table}: {summary}")
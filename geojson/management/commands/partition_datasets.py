@@ -0,0 +1,35 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from django.core.management.base import BaseCommand, CommandError
+
+from geojson.cache import bump_data_version
+from geojson.partitions import DEFAULT_SCENARIO, consolidate, dataset_sources
+
+
+class Command(BaseCommand):
+    help = ("Move the per-country upload tables into one partitioned table per dataset and "
+            "replace them with views on their partitions. SQL views derived from other "
+            "tables are left as they are.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dataset', action='append', dest='datasets',
+                            help="Dataset to consolidate (repeatable); all of them by default.")
+        parser.add_argument('--scenario', default=DEFAULT_SCENARIO,
+                            help="Scenario partition the existing tables become.")
+
+    def handle(self, *args, datasets, scenario, **options):
+        unknown = set(datasets or ()) - set(dataset_sources())
+        if unknown:
+            raise CommandError(f"Unknown dataset {', '.join(sorted(unknown))}, "
+                               f"expected one of {', '.join(dataset_sources())}")
+
+        written = consolidate(datasets, scenario)
+        if written:
+            bump_data_version()
+        for partition in written:
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {partition}")
+        self.stdout.write(f"Consolidated {len(written)} partitions")
@@ -0,0 +1,17 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from django.core.management.base import BaseCommand
+
+from geojson.cache import get_data_version
+from geojson.snapshots import publish_snapshot
+
+
+class Command(BaseCommand):
+    help = "Render the full-dataset responses for the current data version and switch workers to them."
+
+    def handle(self, *args, **options):
+        stored = publish_snapshot(get_data_version())
+        self.stdout.write(f"Published {stored} snapshotted responses")
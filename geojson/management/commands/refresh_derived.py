@@ -0,0 +1,18 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from django.core.management.base import BaseCommand
+
+from geojson.cache import bump_data_version
+from geojson.models import update_derived_tables
+
+
+class Command(BaseCommand):
+    help = "Recompute the region aggregates and line metrics, e.g. after restoring a database backup."
+
+    def handle(self, *args, **options):
+        update_derived_tables()
+        bump_data_version()
+        self.stdout.write("Derived tables refreshed")
@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Prometheus metrics of the API, the upload receivers and GeoServer calls.
+
+Label values are restricted to known sets (URL names, supported countries,
+receiver and GeoServer operation names) so the number of series stays
+bounded whatever clients request. With several worker processes, point
+PROMETHEUS_MULTIPROC_DIR at a shared directory so /metrics aggregates them.
+Only clients passing ``metrics_allowed`` may read /metrics.
+"""
+
+import hmac
+import ipaddress
+import os
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from prometheus_client import (
+    CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest, multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+KNOWN_COUNTRIES = {'nigeria', 'colombia', 'united states'}
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+INGEST_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+REQUEST_LATENCY = Histogram(
+    'dashboard_request_duration_seconds', 'Request latency by endpoint and country.',
+    ['endpoint', 'country'])
+RESPONSE_SIZE = Histogram(
+    'dashboard_response_size_bytes', 'Response body size by endpoint and country.',
+    ['endpoint', 'country'], buckets=SIZE_BUCKETS)
+REQUESTS = Counter(
+    'dashboard_requests', 'Requests by endpoint, country and status class.',
+    ['endpoint', 'country', 'status'])
+RESPONSE_CACHE = Counter(
+    'dashboard_response_cache', 'Response cache lookups by result (hit, miss or snapshot).',
+    ['result'])
+INGEST_DURATION = Histogram(
+    'dashboard_ingest_duration_seconds', 'Duration of the upload receivers.',
+    ['receiver'], buckets=INGEST_BUCKETS)
+INGEST_ROWS = Counter(
+    'dashboard_ingest_rows', 'Rows written by the upload receivers.',
+    ['receiver'])
+INGEST_ERRORS = Counter(
+    'dashboard_ingest_errors', 'Failed runs of the upload receivers.',
+    ['receiver'])
+INGEST_SKIPPED = Counter(
+    'dashboard_ingest_skipped', 'Uploads not ingested because the same file is already loaded.',
+    ['receiver'])
+GEOSERVER_LATENCY = Histogram(
+    'dashboard_geoserver_request_duration_seconds', 'Latency of GeoServer REST calls.',
+    ['operation'])
+
+
+def country_label(country):
+    if country is None:
+        return ''
+    country = country.lower()
+    return country if country in KNOWN_COUNTRIES else 'other'
+
+
+def observe_request(request, response, seconds):
+    match = getattr(request, 'resolver_match', None)
+    endpoint = match.url_name if match and match.url_name else 'unmatched'
+    country = country_label(match.kwargs.get('country') if match else None)
+    REQUEST_LATENCY.labels(endpoint, country).observe(seconds)
+    REQUESTS.labels(endpoint, country, f'{response.status_code // 100}xx').inc()
+    if not response.streaming:
+        RESPONSE_SIZE.labels(endpoint, country).observe(len(response.content))
+
+
+class IngestRun:
+    rows = 0
+
+
+@contextmanager
+def observe_ingest(receiver):
+    """Time an upload receiver; set ``rows`` on the yielded object to count its rows."""
+    run = IngestRun()
+    start = time.perf_counter()
+    try:
+        yield run
+    except Exception:
+        INGEST_ERRORS.labels(receiver).inc()
+        raise
+    finally:
+        INGEST_DURATION.labels(receiver).observe(time.perf_counter() - start)
+        INGEST_ROWS.labels(receiver).inc(run.rows)
+
+
+@contextmanager
+def observe_geoserver(operation):
+    with GEOSERVER_LATENCY.labels(operation).time():
+        yield
+
+
+def metrics_allowed(request):
+    """
+    Whether ``request`` may read /metrics.
+
+    Allowed are requests bearing ``Authorization: Bearer <METRICS_TOKEN>``,
+    staff users, and clients whose address is in METRICS_ALLOWED_IPS
+    (addresses or networks, local ones by default).
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                                     f'Bearer {token}'.encode()):
+        return True
+
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_active and user.is_staff:
+        return True
+
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    networks = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    return any(address in ipaddress.ip_network(network, strict=False) for network in networks)
+
+
+class DatabaseConnectionsCollector:
+    """
+    Backends connected to this database by state, read from pg_stat_activity at scrape time.
+
+    Every client of the database is counted, GeoServer included, not only the dashboard's workers.
+    """
+
+    def describe(self):
+        yield self._gauge()
+
+    def collect(self):
+        gauge = self._gauge()
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("""
+                    SELECT coalesce(state, 'unknown'), count(*)
+                    FROM pg_stat_activity
+                    WHERE datname = current_database()
+                    GROUP BY 1
+                """)
+                for state, count in cursor.fetchall():
+                    gauge.add_metric([state], count)
+        except Exception as e:
+            logger.error(f"Error collecting database connections: {e}")
+        yield gauge
+
+    def _gauge(self):
+        return GaugeMetricFamily(
+            'dashboard_database_backends', 'Backends connected to the database, of any client, by state.',
+            labels=['state'])
+
+
+def render_metrics():
+    """Metrics in the Prometheus text format, aggregated over all workers in multiprocess mode."""
+    if 'PROMETHEUS_MULTIPROC_DIR' not in os.environ:
+        return generate_latest(REGISTRY)
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    registry.register(DatabaseConnectionsCollector())
+    return generate_latest(registry)
+
+
+REGISTRY.register(DatabaseConnectionsCollector())
@@ -0,0 +1,153 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_sequence
+
+from .cache import accepted_encodings, compress, negotiate_encoding
+from .metrics import observe_request
+from .profiling import RequestTimings, timed
+from .slow_queries import recorder_for
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIN_COMPRESS_LENGTH = 200
+# Formats that are compressed already and gain nothing from another pass.
+COMPRESSED_CONTENT_TYPES = ('application/zip', 'application/vnd.apache.parquet')
+STRONG_ETAG_RE = _lazy_re_compile(r'^"')
+
+
+def wrap_all_connections(wrapper):
+    """Install ``wrapper`` on the primary and every replica connection."""
+    stack = ExitStack()
+    for conn in connections.all():
+        stack.enter_context(conn.execute_wrapper(wrapper))
+    return stack
+
+
+class CompressionMiddleware:
+    """
+    Compress responses with brotli or gzip, whichever the client prefers.
+
+    Works like Django's ``GZipMiddleware`` but also negotiates brotli. Responses
+    that already carry a ``Content-Encoding``, such as the precompressed bodies
+    of ``cached_api_response``, are passed through untouched.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').split(';')[0] in COMPRESSED_CONTENT_TYPES:
+            return response
+        if not response.streaming and len(response.content) < MIN_COMPRESS_LENGTH:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            # Streamed bodies are compressed incrementally, which Django only offers for gzip.
+            if 'gzip' not in accepted_encodings(request):
+                return response
+            encoding = 'gzip'
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            encoding = negotiate_encoding(request)
+            if encoding == 'identity':
+                return response
+            with timed(request, 'compress'):
+                compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(response.content))
+
+        etag = response.get('ETag')
+        if etag and STRONG_ETAG_RE.match(etag):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+class ServerTimingMiddleware:
+    """
+    Report where the time of each request goes.
+
+    Views mark their phases with ``profiling.timed`` (query materialization,
+    geometry conversion, encoding, compression, ...), while SQL execution is
+    collected as ``db``. The phases, the row count and the response size are
+    sent in a ``Server-Timing`` header, visible in the browser devtools, and
+    logged as one ``key=value`` line per request. Place it first in
+    ``MIDDLEWARE`` so that ``total`` covers every other middleware.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SERVER_TIMING', settings.DEBUG):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.timings = timings = RequestTimings()
+        start = time.perf_counter()
+        with wrap_all_connections(timings.query_wrapper):
+            response = self.get_response(request)
+        total = (time.perf_counter() - start) * 1000
+
+        metrics = [f'{phase};dur={duration:.1f}' for phase, duration in timings.items()]
+        metrics.append(f'total;dur={total:.1f}')
+        size = None if response.streaming else len(response.content)
+        if timings.rows is not None:
+            metrics.append(f'rows;desc="{timings.rows}"')
+        if size is not None:
+            metrics.append(f'bytes;desc="{size}"')
+        response.headers['Server-Timing'] = ', '.join(metrics)
+
+        phases = ' '.join(f'{phase}={duration:.1f}ms' for phase, duration in timings.items())
+        logger.info(
+            f"timing path={request.path} status={response.status_code} queries={timings.queries} "
+            f"rows={timings.rows} bytes={size} {phases} total={total:.1f}ms"
+        )
+        return response
+
+
+class SlowQueryMiddleware:
+    """Record the slow ORM and raw cursor queries of each request, see ``slow_queries``."""
+
+    def __init__(self, get_response):
+        if recorder_for() is None:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with wrap_all_connections(recorder_for(request.path)):
+            return self.get_response(request)
+
+
+class MetricsMiddleware:
+    """Observe latency, status and response size of every request for /metrics."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        observe_request(request, response, time.perf_counter() - start)
+        return response
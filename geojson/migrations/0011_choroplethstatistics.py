@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-19 09:00
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geojson', '0010_economicdata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChoroplethStatistics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=255)),
+                ('carrier', models.CharField(max_length=255)),
+                ('variable', models.CharField(max_length=50)),
+                ('count', models.IntegerField()),
+                ('min_value', models.FloatField()),
+                ('max_value', models.FloatField()),
+                ('quantile_breaks', models.JSONField(default=list)),
+                ('jenks_breaks', models.JSONField(default=list)),
+                ('histogram', models.JSONField(default=dict)),
+                ('computed_time', models.DateTimeField(default=datetime.datetime.now)),
+            ],
+            options={
+                'unique_together': {('table_name', 'carrier', 'variable')},
+            },
+        ),
+    ]
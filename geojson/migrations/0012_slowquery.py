@@ -0,0 +1,29 @@
+# Generated by Django 5.0.4 on 2026-10-19 09:30
+
+import datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geojson', '0011_choroplethstatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlowQuery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sql', models.TextField()),
+                ('params', models.TextField(blank=True)),
+                ('duration_ms', models.FloatField()),
+                ('plan', models.TextField(blank=True)),
+                ('path', models.CharField(blank=True, max_length=255)),
+                ('recorded_time', models.DateTimeField(default=datetime.datetime.now)),
+            ],
+            options={
+                'ordering': ['-recorded_time'],
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:15
+
+import django.contrib.gis.db.models.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geojson', '0012_slowquery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Region',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(db_index=True, max_length=100)),
+                ('name', models.CharField(max_length=255)),
+                ('code', models.CharField(blank=True, max_length=100)),
+                ('geom', django.contrib.gis.db.models.fields.MultiPolygonField(srid=4326)),
+            ],
+            options={
+                'ordering': ['country', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RegionAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=50)),
+                ('carrier', models.CharField(max_length=255)),
+                ('count', models.IntegerField()),
+                ('capacity', models.FloatField(null=True)),
+                ('cf', models.FloatField(null=True)),
+                ('crt', models.FloatField(null=True)),
+                ('usdpt', models.FloatField(null=True)),
+                ('region', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aggregates', to='geojson.region')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'carrier'], name='geojson_reg_source_1b908a_idx')],
+                'unique_together': {('region', 'source', 'carrier')},
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-19 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geojson', '0013_region_regionaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LineMetrics',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('country', models.CharField(max_length=100)),
+                ('line', models.CharField(max_length=255)),
+                ('bus0', models.CharField(max_length=255)),
+                ('bus1', models.CharField(max_length=255)),
+                ('carrier', models.CharField(blank=True, max_length=255)),
+                ('length', models.FloatField(null=True)),
+                ('s_nom', models.FloatField(null=True)),
+                ('s_nom_opt', models.FloatField(null=True)),
+                ('expansion', models.FloatField(null=True)),
+                ('relative_expansion', models.FloatField(null=True)),
+                ('expansion_cost', models.FloatField(null=True)),
+                ('x_r_ratio', models.FloatField(null=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['country', 'expansion'], name='geojson_lin_country_1e5c52_idx'), models.Index(fields=['country', 'relative_expansion'], name='geojson_lin_country_e09fee_idx'), models.Index(fields=['country', 'expansion_cost'], name='geojson_lin_country_b1c2ef_idx'), models.Index(fields=['country', 'x_r_ratio'], name='geojson_lin_country_7b3306_idx')],
+                'unique_together': {('country', 'line')},
+            },
+        ),
+    ]
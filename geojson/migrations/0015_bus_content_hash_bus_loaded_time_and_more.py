@@ -0,0 +1,33 @@
+# Generated by Django 5.0.4 on 2026-10-19 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geojson', '0014_linemetrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bus',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='bus',
+            name='loaded_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='jsonbus',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='jsonbus',
+            name='loaded_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
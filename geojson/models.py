@@ -4,6 +4,7 @@
 #
 import os
 import glob
+import hashlib
 import zipfile
 from sqlalchemy import *
 from geo.Geoserver import Geoserver
@@ -22,11 +23,18 @@ from geoalchemy2 import Geometry, WKTElement
 from sqlalchemy import text
 from sqlalchemy import MetaData
 from django.db import models
+from django.db import connection, transaction
+from django.core.management import call_command
 
 import logging
 
 from django.contrib.gis.db import models
 
+from .cache import bump_data_version
+from .metrics import INGEST_SKIPPED, observe_geoserver, observe_ingest
+from .partitions import partition_target, replace_partition
+from .routers import primary_only
+
 from environ import Env
 env = Env()
 env.read_env()
@@ -47,40 +55,119 @@ logger = logging.getLogger(__name__)
 geo = Catalog(GEOSERVER_URL, username=GEOSERVER_USER, password=GEOSERVER_PASS)
 conn_str = DATABASE_URL
 
+HASH_CHUNK_SIZE = 1024 * 1024
+
 class Bus(models.Model):
     name = models.CharField(max_length=100, default="Buses_geojson_data")
     geojson_file = models.FileField(upload_to='geojson_files/', null=True, blank=True)
     uploaded_time = models.DateTimeField(default=datetime.datetime.now)
     geometry = gis_models.GeometryField(srid=4326, db_index=True, null=True, blank=True)
+    # SHA-256 of geojson_file and when its content became the live data, set once it is loaded.
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    loaded_time = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
 
+def file_sha256(path):
+    """SHA-256 of the file at ``path``, read in chunks so large uploads are never held in memory."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def is_loaded(instance, content_hash, table_name):
+    """Whether the last upload loaded under ``instance.name`` had ``content_hash`` and is still in place."""
+    live = (type(instance).objects.filter(name=instance.name, loaded_time__isnull=False)
+            .exclude(pk=instance.pk).order_by('-loaded_time').first())
+    if live is None or live.content_hash != content_hash:
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s)", [f'public."{table_name}"'])
+        return cursor.fetchone()[0] is not None
+
+
+def record_content_hash(instance, content_hash):
+    """Mark ``instance`` as the live upload of its name."""
+    instance.content_hash = content_hash
+    instance.loaded_time = datetime.datetime.now()
+    # update() rather than save(), which would fire the post_save receivers again.
+    type(instance).objects.filter(pk=instance.pk).update(
+        content_hash=instance.content_hash, loaded_time=instance.loaded_time)
+
+
+def upload_table(table_name, target):
+    """Table an upload is written to: ``table_name`` itself unless it is a view on a partition."""
+    return f'{table_name}_upload' if target else table_name
+
+
+def swap_upload(table_name, target):
+    """Swap the upload of ``table_name`` into its partition; returns the partition's name."""
+    dataset, country, scenario, model = target
+    upload = upload_table(table_name, target)
+    try:
+        return replace_partition(dataset, country, scenario, upload, model)
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS "{upload}"')
+
+
 @receiver(post_save, sender=Bus)
 def publish_data(sender, instance, created, **kwargs):
-    if not created:
-        return
+    if created:
+        ingest_bus(instance)
+
 
+def ingest_bus(instance, force=False):
+    """
+    Load a GeoJSON upload into its table and publish it to GeoServer.
+
+    Skipped when the file is byte-identical to the live upload of the same
+    name, unless ``force`` is set. Returns whether the file was ingested.
+    """
     try:
         if instance.geojson_file:
-            gdf = gpd.read_file(instance.geojson_file.path)
-
-            if not gdf.empty and 'geometry' in gdf and not gdf['geometry'].is_empty.all():
-                engine = create_engine(conn_str, echo=True)
-                gdf['geom'] = gdf['geometry'].apply(lambda x: x.wkt)
-                gdf.drop('geometry', axis=1, inplace=True)
-                table_name = "geojson_" + instance.name
-                gdf.to_sql(name=table_name, con=engine, if_exists='replace', index=False,
-                           dtype={'geom': Geometry('GEOMETRY', srid=4326)})
-
-                geo.create_featurestore(name=instance.name, workspace='PyPSAEarthDashboard',
-                                        db=DATABASE_DB, host=DATABASE_HOST,
-                                        port=DATABASE_PORT, pg_user=DATABASE_USER,
-                                        pg_password=DATABASE_PASS, schema='public')
-                geo.publish_featurestore(workspace='PyPSAEarthDashboard', store_name=instance.name,
-                                         pg_table=instance.name)
+            table_name = "geojson_" + instance.name
+            content_hash = file_sha256(instance.geojson_file.path)
+            if not force and is_loaded(instance, content_hash, table_name):
+                logger.info(f"'{instance.name}' is unchanged, skipping its ingest")
+                INGEST_SKIPPED.labels('publish_data').inc()
+                record_content_hash(instance, content_hash)
+                return False
+
+            with observe_ingest('publish_data') as ingest:
+                gdf = gpd.read_file(instance.geojson_file.path)
+
+                if not gdf.empty and 'geometry' in gdf and not gdf['geometry'].is_empty.all():
+                    engine = create_engine(conn_str, echo=True)
+                    gdf['geom'] = gdf['geometry'].apply(lambda x: x.wkt)
+                    gdf.drop('geometry', axis=1, inplace=True)
+                    target = partition_target(table_name)
+                    gdf.to_sql(name=upload_table(table_name, target), con=engine, if_exists='replace',
+                               index=False, dtype={'geom': Geometry('GEOMETRY', srid=4326)})
+                    # The statistics stay keyed by the upload's name, which the stats API looks up.
+                    loaded_table = swap_upload(table_name, target) if target else table_name
+                    ingest.rows = len(gdf)
+                    call_command('optimize_spatial', tables=[loaded_table], verbosity=0)
+                    store_choropleth_statistics(table_name, gdf)
+                    update_derived_tables()
+                    bump_data_version()
+
+                    with observe_geoserver('create_featurestore'):
+                        geo.create_featurestore(name=instance.name, workspace='PyPSAEarthDashboard',
+                                                db=DATABASE_DB, host=DATABASE_HOST,
+                                                port=DATABASE_PORT, pg_user=DATABASE_USER,
+                                                pg_password=DATABASE_PASS, schema='public')
+                    with observe_geoserver('publish_featurestore'):
+                        geo.publish_featurestore(workspace='PyPSAEarthDashboard', store_name=instance.name,
+                                                 pg_table=instance.name)
+                    record_content_hash(instance, content_hash)
+                    return True
     except Exception as e:
         logger.error(f"Error processing file: {e}", exc_info=True)
+    return False
 
 @receiver(post_delete, sender=Bus)
 def delete_data(sender, instance, **kwargs):
@@ -91,6 +178,7 @@ def delete_data(sender, instance, **kwargs):
         with engine.begin() as connection:
             connection.execute(sql)
             logger.info(f"Table '{geojson_table_name}' deleted from the database.")
+        bump_data_version()
     except Exception as e:
         logger.error(f"Error deleting table for {geojson_table_name}: {e}")
 
@@ -98,6 +186,9 @@ class JSONBus(models.Model):
     name = models.CharField(max_length=100)
     json_file = models.FileField(upload_to='json_files/', null=True, blank=True)
     uploaded_time = models.DateTimeField(default=datetime.datetime.now)
+    # SHA-256 of json_file and when its content became the live data, set once it is loaded.
+    content_hash = models.CharField(max_length=64, blank=True, editable=False, db_index=True)
+    loaded_time = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return self.name
@@ -107,33 +198,58 @@ def publish_json_data(sender, instance, created, **kwargs):
     if not created or not instance.json_file:
         logger.info("Signal triggered, but no new file was created.")
         return
+    ingest_json_bus(instance)
+
+
+def ingest_json_bus(instance, force=False):
+    """
+    Load a JSON upload into its table.
 
+    Skipped when the file is byte-identical to the live upload of the same
+    name, unless ``force`` is set. Returns whether the file was ingested.
+    """
     try:
         logger.info(f"Processing JSON file for instance '{instance.name}'")
         if not os.path.isfile(instance.json_file.path):
             logger.error(f"File not found at '{instance.json_file.path}'")
-            return
+            return False
 
-        with open(instance.json_file.path, 'r') as file:
-            json_data = json.load(file)
+        json_table_name = "json_" + instance.name
+        content_hash = file_sha256(instance.json_file.path)
+        if not force and is_loaded(instance, content_hash, json_table_name):
+            logger.info(f"'{instance.name}' is unchanged, skipping its ingest")
+            INGEST_SKIPPED.labels('publish_json_data').inc()
+            record_content_hash(instance, content_hash)
+            return False
 
-        if 'data' in json_data and json_data['data']:
-            if 'columns' in json_data:
-                json_df = pd.DataFrame(json_data['data'], columns=json_data['columns'])
-            else:
-                json_df = pd.DataFrame(json_data['data'])
+        with observe_ingest('publish_json_data') as ingest:
+            with open(instance.json_file.path, 'r') as file:
+                json_data = json.load(file)
+
+            if 'data' in json_data and json_data['data']:
+                if 'columns' in json_data:
+                    json_df = pd.DataFrame(json_data['data'], columns=json_data['columns'])
+                else:
+                    json_df = pd.DataFrame(json_data['data'])
 
-            logger.info(f"DataFrame created for '{instance.name}'")
+                logger.info(f"DataFrame created for '{instance.name}'")
 
-            engine = create_engine(conn_str, echo=True)
-            json_table_name = "json_" + instance.name
-            json_df.to_sql(name=json_table_name, con=engine, if_exists='replace', index=False)
-            logger.info(f"Data written to SQL table '{json_table_name}'")
-        else:
-            logger.warning(f"No data to write for '{instance.name}'")
+                engine = create_engine(conn_str, echo=True)
+                target = partition_target(json_table_name)
+                json_df.to_sql(name=upload_table(json_table_name, target), con=engine,
+                               if_exists='replace', index=False)
+                loaded_table = swap_upload(json_table_name, target) if target else json_table_name
+                ingest.rows = len(json_df)
+                logger.info(f"Data written to SQL table '{loaded_table}'")
+                bump_data_version()
+                record_content_hash(instance, content_hash)
+                return True
+            else:
+                logger.warning(f"No data to write for '{instance.name}'")
 
     except Exception as e:
         logger.error(f"Error processing JSON file: {e}", exc_info=True)
+    return False
 
 @receiver(post_delete, sender=JSONBus)
 def delete_json_data(sender, instance, **kwargs):
@@ -144,6 +260,7 @@ def delete_json_data(sender, instance, **kwargs):
         with engine.begin() as connection:
             connection.execute(sql)
             logger.info(f"Table '{json_table_name}' deleted from the database.")
+        bump_data_version()
     except Exception as e:
         logger.error(f"Error deleting table for {json_table_name}: {e}")
 
@@ -426,4 +543,116 @@ class EconomicData(models.Model):
         db_table = 'json_statistics_%(scenario)s_US'
 
     def __str__(self):
-        return f"{self.index} - {self.scenario}"
\ No newline at end of file
+        return f"{self.index} - {self.scenario}"
+
+class ChoroplethStatistics(models.Model):
+    table_name = models.CharField(max_length=255)
+    carrier = models.CharField(max_length=255)
+    variable = models.CharField(max_length=50)
+    count = models.IntegerField()
+    min_value = models.FloatField()
+    max_value = models.FloatField()
+    quantile_breaks = JSONField(default=list)
+    jenks_breaks = JSONField(default=list)
+    histogram = JSONField(default=dict)
+    computed_time = models.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        unique_together = ('table_name', 'carrier', 'variable')
+
+    def __str__(self):
+        return f"{self.table_name} - {self.carrier} - {self.variable}"
+
+def update_derived_tables():
+    """Rebuild the region aggregates and line metrics after the uploaded tables changed."""
+    from .line_metrics import refresh_line_metrics
+    from .regions import refresh_region_aggregates
+
+    # Replicas may not have the rows just written yet.
+    with primary_only():
+        for refresh in (refresh_region_aggregates, refresh_line_metrics):
+            try:
+                refresh()
+            except Exception as e:
+                logger.error(f"Error in {refresh.__name__}: {e}", exc_info=True)
+
+def store_choropleth_statistics(table_name, df):
+    """Replace the legend statistics of ``table_name`` with those of ``df``."""
+    from .classification import choropleth_statistics
+
+    statistics = [ChoroplethStatistics(table_name=table_name, **stats)
+                  for stats in choropleth_statistics(df)]
+    with transaction.atomic():
+        ChoroplethStatistics.objects.filter(table_name=table_name).delete()
+        ChoroplethStatistics.objects.bulk_create(statistics)
+    logger.info(f"Stored {len(statistics)} choropleth statistics for '{table_name}'")
+
+class SlowQuery(models.Model):
+    sql = models.TextField()
+    params = models.TextField(blank=True)
+    duration_ms = models.FloatField()
+    plan = models.TextField(blank=True)
+    path = models.CharField(max_length=255, blank=True)
+    recorded_time = models.DateTimeField(default=datetime.datetime.now)
+
+    class Meta:
+        ordering = ['-recorded_time']
+
+    def __str__(self):
+        return f"{self.duration_ms:.0f} ms - {self.sql[:80]}"
+
+
+class Region(models.Model):
+    """Administrative boundary loaded with the ``load_regions`` command."""
+    country = models.CharField(max_length=100, db_index=True)
+    name = models.CharField(max_length=255)
+    code = models.CharField(max_length=100, blank=True)
+    geom = gis_models.MultiPolygonField(srid=4326)
+
+    class Meta:
+        ordering = ['country', 'name']
+
+    def __str__(self):
+        return f"{self.country} - {self.name}"
+
+class RegionAggregate(models.Model):
+    """Per-region, per-carrier totals of one point layer, rebuilt after every ingest."""
+    region = models.ForeignKey(Region, on_delete=models.CASCADE, related_name='aggregates')
+    source = models.CharField(max_length=50)
+    carrier = models.CharField(max_length=255)
+    count = models.IntegerField()
+    capacity = models.FloatField(null=True)
+    cf = models.FloatField(null=True)
+    crt = models.FloatField(null=True)
+    usdpt = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('region', 'source', 'carrier')
+        indexes = [models.Index(fields=['source', 'carrier'])]
+
+    def __str__(self):
+        return f"{self.region} - {self.source} - {self.carrier}"
+
+LINE_METRIC_FIELDS = ('expansion', 'relative_expansion', 'expansion_cost', 'x_r_ratio')
+
+class LineMetrics(models.Model):
+    """Metrics derived from the ``Lines*`` columns, recomputed after every ingest."""
+    country = models.CharField(max_length=100)
+    line = models.CharField(max_length=255)
+    bus0 = models.CharField(max_length=255)
+    bus1 = models.CharField(max_length=255)
+    carrier = models.CharField(max_length=255, blank=True)
+    length = models.FloatField(null=True)
+    s_nom = models.FloatField(null=True)
+    s_nom_opt = models.FloatField(null=True)
+    expansion = models.FloatField(null=True)
+    relative_expansion = models.FloatField(null=True)
+    expansion_cost = models.FloatField(null=True)
+    x_r_ratio = models.FloatField(null=True)
+
+    class Meta:
+        unique_together = ('country', 'line')
+        indexes = [models.Index(fields=['country', field]) for field in LINE_METRIC_FIELDS]
+
+    def __str__(self):
+        return f"{self.country} - {self.line}"
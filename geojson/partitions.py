@@ -0,0 +1,326 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+One partitioned table per dataset instead of a table or view per country.
+
+``dataset_<name>`` is LIST-partitioned by country, and each country
+partition again by scenario. Every country/scenario leaf is loaded into a
+standalone table, indexed, and swapped in with DETACH/ATTACH in a single
+short transaction, so a re-ingest never exposes half-loaded rows. The
+upload tables the models read become views selecting their country and
+scenario, so the ORM, the raw SQL of the views module and GeoServer keep
+working, while queries on ``dataset_<name>`` itself span all countries and
+scenarios. Models reading SQL views over other tables are only pointed at
+a partition by ``import_pypsa_network``.
+"""
+
+import hashlib
+import re
+import uuid
+
+from django.contrib.gis.db.models import GeometryField
+from django.db import connection, transaction
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCENARIO = 'base'
+KEY_TYPE = 'varchar(100)'
+GEOMETRY_COLUMN = 'geom'
+BTREE_COLUMNS = ('Bus', 'bus0', 'bus1', 'carrier')
+STATISTICS_TABLE_RE = re.compile(r'^json_statistics_(?P<scenario>[A-Za-z0-9_]+)_US$')
+# The tables Bus and JSONBus uploads are loaded into.
+UPLOAD_TABLE_PREFIXES = ('geojson_', 'json_')
+
+RELATION_KIND_SQL = """
+    SELECT c.relkind
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relname = %s
+"""
+
+COLUMNS_SQL = """
+    SELECT column_name, udt_name
+    FROM information_schema.columns
+    WHERE table_schema = 'public' AND table_name = %s
+    ORDER BY ordinal_position
+"""
+
+STATISTICS_TABLES_SQL = """
+    SELECT c.relname
+    FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'v') AND c.relname ~ '^json_statistics_.+_US$'
+"""
+
+DEPENDENT_VIEWS_SQL = """
+    SELECT DISTINCT v.relname
+    FROM pg_depend d
+    JOIN pg_rewrite r ON r.oid = d.objid
+    JOIN pg_class v ON v.oid = r.ev_class
+    WHERE d.classid = 'pg_rewrite'::regclass AND d.refobjid = %s::regclass AND v.oid <> d.refobjid
+    ORDER BY v.relname
+"""
+
+DROP_RELATION = {'v': 'DROP VIEW', 'm': 'DROP MATERIALIZED VIEW', 'r': 'DROP TABLE'}
+
+
+class PartitionError(Exception):
+    pass
+
+
+def dataset_models():
+    """``{dataset: {country: model}}`` of every dataset, whatever relation the models read."""
+    from . import views
+    from .models import EconomicData
+
+    return {
+        'lines': views.LINE_MODELS,
+        'nominal_generators': views.NOMINAL_GENERATOR_MODELS,
+        'optimal_generators': views.OPTIMAL_GENERATOR_MODELS,
+        'nominal_storage': views.NOMINAL_STORAGE_MODELS,
+        'optimal_storage': views.OPTIMAL_STORAGE_MODELS,
+        'economic_statistics': {'united states': EconomicData},
+    }
+
+
+def is_upload_table(model):
+    return model._meta.db_table.startswith(UPLOAD_TABLE_PREFIXES)
+
+
+def dataset_sources():
+    """
+    ``{dataset: {country: model}}`` of the upload tables that are consolidated.
+
+    Models reading a SQL view derived from other tables are left out:
+    replacing that view with a partition would cut it off from later uploads
+    of the tables it selects from.
+    """
+    sources = {}
+    for dataset, models in dataset_models().items():
+        uploads = {country: model for country, model in models.items() if is_upload_table(model)}
+        if uploads:
+            sources[dataset] = uploads
+    return sources
+
+
+def relation_name(*parts):
+    """``parts`` joined into an identifier within PostgreSQL's 63 character limit."""
+    name = '__'.join(re.sub(r'[^a-z0-9_]+', '_', part.lower()) for part in parts)
+    if len(name) > 63:
+        name = f'{name[:54]}_{hashlib.md5(name.encode()).hexdigest()[:8]}'
+    return name
+
+
+def dataset_table(dataset):
+    return relation_name('dataset', dataset)
+
+
+def compat_view(model, scenario):
+    """The relation ``model`` reads, which becomes a view on its partition."""
+    if '%(scenario)s' in model._meta.db_table:
+        return model._meta.db_table % {'scenario': scenario}
+    return model._meta.db_table
+
+
+def relation_kind(cursor, name):
+    cursor.execute(RELATION_KIND_SQL, [name])
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def dependent_views(cursor, name):
+    cursor.execute(DEPENDENT_VIEWS_SQL, [f'public."{name}"'])
+    return [row[0] for row in cursor.fetchall()]
+
+
+def drop_relation(cursor, name):
+    """Drop ``name``; refused rather than cascaded when other views select from it."""
+    kind = relation_kind(cursor, name)
+    if kind is None:
+        return
+    if kind not in DROP_RELATION:
+        raise PartitionError(f"Cannot replace '{name}' (relation kind '{kind}')")
+    dependents = dependent_views(cursor, name)
+    if dependents:
+        raise PartitionError(f"Cannot replace '{name}', the views {', '.join(dependents)} "
+                             f"select from it")
+    cursor.execute(f'{DROP_RELATION[kind]} "{name}"')
+
+
+def dataset_columns(models):
+    """``{column: SQL type}`` covering the fields of all ``models``; geometries share one column."""
+    columns = {}
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if field.column == 'scenario':
+                continue
+            if isinstance(field, GeometryField):
+                columns.setdefault(GEOMETRY_COLUMN, 'geometry(GEOMETRY, 4326)')
+            else:
+                columns.setdefault(field.column, field.db_type(connection))
+    return columns
+
+
+def ensure_dataset(cursor, dataset, columns):
+    """Create ``dataset_<name>`` and its partitioned indexes, adding any new column."""
+    table = dataset_table(dataset)
+    definitions = ', '.join(f'"{c}" {t}' for c, t in columns.items())
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ('
+                   f'country {KEY_TYPE} NOT NULL, scenario {KEY_TYPE} NOT NULL, {definitions}'
+                   f') PARTITION BY LIST (country)')
+    for column, sql_type in columns.items():
+        cursor.execute(f'ALTER TABLE "{table}" ADD COLUMN IF NOT EXISTS "{column}" {sql_type}')
+    # Created on every partition, present and future.
+    for column, method in index_columns(columns):
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS "{relation_name(table, column, method)}" '
+                       f'ON "{table}" USING {method} ("{column}")')
+    return table
+
+
+def index_columns(columns):
+    indexed = [(GEOMETRY_COLUMN, 'gist')] if GEOMETRY_COLUMN in columns else []
+    return indexed + [(column, 'btree') for column in BTREE_COLUMNS if column in columns]
+
+
+def ensure_country_partition(cursor, dataset, country):
+    table = dataset_table(dataset)
+    partition = relation_name('dataset', dataset, country)
+    if relation_kind(cursor, partition) is None:
+        cursor.execute(f'CREATE TABLE "{partition}" PARTITION OF "{table}" '
+                       f'FOR VALUES IN (%s) PARTITION BY LIST (scenario)', [country])
+    return partition
+
+
+def replace_partition(dataset, country, scenario, source, model):
+    """
+    Replace the ``(country, scenario)`` partition of ``dataset`` with the rows of table ``source``.
+
+    Columns are matched by name and cast to the dataset's types; the geometry
+    column of ``source`` fills ``geom`` whatever its name. Afterwards the
+    relation ``model`` reads is a view on the new partition. Returns the
+    partition's name.
+    """
+    columns = dataset_columns(dataset_models()[dataset].values())
+    leaf = relation_name('dataset', dataset, country, scenario)
+    staging = relation_name('dataset', dataset, country, scenario, 'load')
+
+    with connection.cursor() as cursor:
+        table = ensure_dataset(cursor, dataset, columns)
+        partition = ensure_country_partition(cursor, dataset, country)
+
+        cursor.execute(COLUMNS_SQL, [source])
+        source_columns = dict(cursor.fetchall())
+        if not source_columns:
+            raise PartitionError(f"Table '{source}' does not exist")
+        source_geometry = next((c for c, udt in source_columns.items() if udt == 'geometry'), None)
+
+        selected = []
+        for column, sql_type in columns.items():
+            name = source_geometry if column == GEOMETRY_COLUMN else column
+            if name in source_columns:
+                selected.append(f'"{name}"::{sql_type}')
+            else:
+                selected.append(f'NULL::{sql_type}')
+
+        # Loaded and indexed outside the swap, which then only takes the locks for DETACH/ATTACH.
+        cursor.execute(f'DROP TABLE IF EXISTS "{staging}"')
+        cursor.execute(f'CREATE TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS)')
+        quoted = ', '.join(f'"{c}"' for c in columns)
+        cursor.execute(f'INSERT INTO "{staging}" (country, scenario, {quoted}) '
+                       f'SELECT %s, %s, {", ".join(selected)} FROM "{source}"', [country, scenario])
+        rows = cursor.rowcount
+        for column, method in index_columns(columns):
+            cursor.execute(f'CREATE INDEX "{relation_name(staging, column, uuid.uuid4().hex[:8])}" '
+                           f'ON "{staging}" USING {method} ("{column}")')
+        # Proves the partition bound, so ATTACH skips its validation scan.
+        bound = relation_name(staging, 'bound')
+        cursor.execute(f'ALTER TABLE "{staging}" ADD CONSTRAINT "{bound}" '
+                       f'CHECK (country = %s AND scenario = %s)', [country, scenario])
+        cursor.execute(f'ANALYZE "{staging}"')
+
+    # ``source`` may be the relation the view replaces; its rows are in the staging table by now.
+    view = compat_view(model, scenario)
+    with transaction.atomic(), connection.cursor() as cursor:
+        if relation_kind(cursor, leaf) is not None:
+            cursor.execute(f'ALTER TABLE "{partition}" DETACH PARTITION "{leaf}"')
+            cursor.execute(f'DROP TABLE "{leaf}"')
+        cursor.execute(f'ALTER TABLE "{staging}" RENAME TO "{leaf}"')
+        cursor.execute(f'ALTER TABLE "{partition}" ATTACH PARTITION "{leaf}" FOR VALUES IN (%s)', [scenario])
+        cursor.execute(f'ALTER TABLE "{leaf}" DROP CONSTRAINT "{bound}"')
+        point_view(cursor, view, model, table, country, scenario)
+
+    logger.info(f"Swapped {rows} rows into {leaf}")
+    return leaf
+
+
+def point_view(cursor, view, model, table, country, scenario):
+    """(Re)create ``view`` as the model's columns of one partition of ``table``."""
+    if relation_kind(cursor, view) == 'v' and dependent_views(cursor, view):
+        # Keeps the views selecting from it, as the columns stay those of the model.
+        create = 'CREATE OR REPLACE VIEW'
+    else:
+        drop_relation(cursor, view)
+        create = 'CREATE VIEW'
+    selected = []
+    for field in model._meta.concrete_fields:
+        if isinstance(field, GeometryField) and field.column != GEOMETRY_COLUMN:
+            selected.append(f'"{GEOMETRY_COLUMN}" AS "{field.column}"')
+        else:
+            selected.append(f'"{field.column}"')
+    cursor.execute(f'{create} "{view}" AS SELECT {", ".join(selected)} FROM "{table}" '
+                   f'WHERE country = %s AND scenario = %s', [country, scenario])
+
+
+def partition_target(table_name):
+    """
+    ``(dataset, country, scenario, model)`` when ``table_name`` is a view on a partition.
+
+    Uploads writing to such a name go through ``replace_partition`` instead
+    of replacing the view with a plain table.
+    """
+    match = STATISTICS_TABLE_RE.match(table_name)
+    for dataset, models in dataset_sources().items():
+        for country, model in models.items():
+            if match and '%(scenario)s' in model._meta.db_table:
+                target = (dataset, country, match['scenario'], model)
+            elif model._meta.db_table == table_name:
+                target = (dataset, country, DEFAULT_SCENARIO, model)
+            else:
+                continue
+            with connection.cursor() as cursor:
+                if relation_kind(cursor, dataset_table(dataset)) == 'p':
+                    return target
+            return None
+    return None
+
+
+def consolidate(datasets=None, scenario=DEFAULT_SCENARIO):
+    """
+    Move every existing per-country upload table into its dataset's partitions.
+
+    Returns the names of the partitions written. The rows are copied before
+    the old table is dropped, so a table that already is a view on its
+    partition is simply reloaded.
+    """
+    written = []
+    for dataset, models in dataset_sources().items():
+        if datasets and dataset not in datasets:
+            continue
+        for country, model in models.items():
+            if '%(scenario)s' in model._meta.db_table:
+                with connection.cursor() as cursor:
+                    cursor.execute(STATISTICS_TABLES_SQL)
+                    sources = [(row[0], STATISTICS_TABLE_RE.match(row[0])['scenario'])
+                               for row in cursor.fetchall() if STATISTICS_TABLE_RE.match(row[0])]
+            else:
+                sources = [(model._meta.db_table, scenario)]
+
+            for source, source_scenario in sources:
+                with connection.cursor() as cursor:
+                    if relation_kind(cursor, source) is None:
+                        logger.info(f"No relation '{source}', skipping {dataset} for {country}")
+                        continue
+                written.append(replace_partition(dataset, country, source_scenario, source, model))
+    return written
@@ -0,0 +1,63 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import time
+from contextlib import contextmanager
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RequestTimings:
+    """
+    Durations of the phases of one request, in milliseconds.
+
+    SQL execution is collected separately as ``db`` by ``query_wrapper`` and
+    subtracted from any phase it happens in, so phases never overlap.
+    """
+
+    def __init__(self):
+        self.phases = {}
+        self.db_time = 0.0
+        self.queries = 0
+        self.rows = None
+
+    def add(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds * 1000
+
+    def query_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+
+    def items(self):
+        if self.queries:
+            yield 'db', self.db_time * 1000
+        yield from self.phases.items()
+
+
+@contextmanager
+def timed(request, phase):
+    """Time the enclosed block as ``phase`` of ``request``, if it is being profiled."""
+    timings = getattr(request, 'timings', None)
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    db_start = timings.db_time
+    try:
+        yield
+    finally:
+        timings.add(phase, time.perf_counter() - start - (timings.db_time - db_start))
+
+
+def record_rows(request, rows):
+    timings = getattr(request, 'timings', None)
+    if timings is not None:
+        timings.rows = rows
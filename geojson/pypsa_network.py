@@ -0,0 +1,174 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Read solved PyPSA networks from their netCDF export and build the dashboard tables.
+
+PyPSA stores each static attribute as a ``<component>_<attribute>`` variable
+along the ``<component>_i`` dimension and leaves out attributes that are at
+their default for every element. The dataset is opened lazily, so only the
+variables a table needs are read, one at a time.
+"""
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# PyPSA defaults of the attributes the dashboard tables use, for files that omit them.
+PYPSA_DEFAULTS = {
+    'buses': {
+        'v_nom': 1.0, 'x': 0.0, 'y': 0.0, 'carrier': 'AC', 'unit': '', 'type': '', 'control': 'PQ',
+        'v_mag_pu_set': 1.0, 'v_mag_pu_min': 0.0, 'country': '', 'sub_network': '',
+    },
+    'lines': {
+        'type': '', 'carrier': 'AC', 'length': 0.0, 'num_parallel': 1.0, 's_max_pu': 1.0,
+        's_nom': 0.0, 's_nom_opt': 0.0, 's_nom_min': 0.0, 's_nom_max': np.inf,
+        's_nom_extendable': False, 'capital_cost': 0.0, 'x': 0.0, 'r': 0.0, 'g': 0.0, 'b': 0.0,
+        'x_pu': 0.0, 'r_pu': 0.0, 'g_pu': 0.0, 'b_pu': 0.0, 'x_pu_eff': 0.0, 'r_pu_eff': 0.0,
+        'build_year': 0, 'lifetime': np.inf, 'terrain_factor': 1.0,
+        'v_ang_min': -np.inf, 'v_ang_max': np.inf, 'sub_network': '', 'geometry': '',
+    },
+    'generators': {
+        'carrier': '', 'p_nom': 0.0, 'p_nom_opt': 0.0,
+    },
+    'storage_units': {
+        'carrier': '', 'p_nom': 0.0, 'p_nom_opt': 0.0,
+    },
+}
+
+# Bus attributes copied onto every generator row of the capacity tables.
+GENERATOR_BUS_COLUMNS = ('v_nom', 'country', 'x', 'y', 'control', 'type', 'unit',
+                         'v_mag_pu_set', 'v_mag_pu_min', 'sub_network')
+
+
+class PyPSANetwork:
+    """Lazy access to the components of a PyPSA netCDF file."""
+
+    def __init__(self, path):
+        self.dataset = xr.open_dataset(path)
+        self._indexes = {}
+
+    def close(self):
+        self.dataset.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def index(self, component):
+        if component not in self._indexes:
+            name = f'{component}_i'
+            values = self.dataset[name].values.astype(str) if name in self.dataset.coords else []
+            self._indexes[component] = pd.Index(values, name=component)
+        return self._indexes[component]
+
+    def attribute(self, component, attribute):
+        """One attribute of every element, filled with the PyPSA default when not stored."""
+        name = f'{component}_{attribute}'
+        if name in self.dataset:
+            values = self.dataset[name].values
+            if values.dtype.kind in 'SO':
+                values = values.astype(str)
+            return values
+        default = PYPSA_DEFAULTS.get(component, {}).get(attribute)
+        return np.full(len(self.index(component)), default,
+                       dtype=object if isinstance(default, str) or default is None else None)
+
+    def frame(self, component, attributes):
+        return pd.DataFrame({a: self.attribute(component, a) for a in attributes},
+                            index=self.index(component))
+
+    def series(self, component, attribute):
+        """
+        A time-varying attribute as ``(snapshots, names, values)``, or None if not stored.
+
+        ``values`` is the lazy (snapshots x elements) variable; slicing it reads only that part.
+        """
+        name = f'{component}_t_{attribute}'
+        if name not in self.dataset:
+            return None
+        variable = self.dataset[name]
+        names = self.dataset[variable.dims[1]].values.astype(str)
+        snapshots = pd.DatetimeIndex(self.dataset['snapshots'].values)
+        return snapshots, names, variable
+
+
+def point_wkt(x, y):
+    return 'POINT(' + pd.Series(x).astype(str).values + ' ' + pd.Series(y).astype(str).values + ')'
+
+
+def line_wkt(x0, y0, x1, y1):
+    return ('LINESTRING(' + pd.Series(x0).astype(str).values + ' ' + pd.Series(y0).astype(str).values
+            + ', ' + pd.Series(x1).astype(str).values + ' ' + pd.Series(y1).astype(str).values + ')')
+
+
+def _bus_positions(network, buses, component):
+    """Position in ``buses`` of the bus of every element; elements on unknown buses are dropped."""
+    positions = network.index('buses').get_indexer(buses)
+    missing = positions < 0
+    if missing.any():
+        logger.warning(f"Dropping {missing.sum()} {component} attached to unknown buses")
+    return positions, ~missing
+
+
+def build_lines(network, columns, geometry_column):
+    """Frame with ``columns`` of the lines; the geometry is the stored one or a bus-to-bus segment."""
+    buses = network.frame('buses', ['x', 'y', 'v_nom'])
+    lines = network.frame('lines', ['bus0', 'bus1'])
+    pos0, keep0 = _bus_positions(network, lines['bus0'].values, 'lines')
+    pos1, keep1 = _bus_positions(network, lines['bus1'].values, 'lines')
+    keep = keep0 & keep1
+
+    frame = pd.DataFrame({'Line': lines.index.values[keep]})
+    frame['bus0'] = lines['bus0'].values[keep]
+    frame['bus1'] = lines['bus1'].values[keep]
+    for column in columns:
+        if column in frame or column == geometry_column:
+            continue
+        if column == 'v_nom':
+            frame[column] = buses['v_nom'].values[pos0[keep]]
+        else:
+            frame[column] = network.attribute('lines', column)[keep]
+
+    stored = network.attribute('lines', 'geometry')[keep].astype(str)
+    segments = line_wkt(buses['x'].values[pos0[keep]], buses['y'].values[pos0[keep]],
+                        buses['x'].values[pos1[keep]], buses['y'].values[pos1[keep]])
+    frame[geometry_column] = np.where(np.char.str_len(stored) > 0, stored, segments)
+    return frame[columns]
+
+
+def build_generators(network, columns, capacity):
+    """Frame with ``columns`` of the generators, joined to the attributes of their bus."""
+    buses = network.frame('buses', GENERATOR_BUS_COLUMNS)
+    generators = network.frame('generators', ['bus', 'carrier', capacity])
+    positions, keep = _bus_positions(network, generators['bus'].values, 'generators')
+
+    frame = pd.DataFrame({
+        'id': generators.index.values[keep],
+        'Bus': generators['bus'].values[keep],
+        'generator': generators.index.values[keep],
+        'carrier': generators['carrier'].values[keep],
+        capacity: generators[capacity].values[keep],
+    })
+    for column in GENERATOR_BUS_COLUMNS:
+        frame[column] = buses[column].values[positions[keep]]
+    frame['geom'] = point_wkt(frame['x'].values, frame['y'].values)
+    return frame[columns]
+
+
+def build_storage(network, columns, capacity):
+    """Storage capacity summed per bus and carrier, located at the bus."""
+    buses = network.frame('buses', ['x', 'y'])
+    units = network.frame('storage_units', ['bus', 'carrier', capacity])
+    frame = units.groupby(['bus', 'carrier'], as_index=False, sort=False)[capacity].sum()
+    positions, keep = _bus_positions(network, frame['bus'].values, 'storage units')
+    frame = frame[keep].rename(columns={'bus': 'Bus'})
+    frame['geom'] = point_wkt(buses['x'].values[positions[keep]], buses['y'].values[positions[keep]])
+    return frame[columns]
@@ -0,0 +1,83 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Spatial join of the generator and storage layers with the loaded regions.
+
+Every point is assigned to the region containing it with ``ST_Contains``
+(using the GIST index of ``Region.geom``) and the results are stored per
+region and carrier in ``RegionAggregate``, so regional choropleths need a
+few hundred polygons instead of every point.
+"""
+
+from django.db import connection, transaction
+
+from .models import CombinedGeneratorData, Region, RegionAggregate
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Averaged per region when the source has them.
+MEAN_COLUMNS = ('cf', 'crt', 'usdpt')
+
+
+def region_sources():
+    """
+    ``{source: ({country: model}, capacity column)}`` of the point layers aggregated per region.
+
+    Built from the layer registries of the views module, which is imported
+    here since it imports this one.
+    """
+    from . import views
+
+    return {
+        'nominal_generators': (views.NOMINAL_GENERATOR_MODELS, 'p_nom'),
+        'optimal_generators': (views.OPTIMAL_GENERATOR_MODELS, 'p_nom_opt'),
+        'nominal_storage': (views.NOMINAL_STORAGE_MODELS, 'p_nom'),
+        'optimal_storage': (views.OPTIMAL_STORAGE_MODELS, 'p_nom_opt'),
+        'combined_generators': ({'colombia': CombinedGeneratorData}, 'p_nom'),
+    }
+
+
+def _aggregate_sql(model, capacity_column):
+    fields = {f.column for f in model._meta.fields}
+    means = ', '.join(f'avg(s."{c}")' if c in fields else 'NULL' for c in MEAN_COLUMNS)
+    return f"""
+        INSERT INTO {RegionAggregate._meta.db_table}
+            (region_id, source, carrier, count, capacity, {', '.join(MEAN_COLUMNS)})
+        SELECT r.id, %s, s.carrier, count(*), sum(s."{capacity_column}"), {means}
+        FROM {Region._meta.db_table} r
+        JOIN "{model._meta.db_table}" s ON ST_Contains(r.geom, s.geom::geometry)
+        WHERE r.country = %s
+        GROUP BY r.id, s.carrier
+    """
+
+
+def aggregate_country(country):
+    """Rebuild the aggregates of ``country``'s regions; returns the number of rows stored."""
+    stored = 0
+    with transaction.atomic():
+        RegionAggregate.objects.filter(region__country=country).delete()
+        for source, (models, capacity_column) in region_sources().items():
+            model = models.get(country)
+            if model is None:
+                continue
+            try:
+                # A missing view only loses its own source.
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.execute(_aggregate_sql(model, capacity_column), [source, country])
+                    stored += cursor.rowcount
+            except Exception as e:
+                logger.error(f"Error aggregating {source} for {country}: {e}")
+    logger.info(f"Stored {stored} region aggregates for {country}")
+    return stored
+
+
+def refresh_region_aggregates(country=None):
+    """Rebuild the aggregates of ``country``, or of every country with regions loaded."""
+    countries = [country] if country else (
+        Region.objects.values_list('country', flat=True).distinct().order_by())
+    for name in list(countries):
+        aggregate_country(name)
@@ -0,0 +1,130 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Routing of the dashboard's read-only models to PostgreSQL read replicas.
+
+The unmanaged models (the ``Lines*`` and capacity views, ``EconomicData``,
+...) are only ever read, so their queries are spread round-robin over the
+``replica_*`` databases configured from DATABASE_REPLICA_URLS. A replica
+that lags more than REPLICA_MAX_LAG_SECONDS behind, or cannot be reached,
+is skipped until its next check; without a usable replica, and for
+REPLICA_MAX_LAG_SECONDS after every data change, reads go to the
+primary. Everything else, and any code inside ``primary_only()`` such as
+the ingest receivers, stays on ``default``.
+"""
+
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from .cache import get_data_version
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica_'
+# Seconds a replica's measured lag (or failure) is trusted before it is checked again.
+REPLICA_CHECK_INTERVAL = 5
+
+# Lag is zero while everything received has been replayed, so an idle primary does not look like lag.
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_state = threading.local()
+_health = {}
+_counter = itertools.count()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith(REPLICA_PREFIX)]
+
+
+@contextmanager
+def primary_only():
+    """Send every read of the enclosed block to the primary, e.g. right after writing."""
+    previous = getattr(_state, 'primary_only', False)
+    _state.primary_only = True
+    try:
+        yield
+    finally:
+        _state.primary_only = previous
+
+
+def replica_lag(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute(REPLICA_LAG_SQL)
+        return float(cursor.fetchone()[0])
+
+
+def is_usable(alias):
+    """Whether ``alias`` answered its last lag check within REPLICA_MAX_LAG_SECONDS."""
+    now = time.monotonic()
+    checked, usable = _health.get(alias, (None, False))
+    if checked is not None and now - checked < REPLICA_CHECK_INTERVAL:
+        return usable
+
+    max_lag = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 30)
+    try:
+        lag = replica_lag(alias)
+        usable = lag <= max_lag
+        if not usable:
+            logger.warning(f"Replica {alias} is {lag:.1f} s behind, reading from the primary")
+    except Exception as e:
+        logger.warning(f"Replica {alias} is unavailable: {e}")
+        usable = False
+    _health[alias] = (now, usable)
+    return usable
+
+
+def recently_changed():
+    """
+    Whether the data changed within the lag a usable replica may have.
+
+    Responses are cached under the new data version right away, so until
+    every usable replica must have replayed the change, reads go to the
+    primary rather than caching a replica's older rows under that version.
+    """
+    changed = get_data_version() / 1e9
+    window = getattr(settings, 'REPLICA_MAX_LAG_SECONDS', 30) + REPLICA_CHECK_INTERVAL
+    return time.time() - changed < window
+
+
+def read_alias():
+    """Database to read dashboard data from: the next usable replica, else the primary."""
+    aliases = replica_aliases()
+    if not aliases or getattr(_state, 'primary_only', False) or recently_changed():
+        return DEFAULT_DB_ALIAS
+    start = next(_counter)
+    for i in range(len(aliases)):
+        alias = aliases[(start + i) % len(aliases)]
+        if is_usable(alias):
+            return alias
+    return DEFAULT_DB_ALIAS
+
+
+class ReadReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'geojson' and not model._meta.managed:
+            return read_alias()
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
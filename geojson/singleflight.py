@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Coalescing of concurrent identical computations.
+
+When many clients ask for the same cold response at once, only the first
+request of a process runs the view; the others wait for it and share its
+result. With ``SINGLE_FLIGHT_DATABASE_LOCK`` the leaders of different worker
+processes also take turns through a PostgreSQL advisory lock, so a shared
+cache is filled by a single query instead of one per worker.
+"""
+
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds a request waits for another one computing the same key before computing it itself.
+SINGLE_FLIGHT_TIMEOUT = 30
+ADVISORY_LOCK_POLL = 0.05
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.shared = False
+
+
+def single_flight(key, compute, share=lambda result: True, timeout=SINGLE_FLIGHT_TIMEOUT):
+    """
+    Return ``compute()``, running it once per ``key`` among concurrent callers.
+
+    Waiting callers get the leader's result when ``share(result)`` is true and
+    compute their own otherwise, e.g. for error responses, or when the
+    leader fails or takes longer than ``timeout``.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = Flight()
+
+    if not leader:
+        if flight.done.wait(timeout) and flight.shared:
+            return flight.result
+        return compute()
+
+    try:
+        result = compute()
+        flight.result, flight.shared = result, share(result)
+        return result
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def advisory_lock_id(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big', signed=True)
+
+
+@contextmanager
+def advisory_lock(key, timeout=SINGLE_FLIGHT_TIMEOUT):
+    """
+    Hold the PostgreSQL advisory lock of ``key`` if SINGLE_FLIGHT_DATABASE_LOCK is on.
+
+    Gives up after ``timeout`` seconds and runs the block unlocked, so a stuck
+    worker delays the others but never blocks them.
+    """
+    if not getattr(settings, 'SINGLE_FLIGHT_DATABASE_LOCK', False):
+        yield
+        return
+
+    lock_id = advisory_lock_id(key)
+    deadline = time.monotonic() + timeout
+    acquired = False
+    with connection.cursor() as cursor:
+        while True:
+            cursor.execute('SELECT pg_try_advisory_lock(%s)', [lock_id])
+            acquired = cursor.fetchone()[0]
+            if acquired or time.monotonic() > deadline:
+                break
+            time.sleep(ADVISORY_LOCK_POLL)
+    if not acquired:
+        logger.warning(f"Timed out waiting for advisory lock of {key}")
+    try:
+        yield
+    finally:
+        if acquired:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [lock_id])
@@ -0,0 +1,147 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+import hashlib
+import re
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+# Values of SLOW_QUERY_EXPLAIN: no plan, the estimated plan, or the plan of a second execution.
+EXPLAIN_MODES = ('off', 'plan', 'analyze')
+# Plans kept per process, so a query that is slow on every request is explained once.
+PLAN_CACHE_SIZE = 256
+
+# Literals and parameter lists, replaced so queries differing only in values share a fingerprint.
+FINGERPRINT_SUBSTITUTIONS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\(\s*(?:\?|%s)(?:\s*,\s*(?:\?|%s))*\s*\)'), '(?)'),
+    (re.compile(r'\s+'), ' '),
+]
+# Statements that take row locks, write, or call functions with side effects are never explained.
+UNSAFE_TO_EXPLAIN_RE = re.compile(
+    r'\bFOR\s+(?:NO\s+KEY\s+)?(?:UPDATE|SHARE)\b|\bFOR\s+KEY\s+SHARE\b|\bINTO\b'
+    r'|\b(?:nextval|setval|pg_(?:try_)?advisory\w*|pg_sleep\w*|set_config|random|clock_timestamp'
+    r'|txid_current|pg_notify|dblink\w*)\s*\(',
+    re.IGNORECASE)
+
+_plans = {}
+
+
+def fingerprint(sql):
+    """Hash of ``sql`` with its literal values stripped."""
+    for pattern, replacement in FINGERPRINT_SUBSTITUTIONS:
+        sql = pattern.sub(replacement, sql)
+    return hashlib.md5(sql.strip().lower().encode()).hexdigest()
+
+
+def can_explain(sql):
+    return sql.lstrip().upper().startswith('SELECT') and not UNSAFE_TO_EXPLAIN_RE.search(sql)
+
+
+def explain(connection, sql, params, analyze=False):
+    """
+    ``EXPLAIN`` of a read query, run in a savepoint and rolled back.
+
+    With ``analyze`` the statement runs a second time, for ``EXPLAIN
+    (ANALYZE, BUFFERS)``.
+    """
+    options = '(ANALYZE, BUFFERS) ' if analyze else ''
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN {options}{sql}", params)
+            plan = '\n'.join(row[0] for row in cursor.fetchall())
+        transaction.set_rollback(True, using=connection.alias)
+    return plan
+
+
+class SlowQueryRecorder:
+    """
+    Execute wrapper storing every query slower than ``threshold_ms`` as a ``SlowQuery``.
+
+    ``explain`` is one of ``EXPLAIN_MODES``, by default ``EXPLAIN (ANALYZE,
+    BUFFERS)``. Plans are only captured for SELECT statements without
+    locking clauses or volatile functions, and once per fingerprint and
+    process; later occurrences reuse that plan. The queries issued by the
+    recorder itself are not wrapped.
+    """
+
+    def __init__(self, threshold_ms, buffer_size, explain='analyze', path=''):
+        if explain not in EXPLAIN_MODES:
+            raise ValueError(f"SLOW_QUERY_EXPLAIN must be one of {', '.join(EXPLAIN_MODES)}, not {explain!r}")
+        self.threshold_ms = threshold_ms
+        self.buffer_size = buffer_size
+        self.explain = explain
+        self.path = path
+
+    def __call__(self, execute, sql, params, many, context):
+        if getattr(_state, 'recording', False):
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration_ms = (time.perf_counter() - start) * 1000
+        if duration_ms >= self.threshold_ms:
+            _state.recording = True
+            try:
+                self.record(context['connection'], sql, params, many, duration_ms)
+            except Exception as e:
+                logger.error(f"Error recording slow query: {e}", exc_info=True)
+            finally:
+                _state.recording = False
+        return result
+
+    def record(self, connection, sql, params, many, duration_ms):
+        from .models import SlowQuery
+
+        plan = ''
+        if self.explain != 'off' and not many and can_explain(sql):
+            plan = self.plan_of(connection, sql, params)
+
+        logger.warning(f"Slow query ({duration_ms:.0f} ms) on {self.path or 'no request'}: {sql[:200]}")
+        # Stored on the primary whichever database ran the query.
+        SlowQuery.objects.create(
+            sql=sql, params=repr(params), duration_ms=duration_ms, plan=plan, path=self.path[:255])
+
+        # Keep only the newest ``buffer_size`` entries.
+        stale = (SlowQuery.objects
+                 .order_by('-id').values_list('id', flat=True)[self.buffer_size:self.buffer_size + 1])
+        if stale:
+            SlowQuery.objects.filter(id__lte=stale[0]).delete()
+
+    def plan_of(self, connection, sql, params):
+        key = (connection.alias, self.explain, fingerprint(sql))
+        plan = _plans.get(key)
+        if plan is None:
+            try:
+                plan = explain(connection, sql, params, analyze=self.explain == 'analyze')
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+            if len(_plans) >= PLAN_CACHE_SIZE:
+                _plans.clear()
+            _plans[key] = plan
+        return plan
+
+
+def recorder_for(path=''):
+    """A recorder configured from the SLOW_QUERY_* settings, or None when disabled."""
+    threshold_ms = getattr(settings, 'SLOW_QUERY_THRESHOLD_MS', 0)
+    if not threshold_ms:
+        return None
+    return SlowQueryRecorder(
+        threshold_ms,
+        getattr(settings, 'SLOW_QUERY_BUFFER_SIZE', 200),
+        explain=getattr(settings, 'SLOW_QUERY_EXPLAIN', 'analyze'),
+        path=path,
+    )
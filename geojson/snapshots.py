@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Pre-encoded bodies of the full-dataset endpoints, shared by every worker process.
+
+After each data change the capacity and line responses of every country are
+rendered once, compressed, and written to ``SNAPSHOT_DIR/<version>/``. The
+``current`` file is then replaced in one rename, so workers switch versions
+atomically. Bodies are served straight from those files: they sit once in
+the OS page cache (and go out with sendfile where the server supports it)
+instead of once per worker in the process-local cache.
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import uuid
+from functools import wraps
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.http import FileResponse, HttpRequest
+from django.urls import reverse
+from django.utils.cache import patch_vary_headers
+
+from .cache import brotli, compress, negotiate_encoding
+from .metrics import RESPONSE_CACHE
+from .profiling import timed
+from .routers import primary_only
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'current'
+MANIFEST_FILE = 'manifest.json'
+# Versions kept on disk; the previous one stays for requests that opened it before the switch.
+KEEP_VERSIONS = 2
+
+_manifests = {}
+
+
+def snapshot_dir():
+    return getattr(settings, 'SNAPSHOT_DIR', os.path.join(settings.BASE_DIR, 'snapshots'))
+
+
+def snapshot_views():
+    """``(url name, view, countries)`` of every endpoint whose full response is snapshotted."""
+    from . import views
+
+    return [
+        ('nominal_generator_capacity_json', views.nominal_generator_capacity_json,
+         views.NOMINAL_GENERATOR_MODELS),
+        ('optimal_generator_capacity_json', views.optimal_generator_capacity_json,
+         views.OPTIMAL_GENERATOR_MODELS),
+        ('nominal_storage_capacity_json', views.nominal_storage_capacity_json, views.NOMINAL_STORAGE_MODELS),
+        ('optimal_storage_capacity_json', views.optimal_storage_capacity_json, views.OPTIMAL_STORAGE_MODELS),
+        ('line_data_json', views.line_data_json, views.LINE_MODELS),
+    ]
+
+
+def _write(path, data):
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def build_snapshot(directory):
+    """Render every snapshot endpoint into ``directory``; returns the number of responses stored."""
+    encodings = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    manifest = {}
+    for url_name, view, countries in snapshot_views():
+        # The view itself, without the snapshot and response cache layers.
+        render = inspect.unwrap(view)
+        for country in countries:
+            path = unquote(reverse(url_name, kwargs={'country': country}))
+            request = HttpRequest()
+            request.method = 'GET'
+            request.path = request.path_info = path
+            response = render(request, country)
+            if response.status_code != 200:
+                logger.warning(f"Not snapshotting {path}: status {response.status_code}")
+                continue
+
+            name = hashlib.md5(path.encode()).hexdigest()[:16]
+            files = {}
+            for encoding in encodings:
+                files[encoding] = f'{name}.{encoding}'
+                _write(os.path.join(directory, files[encoding]), compress(response.content, encoding))
+            manifest[path] = {'content_type': response['Content-Type'], 'files': files}
+
+    _write(os.path.join(directory, MANIFEST_FILE), json.dumps(manifest).encode())
+    return len(manifest)
+
+
+def publish_snapshot(version):
+    """Build the snapshot of ``version`` aside, then make it the current one."""
+    root = snapshot_dir()
+    os.makedirs(root, exist_ok=True)
+    staging = os.path.join(root, f'.{version}.{uuid.uuid4().hex}')
+    os.makedirs(staging)
+    try:
+        # Rendered right after an ingest, before replicas necessarily have its rows.
+        with primary_only():
+            stored = build_snapshot(staging)
+        os.replace(staging, os.path.join(root, str(version)))
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+
+    pointer = os.path.join(root, f'.{CURRENT_FILE}.{uuid.uuid4().hex}')
+    _write(pointer, str(version).encode())
+    os.replace(pointer, os.path.join(root, CURRENT_FILE))
+    logger.info(f"Published snapshot {version} with {stored} responses")
+
+    versions = sorted((e for e in os.listdir(root) if e.isdigit()), key=int, reverse=True)
+    for stale in versions[KEEP_VERSIONS:]:
+        shutil.rmtree(os.path.join(root, stale), ignore_errors=True)
+    return stored
+
+
+def withdraw_snapshot():
+    """Stop serving snapshots until the next one is published."""
+    try:
+        os.remove(os.path.join(snapshot_dir(), CURRENT_FILE))
+    except FileNotFoundError:
+        pass
+
+
+def refresh_snapshot(version):
+    """Publish the snapshot of a new data version; a stale snapshot is never left current."""
+    try:
+        publish_snapshot(version)
+    except Exception as e:
+        logger.error(f"Error building snapshot {version}: {e}", exc_info=True)
+        withdraw_snapshot()
+
+
+def current_manifest():
+    """``(directory, manifest)`` of the current snapshot, or ``(None, None)``."""
+    root = snapshot_dir()
+    try:
+        with open(os.path.join(root, CURRENT_FILE)) as file:
+            version = file.read().strip()
+    except FileNotFoundError:
+        return None, None
+
+    directory = os.path.join(root, version)
+    manifest = _manifests.get(directory)
+    if manifest is None:
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE)) as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None, None
+        _manifests.clear()
+        _manifests[directory] = manifest
+    return directory, manifest
+
+
+def snapshot_path(request):
+    """
+    The manifest key of ``request``: its path with the country in lower case.
+
+    Snapshots are rendered for the lower-case country names the models are
+    keyed by, while the frontend asks for e.g. ``United States``.
+    """
+    match = request.resolver_match
+    if match is None or 'country' not in match.kwargs:
+        return request.path
+    kwargs = {**match.kwargs, 'country': match.kwargs['country'].lower()}
+    return unquote(reverse(match.view_name, args=match.args, kwargs=kwargs))
+
+
+def snapshot_response(request):
+    """The snapshotted body of ``request``, or None when there is none."""
+    directory, manifest = current_manifest()
+    entry = manifest.get(snapshot_path(request)) if manifest else None
+    if entry is None:
+        return None
+
+    encoding = negotiate_encoding(request)
+    if encoding not in entry['files']:
+        encoding = 'identity'
+    try:
+        file = open(os.path.join(directory, entry['files'][encoding]), 'rb')
+    except FileNotFoundError:
+        # Pruned after a newer snapshot was published; fall back to the view.
+        return None
+
+    response = FileResponse(file, content_type=entry['content_type'])
+    del response.headers['Content-Disposition']
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def served_from_snapshot(view):
+    """Answer plain GET requests of ``view`` from the current snapshot when it has them."""
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if 'country' in kwargs:
+            kwargs['country'] = kwargs['country'].lower()
+        if request.method == 'GET' and not request.GET:
+            with timed(request, 'snapshot'):
+                response = snapshot_response(request)
+            if response is not None:
+                RESPONSE_CACHE.labels('snapshot').inc()
+                return response
+        return view(request, *args, **kwargs)
+
+    return wrapper
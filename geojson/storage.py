@@ -0,0 +1,27 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+
+from whitenoise.storage import CompressedManifestStaticFilesStorage
+
+
+class ModuleManifestStaticFilesStorage(CompressedManifestStaticFilesStorage):
+    """
+    Hashed, precompressed static files whose ES module imports point at the hashed names.
+
+    ``collectstatic`` rewrites ``import ... from "./x.js"`` in every module, so
+    a changed module changes the name of everything importing it and all of
+    them can be cached forever. WhiteNoise adds the ``.gz``/``.br`` siblings.
+    """
+    support_js_module_import_aggregation = True
+
+    # Vendored OpenLayers copies are hashed but not rewritten: their modules
+    # import each other in cycles, and they reference source maps and JSDoc
+    # type paths that are not shipped.
+    unprocessed_prefixes = ('Libs/', 'v8.1.0-package/')
+
+    def url_converter(self, name, hashed_files, template=None):
+        if name.startswith(self.unprocessed_prefixes):
+            return lambda matchobj: matchobj[0]
+        return super().url_converter(name, hashed_files, template)
@@ -0,0 +1,108 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Compact overview of a country, inlined in the index page.
+
+The page would otherwise show nothing until its modules have loaded and
+their API requests have returned. The summary holds the capacity per
+carrier of each point layer, the extent of the network and the available
+scenarios. It is cached per data version, so rendering the page costs one
+cache lookup.
+"""
+
+from django.contrib.gis.db.models import Extent, GeometryField
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import Sum
+from django.urls import reverse
+
+from .cache import RESPONSE_CACHE_TIMEOUT, get_data_version
+from .partitions import STATISTICS_TABLE_RE, STATISTICS_TABLES_SQL
+from .routers import read_alias
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Requests main.js makes for the initial country, preloaded by the index page.
+PRELOADED_URL_NAMES = [
+    'nominal_generator_capacity_json', 'optimal_generator_capacity_json',
+    'nominal_storage_capacity_json', 'optimal_storage_capacity_json', 'line_data_json',
+]
+
+
+def summary_cache_key(country, version):
+    return f'geojson:summary:{version}:{country.lower()}'
+
+
+def capacity_by_carrier(model, capacity):
+    rows = model.objects.values('carrier').annotate(total=Sum(capacity)).order_by('carrier')
+    return {row['carrier']: row['total'] or 0 for row in rows}
+
+
+def network_extent(models):
+    """``[minx, miny, maxx, maxy]`` covering the geometries of ``models``, or None."""
+    bounds = []
+    for model in models:
+        geometry = next(f for f in model._meta.fields if isinstance(f, GeometryField))
+        extent = model.objects.aggregate(extent=Extent(geometry.name))['extent']
+        if extent:
+            bounds.append(extent)
+    if not bounds:
+        return None
+    return [min(b[0] for b in bounds), min(b[1] for b in bounds),
+            max(b[2] for b in bounds), max(b[3] for b in bounds)]
+
+
+def available_scenarios(country):
+    """Scenarios with economic statistics, which only the United States has."""
+    if country != 'united states':
+        return []
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute(STATISTICS_TABLES_SQL)
+        return sorted(STATISTICS_TABLE_RE.match(row[0])['scenario'] for row in cursor.fetchall()
+                      if STATISTICS_TABLE_RE.match(row[0]))
+
+
+def build_summary(country):
+    from .views import CLUSTER_LAYERS, LINE_MODELS
+
+    country = country.lower()
+    capacity = {}
+    point_models = []
+    for layer, (models, column) in CLUSTER_LAYERS.items():
+        model = models.get(country)
+        if model is not None:
+            capacity[layer] = capacity_by_carrier(model, column)
+            point_models.append(model)
+
+    line_model = LINE_MODELS.get(country)
+    return {
+        'country': country,
+        'capacity': capacity,
+        'extent': network_extent(point_models + ([line_model] if line_model else [])),
+        'scenarios': available_scenarios(country),
+    }
+
+
+def country_summary(country):
+    """The summary of ``country`` for the current data, or None when it cannot be built."""
+    key = summary_cache_key(country, get_data_version())
+    summary = cache.get(key)
+    if summary is None:
+        try:
+            summary = build_summary(country)
+        except Exception as e:
+            logger.error(f"Error building the summary of {country}: {e}", exc_info=True)
+            return None
+        cache.set(key, summary, timeout=RESPONSE_CACHE_TIMEOUT)
+    return summary
+
+
+def preload_links(country):
+    """``Link`` header value preloading the API requests main.js makes for ``country``."""
+    # crossorigin makes the preload match fetch()'s CORS mode, so the browser reuses it.
+    return ', '.join(f'<{reverse(name, kwargs={"country": country})}>; rel=preload; as=fetch; '
+                     f'crossorigin=anonymous' for name in PRELOADED_URL_NAMES)
@@ -2,7 +2,1008 @@
 #
 # SPDX-License-Identifier: AGPL-3.0-or-later
 #
+import gzip
+import hashlib
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from unittest import mock
 
-from django.test import TestCase
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DEFAULT_DB_ALIAS, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from sqlalchemy.engine import URL
 
+from . import cache as response_cache, routers, slow_queries, snapshots, views
+from .classification import choropleth_statistics, jenks_breaks, quantile_breaks
+from .encoders import ApiJsonResponse, round_numbers, round_records
+from .graph import NetworkGraph
+from .line_metrics import line_metrics, refresh_country
+from .middleware import CompressionMiddleware, ServerTimingMiddleware
+from .metrics import metrics_allowed
+from .models import (
+    Bus, ChoroplethStatistics, EconomicData, JSONBus, LineMetrics, LinesCo, LinesUS, NominalGeneratorCapacityCo,
+    NominalGeneratorCapacityUS, NominalStorageCapacityCo, OptimalGeneratorCapacityCo, OptimalStorageCapacityCo,
+    Region, SlowQuery, file_sha256, ingest_json_bus, store_choropleth_statistics, swap_upload,
+)
+from .partitions import (
+    PartitionError, dataset_sources, drop_relation, partition_target, relation_name, replace_partition,
+)
+from .profiling import RequestTimings, record_rows, timed
+from .pypsa_network import PyPSANetwork, build_generators, build_lines, build_storage
+from .regions import aggregate_country, region_sources
+from .singleflight import single_flight
+from .summary import build_summary, country_summary, preload_links, summary_cache_key
+from .timeseries import aggregate, lttb
 
+
+def database_url():
+    """URL of the test database, for the ingest code writing through its own SQLAlchemy engine."""
+    db = connection.settings_dict
+    return URL.create('postgresql', username=db['USER'], password=db['PASSWORD'],
+                      host=db['HOST'] or None, port=db['PORT'] or None, database=db['NAME'])
+
+
+class ClassificationTests(SimpleTestCase):
+    def test_quantile_breaks(self):
+        self.assertEqual(quantile_breaks(np.arange(101), classes=4), [0, 25, 50, 75, 100])
+
+    def test_jenks_breaks_separate_clusters(self):
+        values = [1, 1.1, 1.2, 5, 5.1, 10, 10.2]
+        self.assertEqual(jenks_breaks(values, classes=3), [1, 1.2, 5.1, 10.2])
+
+    def test_jenks_breaks_of_constant_values(self):
+        self.assertEqual(jenks_breaks([3, 3, 3]), [3, 3])
+
+    def test_statistics_ignore_missing_values(self):
+        df = pd.DataFrame({'carrier': ['solar', 'solar', 'solar', 'onwind'],
+                           'cf': [0.1, 'n/a', np.inf, 0.3]})
+        stats = {s['carrier']: s for s in choropleth_statistics(df, variables=['cf'])}
+        self.assertEqual(stats['solar']['count'], 1)
+        self.assertEqual(stats['onwind']['min_value'], 0.3)
+
+
+class RoundingTests(SimpleTestCase):
+    def test_round_numbers(self):
+        data = {'p_nom': 123.456789, 'count': 7, 'geom': [1.23456789, 2.0],
+                'x': 0.0123456789, 'nested': [{'s_nom': 9.87654321, 'capital_cost': 98765.4321}]}
+        self.assertEqual(round_numbers(data, precision=3, coord_precision=2, field_precision={'x': 4}),
+                         {'p_nom': 123.0, 'count': 7, 'geom': [1.23, 2.0], 'x': 0.0123,
+                          'nested': [{'s_nom': 9.88, 'capital_cost': 98765.4321}]})
+
+    def test_unnamed_floats_keep_full_precision(self):
+        data = {'carrier': 'solar', 'usdpt': 123456.789012, 'cf': 0.123456789}
+        self.assertEqual(round_numbers(dict(data), precision=3), data)
+        self.assertEqual(round_records([dict(data)], precision=3), [data])
+        self.assertEqual(round_numbers({'usdpt': 123456.789012}, precision=3, significant_fields=('usdpt',)),
+                         {'usdpt': 123000.0})
+
+    def test_round_records_matches_round_numbers(self):
+        rng = np.random.default_rng(0)
+        rows = [{'name': f'g{i}', 'p_nom': float(v), 'cost': None if i % 3 else float(v) * 1e-7,
+                 'x': float(v) / 7, 'geom': (float(v), -float(v) / 3),
+                 'line_geom': [(float(v), 1 / 3)] * (i % 4 + 1)}
+                for i, v in enumerate(rng.lognormal(3, 4, 200))]
+        expected = round_numbers(rows, field_precision={'x': 6})
+        self.assertEqual(json.dumps(round_records(rows, field_precision={'x': 6})), json.dumps(expected))
+
+    def test_round_records_keeps_missing_geometries(self):
+        rows = [{'geom': None}, {'geom': (1.23456789, 2.0)}]
+        self.assertEqual(round_records(rows, coord_precision=3), [{'geom': None}, {'geom': [1.235, 2.0]}])
+
+
+@override_settings(SINGLE_FLIGHT_DATABASE_LOCK=False)
+class ResponseCacheTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        override = override_settings(DATA_VERSION_FILE=os.path.join(root, 'data_version'),
+                                     SNAPSHOT_DIR=os.path.join(root, 'snapshots'),
+                                     EXPORT_CACHE_DIR=os.path.join(root, 'exports'))
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+        self.calls = 0
+
+        @response_cache.cached_api_response
+        def view(request, status=200):
+            self.calls += 1
+            return ApiJsonResponse({'values': list(range(500))}, status=status)
+
+        self.view = view
+        self.factory = RequestFactory()
+
+    def get(self, accept_encoding, path='/api/test/', **kwargs):
+        return self.view(self.factory.get(path, HTTP_ACCEPT_ENCODING=accept_encoding), **kwargs)
+
+    def test_every_coding_is_served_from_one_rendering(self):
+        identity = self.get('identity')
+        gzipped = self.get('gzip, deflate')
+        self.assertEqual(self.calls, 1)
+        self.assertNotIn('Content-Encoding', identity)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), identity.content)
+        self.assertEqual(gzipped['Content-Length'], str(len(gzipped.content)))
+        self.assertIn('Accept-Encoding', gzipped['Vary'])
+
+    def test_negotiation(self):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='br;q=0, gzip;q=0.5, deflate')
+        self.assertEqual(response_cache.accepted_encodings(request), {'gzip', 'deflate'})
+        self.assertEqual(response_cache.negotiate_encoding(request), 'gzip')
+        with mock.patch.object(response_cache, 'brotli', None):
+            self.assertEqual(response_cache.negotiate_encoding(self.factory.get('/', HTTP_ACCEPT_ENCODING='*')),
+                             'gzip')
+        self.assertEqual(response_cache.negotiate_encoding(self.factory.get('/')), 'identity')
+
+    def test_a_data_change_invalidates_the_cache(self):
+        self.get('gzip')
+        self.get('gzip')
+        self.assertEqual(self.calls, 1)
+        with mock.patch('geojson.snapshots.refresh_snapshot'):
+            response_cache.bump_data_version()
+        self.get('gzip')
+        self.assertEqual(self.calls, 2)
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.get('gzip', status=404).status_code, 404)
+        self.get('gzip', status=404)
+        self.assertEqual(self.calls, 2)
+
+    def test_compression_middleware(self):
+        request = self.factory.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        body = b'x' * 1000
+
+        def compressed(response):
+            return CompressionMiddleware(lambda request: response)(request)
+
+        response = compressed(HttpResponse(body, headers={'ETag': '"abc"'}))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), body)
+        self.assertEqual(response['ETag'], 'W/"abc"')
+        self.assertNotIn('Content-Encoding', compressed(HttpResponse(b'short')))
+        self.assertNotIn('Content-Encoding', compressed(HttpResponse(body, content_type='application/zip')))
+        cached = self.get('gzip')
+        self.assertIs(compressed(cached), cached)
+
+
+class ServerTimingTests(SimpleTestCase):
+    def respond(self, request):
+        with timed(request, 'encode'):
+            time.sleep(0.01)
+        record_rows(request, 3)
+        return HttpResponse(b'[1,2,3]')
+
+    @override_settings(SERVER_TIMING=True)
+    def test_phases_rows_and_size_are_reported(self):
+        response = ServerTimingMiddleware(self.respond)(RequestFactory().get('/api/test/'))
+        metrics = {metric.split(';')[0]: metric for metric in response['Server-Timing'].split(', ')}
+        self.assertEqual(set(metrics), {'encode', 'total', 'rows', 'bytes'})
+        self.assertGreaterEqual(float(metrics['encode'].split('dur=')[1]), 10)
+        self.assertEqual(metrics['rows'], 'rows;desc="3"')
+        self.assertEqual(metrics['bytes'], 'bytes;desc="7"')
+
+    def test_database_time_is_not_counted_twice(self):
+        request = RequestFactory().get('/')
+        request.timings = timings = RequestTimings()
+        with timed(request, 'materialize'):
+            timings.query_wrapper(lambda *args: time.sleep(0.02), 'SELECT 1', None, False, {})
+        self.assertEqual(timings.queries, 1)
+        self.assertGreaterEqual(timings.db_time, 0.02)
+        self.assertLess(timings.phases['materialize'], 10)
+
+    @override_settings(SERVER_TIMING=False)
+    def test_disabled(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ServerTimingMiddleware(self.respond)
+
+
+class ModuleManifestStorageTests(SimpleTestCase):
+    FILES = {
+        'js/main.js': 'import { a } from "./util.js";\nconsole.log(a);\n// ' + 'padding ' * 200 + '\n',
+        'js/util.js': 'export const a = 1;\n',
+        'Libs/ol.js': 'import dep from "./dep.js";\n',
+        'Libs/dep.js': 'export default 1;\n',
+    }
+
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        source = os.path.join(root, 'static')
+        for name, content in self.FILES.items():
+            os.makedirs(os.path.dirname(os.path.join(source, name)), exist_ok=True)
+            with open(os.path.join(source, name), 'w') as file:
+                file.write(content)
+
+        self.static_root = os.path.join(root, 'collected')
+        override = override_settings(
+            STATIC_ROOT=self.static_root, STATICFILES_DIRS=[source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STORAGES={'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                      'staticfiles': {'BACKEND': 'geojson.storage.ModuleManifestStaticFilesStorage'}})
+        override.enable()
+        self.addCleanup(override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        with open(os.path.join(self.static_root, 'staticfiles.json')) as file:
+            self.paths = json.load(file)['paths']
+
+    def read(self, name):
+        with open(os.path.join(self.static_root, self.paths[name])) as file:
+            return file.read()
+
+    def test_module_imports_point_at_hashed_names(self):
+        self.assertNotEqual(self.paths['js/util.js'], 'js/util.js')
+        self.assertIn(f'from "./{os.path.basename(self.paths["js/util.js"])}"', self.read('js/main.js'))
+        self.assertTrue(os.path.exists(os.path.join(self.static_root, self.paths['js/main.js'] + '.gz')))
+
+    def test_vendored_libraries_are_hashed_but_not_rewritten(self):
+        self.assertNotEqual(self.paths['Libs/ol.js'], 'Libs/ol.js')
+        self.assertEqual(self.read('Libs/ol.js'), self.FILES['Libs/ol.js'])
+
+
+def write_network(path):
+    """A small network in the layout of PyPSA's netCDF export, omitting attributes at their default."""
+    import xarray as xr
+
+    xr.Dataset({
+        'buses_x': ('buses_i', [-75.0, -74.0, -73.0]),
+        'buses_y': ('buses_i', [4.0, 5.0, 6.0]),
+        'buses_v_nom': ('buses_i', [230.0, 230.0, 115.0]),
+        'lines_bus0': ('lines_i', ['b1', 'b2', 'b1']),
+        'lines_bus1': ('lines_i', ['b2', 'b3', 'unknown']),
+        'lines_s_nom': ('lines_i', [100.0, 200.0, 50.0]),
+        'lines_geometry': ('lines_i', ['', 'LINESTRING(0 0, 1 1)', '']),
+        'generators_bus': ('generators_i', ['b1', 'b2', 'unknown']),
+        'generators_carrier': ('generators_i', ['solar', 'onwind', 'solar']),
+        'generators_p_nom': ('generators_i', [10.0, 20.0, 5.0]),
+        'storage_units_bus': ('storage_units_i', ['b1', 'b1', 'b2']),
+        'storage_units_carrier': ('storage_units_i', ['battery', 'battery', 'PHS']),
+        'storage_units_p_nom_opt': ('storage_units_i', [1.0, 2.0, 3.0]),
+        'generators_t_p': (('snapshots', 'generators_t_p_i'), [[1.0, 2.0], [3.0, 4.0]]),
+    }, coords={
+        'buses_i': ['b1', 'b2', 'b3'],
+        'lines_i': ['l1', 'l2', 'l3'],
+        'generators_i': ['g1', 'g2', 'g3'],
+        'storage_units_i': ['s1', 's2', 's3'],
+        'generators_t_p_i': ['g1', 'g2'],
+        'snapshots': pd.date_range('2030-01-01', periods=2, freq='h'),
+    }).to_netcdf(path)
+
+
+class PyPSANetworkTests(SimpleTestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, 'network.nc')
+        write_network(path)
+        self.network = PyPSANetwork(path)
+        self.addCleanup(self.network.close)
+
+    def test_omitted_attributes_take_the_pypsa_default(self):
+        self.assertEqual(list(self.network.attribute('lines', 'carrier')), ['AC'] * 3)
+        self.assertTrue(np.isinf(self.network.attribute('lines', 's_nom_max')).all())
+        self.assertEqual(list(self.network.attribute('lines', 's_nom')), [100.0, 200.0, 50.0])
+
+    def test_lines(self):
+        lines = build_lines(self.network, ['Line', 'bus0', 'bus1', 'v_nom', 's_nom', 'carrier', 'geom'], 'geom')
+        # l3 is attached to a bus the network does not have.
+        self.assertEqual(lines.to_dict('records'), [
+            {'Line': 'l1', 'bus0': 'b1', 'bus1': 'b2', 'v_nom': 230.0, 's_nom': 100.0, 'carrier': 'AC',
+             'geom': 'LINESTRING(-75.0 4.0, -74.0 5.0)'},
+            {'Line': 'l2', 'bus0': 'b2', 'bus1': 'b3', 'v_nom': 230.0, 's_nom': 200.0, 'carrier': 'AC',
+             'geom': 'LINESTRING(0 0, 1 1)'},
+        ])
+
+    def test_generators_take_the_attributes_of_their_bus(self):
+        generators = build_generators(self.network, ['id', 'Bus', 'carrier', 'p_nom', 'v_nom', 'x', 'y', 'geom'],
+                                      'p_nom')
+        self.assertEqual(generators.to_dict('records'), [
+            {'id': 'g1', 'Bus': 'b1', 'carrier': 'solar', 'p_nom': 10.0, 'v_nom': 230.0, 'x': -75.0, 'y': 4.0,
+             'geom': 'POINT(-75.0 4.0)'},
+            {'id': 'g2', 'Bus': 'b2', 'carrier': 'onwind', 'p_nom': 20.0, 'v_nom': 230.0, 'x': -74.0, 'y': 5.0,
+             'geom': 'POINT(-74.0 5.0)'},
+        ])
+
+    def test_storage_is_summed_per_bus_and_carrier(self):
+        storage = build_storage(self.network, ['Bus', 'carrier', 'p_nom_opt', 'geom'], 'p_nom_opt')
+        self.assertEqual(storage.to_dict('records'), [
+            {'Bus': 'b1', 'carrier': 'battery', 'p_nom_opt': 3.0, 'geom': 'POINT(-75.0 4.0)'},
+            {'Bus': 'b2', 'carrier': 'PHS', 'p_nom_opt': 3.0, 'geom': 'POINT(-74.0 5.0)'},
+        ])
+
+    def test_series(self):
+        snapshots, names, values = self.network.series('generators', 'p')
+        self.assertEqual(list(names), ['g1', 'g2'])
+        self.assertEqual(len(snapshots), 2)
+        self.assertEqual(np.asarray(values[:, 1]).tolist(), [2.0, 4.0])
+        self.assertIsNone(self.network.series('generators', 'q'))
+
+
+class TimeseriesTests(SimpleTestCase):
+    def test_lttb_keeps_ends_and_spikes(self):
+        time_axis = np.arange(1000, dtype=float)
+        values = np.zeros(1000)
+        values[500] = 100
+        keep = lttb(time_axis, values, 20)
+        self.assertEqual(len(keep), 20)
+        self.assertEqual((keep[0], keep[-1]), (0, 999))
+        self.assertIn(500, keep)
+        self.assertTrue(np.all(np.diff(keep) > 0))
+
+    def test_lttb_below_threshold_keeps_everything(self):
+        self.assertEqual(lttb(np.arange(5.0), np.arange(5.0), 10).tolist(), [0, 1, 2, 3, 4])
+
+    def test_aggregate(self):
+        values = np.arange(12, dtype=float).reshape(2, 6)
+        starts, means = aggregate(values, 3, 'mean')
+        self.assertEqual(starts.tolist(), [0, 2, 4])
+        self.assertEqual(means.tolist(), [[0.5, 2.5, 4.5], [6.5, 8.5, 10.5]])
+        self.assertEqual(aggregate(values, 3, 'max')[1].tolist(), [[1, 3, 5], [7, 9, 11]])
+
+
+class NetworkGraphTests(SimpleTestCase):
+    def setUp(self):
+        # a - b - c - d, a parallel cheaper a - b, a - d without weights, and an island e - f.
+        self.graph = NetworkGraph(
+            ['ab', 'ab2', 'bc', 'cd', 'ad', 'ef'],
+            np.array(['a', 'a', 'b', 'c', 'a', 'e'], dtype=object),
+            np.array(['b', 'b', 'c', 'd', 'd', 'f'], dtype=object),
+            {'x': np.array([2.0, 1.0, 1.0, 1.0, math.nan, 1.0]),
+             'length': np.array([1.0, 1.0, 1.0, 1.0, 1.0, 1.0])})
+
+    def test_shortest_path_uses_the_cheapest_parallel_line(self):
+        self.assertEqual(self.graph.shortest_path('a', 'c'), (['a', 'b', 'c'], ['ab2', 'bc'], 2.0))
+
+    def test_lines_without_weight_are_not_crossed(self):
+        self.assertEqual(self.graph.shortest_path('a', 'd', 'x')[1], ['ab2', 'bc', 'cd'])
+        self.assertEqual(self.graph.shortest_path('a', 'd', 'length')[1], ['ad'])
+
+    def test_unreachable_target(self):
+        self.assertIsNone(self.graph.shortest_path('a', 'e'))
+        island = NetworkGraph(['gh'], np.array(['g'], dtype=object), np.array(['h'], dtype=object),
+                              {'x': np.array([math.nan]), 'length': np.array([1.0])})
+        self.assertIsNone(island.shortest_path('g', 'h', 'x'))
+
+    def test_neighbors_and_components(self):
+        self.assertEqual(self.graph.neighbors('b', hops=2), {'a': 1, 'c': 1, 'd': 2})
+        self.assertEqual(self.graph.components(), [['a', 'b', 'c', 'd'], ['e', 'f']])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_computation(self):
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(5)
+            return 'result'
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(single_flight('key', compute)))
+                   for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['result'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_unshared_results_are_recomputed(self):
+        self.assertEqual(single_flight('error', lambda: 'error', share=lambda result: False), 'error')
+
+
+@mock.patch.object(routers, 'replica_aliases', lambda: ['replica_0'])
+class ReplicaRouterTests(SimpleTestCase):
+    def old_data(self):
+        return mock.patch.object(routers, 'get_data_version', lambda: (time.time() - 3600) * 1e9)
+
+    def test_reads_go_to_a_usable_replica(self):
+        with self.old_data(), mock.patch.object(routers, 'is_usable', lambda alias: True):
+            self.assertEqual(routers.read_alias(), 'replica_0')
+            self.assertEqual(routers.ReadReplicaRouter().db_for_read(LinesUS), 'replica_0')
+            self.assertEqual(routers.ReadReplicaRouter().db_for_read(Region), DEFAULT_DB_ALIAS)
+
+    def test_primary_when_no_replica_is_usable(self):
+        with self.old_data(), mock.patch.object(routers, 'is_usable', lambda alias: False):
+            self.assertEqual(routers.read_alias(), DEFAULT_DB_ALIAS)
+
+    def test_primary_inside_primary_only(self):
+        with self.old_data(), mock.patch.object(routers, 'is_usable', lambda alias: True):
+            with routers.primary_only():
+                self.assertEqual(routers.read_alias(), DEFAULT_DB_ALIAS)
+
+    def test_primary_right_after_a_data_change(self):
+        with mock.patch.object(routers, 'get_data_version', time.time_ns), \
+                mock.patch.object(routers, 'is_usable', lambda alias: True):
+            self.assertEqual(routers.read_alias(), DEFAULT_DB_ALIAS)
+
+
+class SnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.addCleanup(snapshots._manifests.clear)
+        override = override_settings(SNAPSHOT_DIR=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        # The layout build_snapshot writes, keyed by the lower-case country.
+        directory = os.path.join(self.root, '1')
+        os.makedirs(directory)
+        with open(os.path.join(directory, 'lines.identity'), 'wb') as file:
+            file.write(b'[]')
+        manifest = {'/api/line-data/united states/': {
+            'content_type': 'application/json', 'files': {'identity': 'lines.identity'}}}
+        with open(os.path.join(directory, snapshots.MANIFEST_FILE), 'w') as file:
+            json.dump(manifest, file)
+        with open(os.path.join(self.root, snapshots.CURRENT_FILE), 'w') as file:
+            file.write('1')
+
+    def test_serves_the_country_as_the_frontend_spells_it(self):
+        response = self.client.get('/api/line-data/United%20States/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'[]')
+
+    def test_falls_back_without_a_current_snapshot(self):
+        snapshots.withdraw_snapshot()
+        self.assertEqual(snapshots.current_manifest(), (None, None))
+
+
+@override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'], METRICS_TOKEN='secret')
+class MetricsAccessTests(SimpleTestCase):
+    def test_outside_clients_are_refused(self):
+        self.assertEqual(self.client.get('/metrics', REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+    def test_allowed_networks_and_token(self):
+        factory = RequestFactory()
+        self.assertTrue(metrics_allowed(factory.get('/metrics', REMOTE_ADDR='10.1.2.3')))
+        self.assertTrue(metrics_allowed(factory.get('/metrics', REMOTE_ADDR='203.0.113.7',
+                                                    HTTP_AUTHORIZATION='Bearer secret')))
+        self.assertFalse(metrics_allowed(factory.get('/metrics', REMOTE_ADDR='203.0.113.7',
+                                                     HTTP_AUTHORIZATION='Bearer wrong')))
+
+
+class PartitionTests(TestCase):
+    SOURCE = 'test_lines_source'
+
+    def create_lines(self, table, lines):
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE "{table}" ("Line" text, bus0 text, bus1 text, s_nom float, '
+                           f'geom geometry(LINESTRING, 4326))')
+            for line in lines:
+                cursor.execute(f'INSERT INTO "{table}" VALUES (%s, %s, %s, 1.0, '
+                               f"ST_GeomFromText('LINESTRING(0 0, 1 1)', 4326))", [line, 'a', 'b'])
+
+    def test_relation_names_fit_postgresql(self):
+        name = relation_name('dataset', 'optimal_generators', 'united states', 'x' * 60)
+        self.assertLessEqual(len(name), 63)
+        self.assertTrue(name.startswith('dataset__optimal_generators__united_states__'))
+
+    def test_only_upload_tables_are_consolidated(self):
+        self.assertEqual(dataset_sources(), {'lines': {'united states': LinesUS},
+                                             'economic_statistics': {'united states': EconomicData}})
+
+    def test_tables_other_views_select_from_are_not_dropped(self):
+        self.create_lines(self.SOURCE, ['l1'])
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE VIEW test_lines_dependent AS SELECT "Line" FROM "{self.SOURCE}"')
+            with self.assertRaisesMessage(PartitionError, 'test_lines_dependent'):
+                drop_relation(cursor, self.SOURCE)
+
+    def test_swap_upload_replaces_the_partition(self):
+        self.create_lines(self.SOURCE, ['l1', 'l2'])
+        leaf = replace_partition('lines', 'united states', 'base', self.SOURCE, LinesUS)
+        self.assertEqual(leaf, 'dataset__lines__united_states__base')
+        self.assertEqual(sorted(LinesUS.objects.values_list('Line', flat=True)), ['l1', 'l2'])
+
+        table_name = LinesUS._meta.db_table
+        target = partition_target(table_name)
+        self.assertEqual(target, ('lines', 'united states', 'base', LinesUS))
+        self.create_lines(f'{table_name}_upload', ['l3'])
+        self.assertEqual(swap_upload(table_name, target), leaf)
+        self.assertEqual(list(LinesUS.objects.values_list('Line', flat=True)), ['l3'])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT to_regclass(%s)', [f'{table_name}_upload'])
+            self.assertIsNone(cursor.fetchone()[0])
+
+    def test_statistics_of_a_partitioned_upload_keep_its_name(self):
+        self.create_lines(self.SOURCE, ['l1'])
+        replace_partition('lines', 'united states', 'base', self.SOURCE, LinesUS)
+        features = [{'type': 'Feature',
+                     'geometry': {'type': 'LineString', 'coordinates': [[0, 0], [1, i]]},
+                     'properties': {'Line': f'l{i}', 'bus0': 'a', 'bus1': 'b', 's_nom': 1.0,
+                                    'carrier': 'AC', 'cf': i / 10}}
+                    for i in range(1, 4)]
+        upload = SimpleUploadedFile('lines.geojson', json.dumps(
+            {'type': 'FeatureCollection', 'features': features}).encode())
+
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        # The upload is written by a separate connection, so it is committed before the swap reads it.
+        with override_settings(MEDIA_ROOT=media), mock.patch('geojson.models.conn_str', database_url()), \
+                mock.patch('geojson.models.geo'), mock.patch('geojson.models.update_derived_tables'), \
+                mock.patch('geojson.models.bump_data_version'):
+            bus = Bus.objects.create(name='network_lines_view_US', geojson_file=upload)
+        bus.refresh_from_db()
+        self.assertIsNotNone(bus.loaded_time)
+        self.assertEqual(sorted(LinesUS.objects.values_list('Line', flat=True)), ['l1', 'l2', 'l3'])
+        self.assertTrue(ChoroplethStatistics.objects.filter(table_name=LinesUS._meta.db_table).exists())
+
+        with mock.patch.dict(views.SCENARIO_FEATURE_TABLES, {'united states': LinesUS._meta.db_table}):
+            response = self.client.get('/api/stats/united%20states/base/AC/cf/',
+                                       HTTP_ACCEPT_ENCODING='identity')
+        self.assertEqual(response.status_code, 200)
+        stats = json.loads(response.content)
+        self.assertEqual((stats['count'], stats['min_value'], stats['max_value']), (3, 0.1, 0.3))
+
+
+class UploadDedupTests(TestCase):
+    CONTENT = json.dumps({'columns': ['name', 'value'], 'data': [['a', 1], ['b', 2]]}).encode()
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        override = override_settings(MEDIA_ROOT=media)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Uploads are written through their own engine; the table is created on the test connection instead.
+        for patcher in (mock.patch('geojson.models.create_engine'), mock.patch('geojson.models.bump_data_version')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(pd.DataFrame, 'to_sql', autospec=True, side_effect=self.create_upload_table)
+        self.to_sql = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def create_upload_table(frame, name, **kwargs):
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS "{name}" (name text, value integer)')
+
+    def upload(self, content=CONTENT):
+        return JSONBus.objects.create(name='dedup_test', json_file=SimpleUploadedFile('data.json', content))
+
+    def test_file_sha256(self):
+        path = os.path.join(tempfile.mkdtemp(), 'data.json')
+        self.addCleanup(shutil.rmtree, os.path.dirname(path))
+        with open(path, 'wb') as file:
+            file.write(self.CONTENT)
+        self.assertEqual(file_sha256(path), hashlib.sha256(self.CONTENT).hexdigest())
+
+    def test_identical_uploads_are_loaded_once(self):
+        first = self.upload()
+        second = self.upload()
+        self.assertEqual(self.to_sql.call_count, 1)
+        for instance in (first, second):
+            instance.refresh_from_db()
+            self.assertEqual(instance.content_hash, hashlib.sha256(self.CONTENT).hexdigest())
+            self.assertIsNotNone(instance.loaded_time)
+        self.assertGreaterEqual(second.loaded_time, first.loaded_time)
+
+    def test_changed_or_forced_uploads_are_loaded(self):
+        first = self.upload()
+        self.upload(self.CONTENT.replace(b'"b"', b'"c"'))
+        self.assertEqual(self.to_sql.call_count, 2)
+        self.assertTrue(ingest_json_bus(first, force=True))
+        self.assertEqual(self.to_sql.call_count, 3)
+
+
+class ApiTestCase(TestCase):
+    """Database tests of the API, each with an empty response cache and its own data version."""
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(DATA_VERSION_FILE=os.path.join(self.root, 'data_version'),
+                                     SNAPSHOT_DIR=os.path.join(self.root, 'snapshots'),
+                                     EXPORT_CACHE_DIR=os.path.join(self.root, 'exports'))
+        override.enable()
+        self.addCleanup(override.disable)
+        cache.clear()
+
+    def create_table(self, table, columns, rows):
+        """Create ``table`` with ``columns`` (``{name: SQL type}``); geometries in ``rows`` are WKT."""
+        values = ', '.join('ST_GeomFromText(%s, 4326)' if sql_type.startswith('geometry') else '%s'
+                           for sql_type in columns.values())
+        with connection.cursor() as cursor:
+            cursor.execute(f'CREATE TABLE "{table}" ('
+                           f'{", ".join(f"{c} {t}" for c, t in columns.items())})')
+            for row in rows:
+                cursor.execute(f'INSERT INTO "{table}" VALUES ({values})', row)
+
+    def create_model_table(self, model, rows):
+        """Create the relation of an unmanaged ``model`` holding ``rows``, other fields left empty."""
+        with connection.schema_editor() as editor:
+            editor.create_model(model)
+        empty = {'FloatField': 0.0, 'IntegerField': 0, 'BooleanField': False}
+        defaults = {field.name: None if field.null else empty.get(field.get_internal_type(), '')
+                    for field in model._meta.concrete_fields}
+        model.objects.bulk_create([model(**{**defaults, **row}) for row in rows])
+
+    def get_json(self, path, **params):
+        response = self.client.get(path, params, HTTP_ACCEPT_ENCODING='identity')
+        return response.status_code, json.loads(response.content)
+
+
+class ScenarioFeatureTests(ApiTestCase):
+    URL = '/api/scenario-features/united%20states/base/'
+
+    def setUp(self):
+        super().setUp()
+        self.create_table('geojson_generators_combined_data_US_base', {
+            'name': 'text', 'carrier': 'text', 'p_nom': 'float', 'cf': 'float', 'geom': 'geometry(POINT, 4326)',
+        }, [
+            ('g1', 'solar', 10.0, 0.2, 'POINT(-100 40)'),
+            ('g2', 'onwind', 20.0, 0.3, 'POINT(-90 35)'),
+            ('g3', 'solar', 30.0, 0.25, 'POINT(-80 30)'),
+        ])
+
+    def test_pages_follow_the_cursor(self):
+        status, page = self.get_json(self.URL, limit=2)
+        self.assertEqual(status, 200)
+        self.assertEqual([f['id'] for f in page['features']], ['g1', 'g2'])
+        self.assertEqual(page['next_cursor'], 'g2')
+        self.assertEqual(page['features'][0]['geometry'], {'type': 'Point', 'coordinates': [-100, 40]})
+
+        status, page = self.get_json(self.URL, limit=2, cursor='g2')
+        self.assertEqual([f['id'] for f in page['features']], ['g3'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_bbox_carrier_and_properties(self):
+        status, page = self.get_json(self.URL, bbox='-105,32,-85,45', carrier='solar,onwind', properties='cf')
+        self.assertEqual(status, 200)
+        self.assertEqual([f['properties'] for f in page['features']],
+                         [{'cf': 0.2, 'name': 'g1'}, {'cf': 0.3, 'name': 'g2'}])
+
+        status, page = self.get_json(self.URL, carrier='onwind')
+        self.assertEqual([f['id'] for f in page['features']], ['g2'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get_json(self.URL, properties='unknown')[0], 400)
+        self.assertEqual(self.get_json(self.URL, bbox='1,2,3')[0], 400)
+        self.assertEqual(self.get_json('/api/scenario-features/united%20states/missing/')[0], 404)
+        self.assertEqual(self.get_json('/api/scenario-features/united%20states/a-b/')[0], 400)
+        self.assertEqual(self.get_json('/api/scenario-features/nigeria/base/')[0], 400)
+
+
+class ChoroplethStatisticsApiTests(ApiTestCase):
+    def test_serves_the_statistics_stored_at_ingest(self):
+        df = pd.DataFrame({'carrier': ['solar'] * 4 + ['onwind'],
+                           'cf': [0.1, 0.2, 0.3, 0.4, 0.5], 'usdpt': [1, 2, 3, 4, 5]})
+        store_choropleth_statistics('geojson_generators_combined_data_US_base', df)
+
+        status, stats = self.get_json('/api/stats/united%20states/base/solar/cf/')
+        self.assertEqual(status, 200)
+        self.assertEqual((stats['carrier'], stats['variable'], stats['count']), ('solar', 'cf', 4))
+        self.assertEqual((stats['min_value'], stats['max_value']), (0.1, 0.4))
+        self.assertEqual(stats['quantile_breaks'][0], 0.1)
+        self.assertEqual(sum(stats['histogram']['counts']), 4)
+
+    def test_missing_statistics(self):
+        self.assertEqual(self.get_json('/api/stats/united%20states/base/solar/crt/')[0], 404)
+        self.assertEqual(self.get_json('/api/stats/united%20states/a-b/solar/cf/')[0], 400)
+        self.assertEqual(self.get_json('/api/stats/nigeria/base/solar/cf/')[0], 400)
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        slow_queries._plans.clear()
+        self.addCleanup(slow_queries._plans.clear)
+
+    def test_fingerprints_ignore_values(self):
+        self.assertEqual(slow_queries.fingerprint("SELECT * FROM t WHERE a = 1 AND b IN (%s, %s)"),
+                         slow_queries.fingerprint("select *  from t where a = 22 and b in (%s)"))
+        self.assertNotEqual(slow_queries.fingerprint("SELECT a FROM t"), slow_queries.fingerprint("SELECT b FROM t"))
+
+    def test_only_side_effect_free_reads_are_explained(self):
+        self.assertTrue(slow_queries.can_explain('SELECT * FROM "geojson_region" WHERE id = %s'))
+        for sql in ('SELECT * FROM t FOR UPDATE', "SELECT nextval('s')", 'SELECT pg_advisory_lock(1)',
+                    'SELECT * INTO copy FROM t', 'UPDATE t SET a = 1'):
+            self.assertFalse(slow_queries.can_explain(sql), sql)
+
+    def test_slow_queries_are_stored_with_one_plan_per_fingerprint(self):
+        recorder = slow_queries.SlowQueryRecorder(0, buffer_size=10, path='/api/test/')
+        with mock.patch.object(slow_queries, 'explain', wraps=slow_queries.explain) as explain, \
+                connection.execute_wrapper(recorder), connection.cursor() as cursor:
+            cursor.execute('SELECT count(*) FROM geojson_region WHERE id > %s', [1])
+            cursor.execute('SELECT count(*) FROM geojson_region WHERE id > %s', [2])
+
+        self.assertEqual(explain.call_count, 1)
+        queries = list(SlowQuery.objects.order_by('id'))
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(queries[0].path, '/api/test/')
+        self.assertIn('actual time', queries[0].plan)
+        self.assertEqual(queries[0].plan, queries[1].plan)
+
+    def test_only_the_newest_queries_are_kept(self):
+        recorder = slow_queries.SlowQueryRecorder(0, buffer_size=2, explain='off')
+        with connection.execute_wrapper(recorder), connection.cursor() as cursor:
+            for value in range(4):
+                cursor.execute('SELECT %s', [value])
+        self.assertEqual([q.params for q in SlowQuery.objects.order_by('id')], ['[2]', '[3]'])
+        self.assertEqual(SlowQuery.objects.filter(plan='').count(), 2)
+
+    @override_settings(SLOW_QUERY_THRESHOLD_MS=0)
+    def test_disabled(self):
+        self.assertIsNone(slow_queries.recorder_for('/'))
+
+
+class IdentifyTests(ApiTestCase):
+    URL = '/api/identify/united%20states/'
+
+    def setUp(self):
+        super().setUp()
+        self.create_model_table(NominalGeneratorCapacityUS, [
+            {'id': 'g1', 'Bus': 'b1', 'carrier': 'solar', 'p_nom': 10.0, 'geom': 'POINT(-100 40)'},
+            {'id': 'g2', 'Bus': 'b2', 'carrier': 'onwind', 'p_nom': 20.0, 'geom': 'POINT(-90 35)'},
+        ])
+        self.create_model_table(LinesUS, [
+            {'Line': 'l1', 'bus0': 'b1', 'bus1': 'b3', 'geom': 'LINESTRING(-100 40.1, -99 40.1)'},
+        ])
+
+    def test_nearest_features_of_each_layer_by_distance(self):
+        status, result = self.get_json(self.URL, lon=-100, lat=40, layers='lines,nominal_generators', limit=1)
+        self.assertEqual(status, 200)
+        features = result['features']
+        self.assertEqual([(f['properties']['layer'], f['properties'].get('id') or f['properties']['Line'])
+                          for f in features], [('nominal_generators', 'g1'), ('lines', 'l1')])
+        self.assertEqual(features[0]['distance'], 0)
+        # 0.1 degrees of latitude.
+        self.assertAlmostEqual(features[1]['distance'], 11100, delta=100)
+        self.assertEqual(features[0]['geometry'], {'type': 'Point', 'coordinates': [-100, 40]})
+
+    def test_max_distance_and_limit(self):
+        status, result = self.get_json(self.URL, lon=-100, lat=40, layers='nominal_generators', limit=5)
+        self.assertEqual([f['properties']['id'] for f in result['features']], ['g1', 'g2'])
+        status, result = self.get_json(self.URL, lon=-100, lat=40, layers='nominal_generators,lines',
+                                       max_distance=1000)
+        self.assertEqual([f['properties']['id'] for f in result['features']], ['g1'])
+
+    def test_layers_without_data_for_the_country_are_skipped(self):
+        self.assertEqual(self.get_json(self.URL, lon=-100, lat=40, layers='nominal_storage'),
+                         (200, {'type': 'FeatureCollection', 'features': []}))
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get_json(self.URL, lon=-100)[0], 400)
+        self.assertEqual(self.get_json(self.URL, lon=200, lat=40)[0], 400)
+        self.assertEqual(self.get_json(self.URL, lon=-100, lat=40, layers='unknown')[0], 400)
+
+
+class ClusterTests(ApiTestCase):
+    URL = '/api/clusters/united%20states/'
+
+    def setUp(self):
+        super().setUp()
+        self.create_model_table(NominalGeneratorCapacityUS, [
+            {'id': 'g1', 'Bus': 'b1', 'carrier': 'solar', 'p_nom': 10.0, 'geom': 'POINT(-100 40)'},
+            {'id': 'g2', 'Bus': 'b2', 'carrier': 'onwind', 'p_nom': 20.0, 'geom': 'POINT(-99.9 40.1)'},
+            {'id': 'g3', 'Bus': 'b3', 'carrier': 'solar', 'p_nom': 50.0, 'geom': 'POINT(-80 30)'},
+        ])
+
+    def test_cell_size_halves_with_each_zoom_level(self):
+        self.assertEqual(views.cluster_cell_size(0), 84.375)
+        self.assertEqual(views.cluster_cell_size(1), 42.1875)
+
+    def test_nearby_points_are_merged(self):
+        status, result = self.get_json(self.URL, zoom=4)
+        self.assertEqual(status, 200)
+        self.assertEqual((result['layer'], result['zoom']), ('nominal_generators', 4))
+        single, merged = result['features']
+        self.assertEqual(single['properties'], {'count': 1, 'capacity': 50.0, 'carriers': {'solar': 50.0},
+                                                'bbox': [-80, 30, -80, 30]})
+        self.assertEqual(merged['properties'], {'count': 2, 'capacity': 30.0,
+                                                'carriers': {'solar': 10.0, 'onwind': 20.0},
+                                                'bbox': [-100, 40, -99.9, 40.1]})
+        x, y = merged['geometry']['coordinates']
+        self.assertAlmostEqual(x, -99.95)
+        self.assertAlmostEqual(y, 40.05)
+
+    def test_clusters_split_when_zooming_in(self):
+        status, result = self.get_json(self.URL, zoom=99)
+        self.assertEqual(result['zoom'], views.CLUSTER_MAX_ZOOM)
+        self.assertEqual([f['properties']['count'] for f in result['features']], [1, 1, 1])
+        status, result = self.get_json(self.URL, zoom=0)
+        self.assertEqual([f['properties']['count'] for f in result['features']], [3])
+
+    def test_bbox_and_carrier_filters(self):
+        status, result = self.get_json(self.URL, zoom=20, bbox='-101,39,-95,45')
+        self.assertEqual(sorted(f['properties']['capacity'] for f in result['features']), [10.0, 20.0])
+        status, result = self.get_json(self.URL, zoom=20, carrier='solar')
+        self.assertEqual(sorted(f['properties']['capacity'] for f in result['features']), [10.0, 50.0])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get_json(self.URL, zoom=4, layer='unknown')[0], 400)
+        self.assertEqual(self.get_json(self.URL)[0], 400)
+        self.assertEqual(self.get_json(self.URL, zoom=4, bbox='1,2,3')[0], 400)
+        # There is no storage data for the United States.
+        self.assertEqual(self.get_json(self.URL, zoom=4, layer='nominal_storage')[0], 400)
+
+
+class SummaryTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_model_table(NominalGeneratorCapacityCo, [
+            {'id': 'g1', 'Bus': 'b1', 'carrier': 'solar', 'p_nom': 10.0, 'geom': 'POINT(-75 4)'},
+            {'id': 'g2', 'Bus': 'b2', 'carrier': 'solar', 'p_nom': 5.0, 'geom': 'POINT(-74 5)'},
+            {'id': 'g3', 'Bus': 'b3', 'carrier': 'onwind', 'p_nom': 20.0, 'geom': 'POINT(-73 6)'},
+        ])
+        self.create_model_table(OptimalGeneratorCapacityCo, [
+            {'id': 'g1', 'Bus': 'b1', 'carrier': 'solar', 'p_nom_opt': 12.0, 'geom': 'POINT(-75 4)'},
+        ])
+        self.create_model_table(NominalStorageCapacityCo, [
+            {'Bus': 'b1', 'carrier': 'battery', 'p_nom': 3.0, 'geom': 'POINT(-75 4)'},
+        ])
+        self.create_model_table(OptimalStorageCapacityCo, [
+            {'Bus': 'b1', 'carrier': 'battery', 'p_nom_opt': 4.0, 'geom': 'POINT(-75 4)'},
+        ])
+        self.create_model_table(LinesCo, [
+            {'Line': 'l1', 'bus0': 'b0', 'bus1': 'b1', 'geom': 'LINESTRING(-77 2, -75 4)'},
+        ])
+
+    def test_capacity_per_carrier_and_extent(self):
+        self.assertEqual(build_summary('Colombia'), {
+            'country': 'colombia',
+            'capacity': {
+                'nominal_generators': {'onwind': 20.0, 'solar': 15.0},
+                'optimal_generators': {'solar': 12.0},
+                'nominal_storage': {'battery': 3.0},
+                'optimal_storage': {'battery': 4.0},
+            },
+            # The lines reach beyond the points.
+            'extent': [-77.0, 2.0, -73.0, 6.0],
+            # Only the United States has scenarios.
+            'scenarios': [],
+        })
+
+    def test_summary_is_cached_per_data_version(self):
+        summary = country_summary('colombia')
+        self.assertEqual(cache.get(summary_cache_key('colombia', response_cache.get_data_version())), summary)
+        NominalGeneratorCapacityCo.objects.all().delete()
+        self.assertEqual(country_summary('colombia'), summary)
+
+    def test_preload_links(self):
+        links = preload_links('colombia').split(', ')
+        self.assertEqual(len(links), 5)
+        self.assertIn('</api/line-data/colombia/>; rel=preload; as=fetch; crossorigin=anonymous', links)
+
+    @override_settings(STORAGES={
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+    })
+    def test_index_page_inlines_the_summary(self):
+        with override_settings(INDEX_SUMMARY_COUNTRY='colombia'):
+            response = self.client.get('/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertContains(response, '<script id="initial-summary" type="application/json">{"country": "colombia"')
+        self.assertEqual(response['Link'], preload_links('colombia'))
+
+        with override_settings(INDEX_SUMMARY_COUNTRY=''):
+            response = self.client.get('/', HTTP_ACCEPT_ENCODING='identity')
+        self.assertContains(response, '<script id="initial-summary" type="application/json">null</script>')
+        self.assertFalse(response.has_header('Link'))
+
+
+class RegionTests(ApiTestCase):
+    def setUp(self):
+        super().setUp()
+        self.inside = Region.objects.create(country='colombia', name='Inside', code='CO.IN',
+                                            geom='MULTIPOLYGON(((-76 3, -74 3, -74 5, -76 5, -76 3)))')
+        self.empty = Region.objects.create(country='colombia', name='Empty', code='CO.EM',
+                                           geom='MULTIPOLYGON(((-70 0, -69 0, -69 1, -70 1, -70 0)))')
+        self.create_model_table(NominalGeneratorCapacityCo, [
+            {'id': 'g1', 'carrier': 'solar', 'p_nom': 10.0, 'geom': 'POINT(-75 4)'},
+            {'id': 'g2', 'carrier': 'solar', 'p_nom': 5.0, 'geom': 'POINT(-75.5 4.5)'},
+            {'id': 'g3', 'carrier': 'onwind', 'p_nom': 7.0, 'geom': 'POINT(-75 4)'},
+            {'id': 'g4', 'carrier': 'solar', 'p_nom': 1.0, 'geom': 'POINT(-60 0)'},
+        ])
+
+    def test_sources_follow_the_layer_registries(self):
+        self.assertIs(region_sources()['optimal_generators'][0], views.OPTIMAL_GENERATOR_MODELS)
+        self.assertIs(region_sources()['nominal_storage'][0], views.NOMINAL_STORAGE_MODELS)
+
+    def test_points_are_aggregated_per_region_and_carrier(self):
+        # The layers without a relation in the test database are skipped.
+        self.assertEqual(aggregate_country('colombia'), 2)
+
+        status, result = self.get_json('/api/regions/colombia/')
+        self.assertEqual(status, 200)
+        carriers = {f['properties']['name']: f['properties']['carriers'] for f in result['features']}
+        self.assertEqual(carriers['Empty'], {})
+        self.assertEqual({carrier: (row['count'], row['capacity']) for carrier, row in carriers['Inside'].items()},
+                         {'solar': (2, 15.0), 'onwind': (1, 7.0)})
+
+        status, result = self.get_json('/api/regions/colombia/', carrier='onwind')
+        inside = next(f for f in result['features'] if f['id'] == self.inside.id)
+        self.assertEqual(list(inside['properties']['carriers']), ['onwind'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get_json('/api/regions/colombia/', source='unknown')[0], 400)
+        self.assertEqual(self.get_json('/api/regions/nigeria/')[0], 404)
+
+
+class LineMetricsTests(ApiTestCase):
+    LINES = [
+        {'Line': 'l1', 'bus0': 'a', 'bus1': 'b', 'carrier': 'AC', 'length': 300.0, 's_nom': 100.0,
+         's_nom_opt': 150.0, 'capital_cost': 2.0, 'x': 0.3, 'r': 0.1},
+        {'Line': 'l2', 'bus0': 'b', 'bus1': 'c', 'carrier': 'DC', 'length': 50.0, 's_nom': 0.0,
+         's_nom_opt': 10.0, 'capital_cost': 4.0, 'x': 0.2, 'r': 0.0},
+    ]
+
+    def test_metrics(self):
+        metrics = line_metrics(pd.DataFrame(self.LINES)).set_index('line')
+        self.assertEqual(metrics.loc['l1', 'expansion'], 50)
+        self.assertEqual(metrics.loc['l1', 'relative_expansion'], 0.5)
+        # capital_cost is per MW of the whole line, so the length is not applied again.
+        self.assertEqual(metrics.loc['l1', 'expansion_cost'], 100)
+        self.assertAlmostEqual(metrics.loc['l1', 'x_r_ratio'], 3)
+        self.assertTrue(math.isnan(metrics.loc['l2', 'relative_expansion']))
+        self.assertTrue(math.isnan(metrics.loc['l2', 'x_r_ratio']))
+
+    def test_refresh_and_query(self):
+        self.create_model_table(LinesCo, [{**line, 'line_geom': 'LINESTRING(0 0, 1 1)'} for line in self.LINES])
+        self.assertEqual(refresh_country('colombia'), 2)
+        self.assertEqual(LineMetrics.objects.get(country='colombia', line='l2').expansion_cost, 40)
+
+        status, rows = self.get_json('/api/line-metrics/colombia/', order_by='-expansion_cost', limit=1)
+        self.assertEqual(status, 200)
+        self.assertEqual([(row['line'], row['expansion_cost']) for row in rows], [('l1', 100)])
+
+        # Lines whose sort field is undefined are left out.
+        status, rows = self.get_json('/api/line-metrics/colombia/', order_by='relative_expansion')
+        self.assertEqual([row['line'] for row in rows], ['l1'])
+
+        status, rows = self.get_json('/api/line-metrics/colombia/', min_expansion=20, carrier='AC,DC')
+        self.assertEqual([row['line'] for row in rows], ['l1'])
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.get_json('/api/line-metrics/colombia/', order_by='bus0')[0], 400)
+        self.assertEqual(self.get_json('/api/line-metrics/colombia/', min_expansion='many')[0], 400)
+
+
+class ExportTests(ApiTestCase):
+    URL = '/api/export/substations/united%20states/'
+
+    def setUp(self):
+        super().setUp()
+        self.create_table('geojson_all_clean_substations_US', {
+            'name': 'text', 'v_nom': 'float', 'geom': 'geometry(POINT, 4326)',
+        }, [('s1', 230.0, 'POINT(-100 40)'), ('s2', 345.0, 'POINT(-80 30)')])
+
+    def download(self, **params):
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def csv_rows(self, content):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            return archive.read('united_states_substations.csv').decode().splitlines()
+
+    def test_zipped_csv_is_streamed_then_served_from_disk(self):
+        params = {'format': 'csv.zip', 'fields': 'name', 'bbox': '-110,35,-90,45'}
+        content = self.download(**params)
+        self.assertEqual(self.csv_rows(content), ['name,geometry', 's1,POINT(-100 40)'])
+        self.assertEqual(len(os.listdir(os.path.join(self.root, 'exports', str(response_cache.get_data_version())))), 1)
+
+        with mock.patch('geojson.views.write_csv_zip') as write_csv_zip:
+            self.assertEqual(self.download(**params), content)
+        write_csv_zip.assert_not_called()
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.client.get(self.URL, {'format': 'shp'}).status_code, 400)
+        self.assertEqual(self.client.get(self.URL, {'fields': 'unknown'}).status_code, 404)
+        self.assertEqual(self.client.get(self.URL, {'bbox': '3,2,1,0'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/export/unknown/united%20states/').status_code, 404)
@@ -0,0 +1,214 @@
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+"""
+Time series of solved networks (dispatch, flows, prices) stored as NPY files.
+
+Each ``(country, scenario, component, attribute)`` is one float32 matrix
+with a row per element, so the series of one bus or generator is a
+contiguous slice of a memory-mapped file and a request reads only the pages
+it plots. ``snapshots.npy`` holds the shared time axis in epoch seconds.
+"""
+
+import os
+import re
+import shutil
+import threading
+import uuid
+
+import numpy as np
+from django.conf import settings
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Time-varying outputs of a solved network kept by the importer.
+TIMESERIES_ATTRIBUTES = {
+    'buses': ('marginal_price',),
+    'generators': ('p',),
+    'storage_units': ('p', 'state_of_charge'),
+    'lines': ('p0',),
+    'loads': ('p',),
+}
+TIMESERIES_METHODS = ('lttb', 'mean', 'min', 'max')
+# Elements whose series are copied out of the netCDF file at once.
+WRITE_CHUNK_ELEMENTS = 1024
+NAME_RE = re.compile(r'^[A-Za-z0-9_-]+$')
+
+_series = {}
+_lock = threading.Lock()
+
+
+class SeriesNotFound(Exception):
+    pass
+
+
+def timeseries_dir():
+    return getattr(settings, 'TIMESERIES_DIR', os.path.join(settings.BASE_DIR, 'timeseries'))
+
+
+def scenario_dir(country, scenario):
+    if not NAME_RE.match(scenario):
+        raise SeriesNotFound(f"Invalid scenario '{scenario}'")
+    return os.path.join(timeseries_dir(), country.lower().replace(' ', '_'), scenario)
+
+
+def store_network_series(network, country, scenario):
+    """
+    Copy the ``TIMESERIES_ATTRIBUTES`` of a ``PyPSANetwork`` into the store.
+
+    The scenario directory is written aside and swapped in once complete, so
+    readers never see a partial import. Returns the number of series stored.
+    """
+    target = scenario_dir(country, scenario)
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f'.{scenario}.{uuid.uuid4().hex}')
+    os.makedirs(staging)
+
+    stored = 0
+    try:
+        snapshots = None
+        for component, attributes in TIMESERIES_ATTRIBUTES.items():
+            for attribute in attributes:
+                series = network.series(component, attribute)
+                if series is None:
+                    continue
+                snapshots, names, variable = series
+                path = os.path.join(staging, f'{component}_{attribute}.npy')
+                values = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32,
+                                                   shape=(len(names), len(snapshots)))
+                for start in range(0, len(names), WRITE_CHUNK_ELEMENTS):
+                    stop = start + WRITE_CHUNK_ELEMENTS
+                    values[start:stop] = np.asarray(variable[:, start:stop]).T
+                values.flush()
+                del values
+                np.save(os.path.join(staging, f'{component}_{attribute}.names.npy'), names.astype(str))
+                stored += 1
+        if snapshots is not None:
+            np.save(os.path.join(staging, 'snapshots.npy'),
+                    np.asarray(snapshots, dtype='datetime64[s]').astype(np.int64))
+
+        previous = None
+        if os.path.exists(target):
+            previous = os.path.join(parent, f'.{scenario}.{uuid.uuid4().hex}.old')
+            os.replace(target, previous)
+        os.replace(staging, target)
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+    finally:
+        if os.path.exists(staging):
+            shutil.rmtree(staging, ignore_errors=True)
+    return stored
+
+
+class Series:
+    """Memory-mapped series of one component attribute."""
+
+    def __init__(self, directory, component, attribute):
+        prefix = os.path.join(directory, f'{component}_{attribute}')
+        if not os.path.exists(f'{prefix}.npy'):
+            raise SeriesNotFound(f"No '{attribute}' series for {component}")
+        self.time = np.load(os.path.join(directory, 'snapshots.npy'))
+        self.names = np.load(f'{prefix}.names.npy')
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        self.values = np.load(f'{prefix}.npy', mmap_mode='r')
+
+    def window(self, start=None, end=None):
+        """Slice of snapshot positions between the epoch seconds ``start`` and ``end``, inclusive."""
+        first = 0 if start is None else int(np.searchsorted(self.time, start, side='left'))
+        last = len(self.time) if end is None else int(np.searchsorted(self.time, end, side='right'))
+        return slice(first, last)
+
+
+def open_series(country, scenario, component, attribute):
+    """The ``Series`` currently stored, mapped on first use and again after each import."""
+    if component not in TIMESERIES_ATTRIBUTES or attribute not in TIMESERIES_ATTRIBUTES[component]:
+        raise SeriesNotFound(f"No '{attribute}' series for {component}")
+    directory = scenario_dir(country, scenario)
+    try:
+        # Imports swap in a new directory, so its inode identifies the stored files.
+        stat = os.stat(directory)
+    except FileNotFoundError:
+        raise SeriesNotFound(f"No series stored for {country} ({scenario})")
+    key = (directory, component, attribute, (stat.st_ino, stat.st_mtime_ns))
+    series = _series.get(key)
+    if series is not None:
+        return series
+
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = Series(directory, component, attribute)
+            for stale in [k for k in _series if k[:3] == key[:3]]:
+                del _series[stale]
+            _series[key] = series
+    return series
+
+
+def lttb(time, values, threshold):
+    """
+    Indices of the ``threshold`` points kept by Largest-Triangle-Three-Buckets.
+
+    The first and last points are always kept; every bucket in between
+    contributes the point forming the largest triangle with the previously
+    kept point and the mean of the next bucket.
+    """
+    size = len(values)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    every = (size - 2) / (threshold - 2)
+    edges = np.floor(np.arange(threshold - 1) * every).astype(int) + 1
+    # Mean point of every bucket, the last point standing in for the bucket after the last.
+    counts = np.diff(np.append(edges, size))
+    mean_time = np.add.reduceat(time, edges) / counts
+    mean_value = np.add.reduceat(values, edges) / counts
+
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, size - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        dt, dv = time[previous] - mean_time[bucket + 1], mean_value[bucket + 1] - values[previous]
+        area = np.abs(dt * (values[lo:hi] - values[previous]) - (time[previous] - time[lo:hi]) * dv)
+        previous = lo + (int(np.nanargmax(area)) if not np.isnan(area).all() else 0)
+        keep[bucket + 1] = previous
+    return keep
+
+
+def aggregate(values, buckets, method):
+    """
+    Reduce the columns of ``values`` (elements x snapshots) into ``buckets`` windows.
+
+    Returns the start position of each window and the reduced matrix.
+    """
+    size = values.shape[1]
+    starts = np.unique(np.linspace(0, size, min(buckets, size), endpoint=False).astype(int))
+    reduce = {'mean': np.add, 'min': np.minimum, 'max': np.maximum}[method]
+    reduced = reduce.reduceat(values, starts, axis=1)
+    if method == 'mean':
+        reduced = reduced / np.diff(np.append(starts, size))
+    return starts, reduced
+
+
+def downsample(series, names, start=None, end=None, width=1000, method='lttb'):
+    """``{name: {'time': [...], 'value': [...]}}`` with at most ``width`` points per element."""
+    window = series.window(start, end)
+    time = series.time[window]
+    rows = [series.rows[name] for name in names]
+    # One read of the requested rows; the file is row-major so each is a contiguous range.
+    values = np.asarray(series.values[rows, window], dtype=np.float64)
+
+    result = {}
+    if method == 'lttb':
+        for name, row in zip(names, values):
+            keep = lttb(time, row, width)
+            result[name] = {'time': (time[keep] * 1000).tolist(), 'value': row[keep].tolist()}
+    else:
+        starts, reduced = aggregate(values, width, method) if len(time) else ([], values)
+        for name, row in zip(names, reduced):
+            result[name] = {'time': (time[starts] * 1000).tolist(), 'value': row.tolist()}
+    return result
@@ -4,13 +4,33 @@
 #
 
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
+from django.contrib.gis.db.models import GeometryField
+from django.contrib.gis.db.models.functions import AsGeoJSON
 from django.contrib.gis.geos import GEOSGeometry
-from django.db import connection
+from django.db import connections
+import datetime
 import json
 import logging
+import os
+import re
+
+from .cache import cached_api_response
+from .encoders import ApiJsonResponse, DEFAULT_COORD_PRECISION
+from .export import (
+    EXPORT_DATASETS, EXPORT_FORMATS, PARQUET_AVAILABLE, Export, ExportError, artifact_path,
+    stream_and_store, temporary_path, write_csv_zip, write_gpkg, write_parquet,
+)
+from .graph import WEIGHTS as NETWORK_WEIGHTS, network_graph
+from .metrics import metrics_allowed, render_metrics
+from .profiling import record_rows, timed
+from .regions import MEAN_COLUMNS, region_sources
+from .routers import read_alias
+from .snapshots import served_from_snapshot
+from .summary import country_summary, preload_links
+from .timeseries import TIMESERIES_METHODS, SeriesNotFound, downsample, open_series
 
 logger = logging.getLogger(__name__)
 
@@ -19,115 +39,201 @@ from .models import (
     OptimalGeneratorCapacity, OptimalGeneratorCapacityCo, OptimalGeneratorCapacityUS,
     NominalStorageCapacity, NominalStorageCapacityCo, NominalStorageCapacityUS,
     OptimalStorageCapacity, OptimalStorageCapacityCo, OptimalStorageCapacityUS,
-    Lines, LinesCo, LinesUS, EconomicData
+    Lines, LinesCo, LinesUS, EconomicData, ChoroplethStatistics, Region, RegionAggregate,
+    LineMetrics, LINE_METRIC_FIELDS
 )
 
+# Models behind each endpoint, keyed by the lower-cased country name.
+NOMINAL_GENERATOR_MODELS = {
+    'nigeria': NominalGeneratorCapacity,
+    'colombia': NominalGeneratorCapacityCo,
+    'united states': NominalGeneratorCapacityUS,
+}
+OPTIMAL_GENERATOR_MODELS = {
+    'nigeria': OptimalGeneratorCapacity,
+    'colombia': OptimalGeneratorCapacityCo,
+    'united states': OptimalGeneratorCapacityUS,
+}
+# Storage data is not available for the United States.
+NOMINAL_STORAGE_MODELS = {
+    'nigeria': NominalStorageCapacity,
+    'colombia': NominalStorageCapacityCo,
+}
+OPTIMAL_STORAGE_MODELS = {
+    'nigeria': OptimalStorageCapacity,
+    'colombia': OptimalStorageCapacityCo,
+}
+LINE_MODELS = {
+    'nigeria': Lines,
+    'colombia': LinesCo,
+    'united states': LinesUS,
+}
+
+# ES modules imported by main.js, preloaded by the index page.
+FRONTEND_MODULES = [
+    'init.js', 'layers.js', 'downloads.js', 'eventHandlers.js', 'mapRotation.js', 'search.js',
+    'layerVisibility.js', 'overlays.js', 'urlHandling.js', 'scenarios.js', 'uiControls.js',
+    'charts.js', 'dataLoaders.js', 'dataInitialization.js',
+]
+
+# Layers of the identify endpoint and the models behind them per country.
+IDENTIFY_LAYERS = {
+    'nominal_generators': NOMINAL_GENERATOR_MODELS,
+    'optimal_generators': OPTIMAL_GENERATOR_MODELS,
+    'nominal_storage': NOMINAL_STORAGE_MODELS,
+    'optimal_storage': OPTIMAL_STORAGE_MODELS,
+    'lines': LINE_MODELS,
+}
+IDENTIFY_LIMIT = 5
+IDENTIFY_MAX_LIMIT = 20
+
+# Fields of LineMetrics that can be sorted and filtered on.
+LINE_METRIC_SORT_FIELDS = LINE_METRIC_FIELDS + ('length', 's_nom', 's_nom_opt')
+LINE_METRIC_LIMIT = 100
+LINE_METRIC_MAX_LIMIT = 5000
+
+# Per-scenario generator tables published through the Bus upload, keyed by country.
+SCENARIO_FEATURE_TABLES = {
+    'united states': 'geojson_generators_combined_data_US_{scenario}',
+}
+SCENARIO_FEATURE_PAGE_SIZE = 5000
+SCENARIO_FEATURE_MAX_PAGE_SIZE = 20000
+SCENARIO_NAME_RE = re.compile(r'^[A-Za-z0-9_]+$')
+
+# Point layers of the cluster endpoint: the models behind them per country and their capacity column.
+CLUSTER_LAYERS = {
+    'nominal_generators': (NOMINAL_GENERATOR_MODELS, 'p_nom'),
+    'optimal_generators': (OPTIMAL_GENERATOR_MODELS, 'p_nom_opt'),
+    'nominal_storage': (NOMINAL_STORAGE_MODELS, 'p_nom'),
+    'optimal_storage': (OPTIMAL_STORAGE_MODELS, 'p_nom_opt'),
+}
+# Cluster grid cell, in pixels of a 256 pixel web map tile, and the zoom levels it is computed for.
+CLUSTER_CELL_PIXELS = 60
+CLUSTER_MAX_ZOOM = 20
+
+# Upper bound of the neighbourhood radius, in lines.
+NETWORK_MAX_HOPS = 10
+
+# Points per series of the time series endpoint, and how many series one request may ask for.
+TIMESERIES_WIDTH = 1000
+TIMESERIES_MAX_WIDTH = 5000
+TIMESERIES_MAX_NAMES = 50
+
+# Generator x/y are longitude/latitude, unlike the line reactance x.
+GENERATOR_FIELD_PRECISION = {'x': DEFAULT_COORD_PRECISION, 'y': DEFAULT_COORD_PRECISION}
+
 def index(request):
     context = {
         'GEOSERVER_URL': settings.GEOSERVER_URL,
         'GEOSERVER_WORKSPACE': 'PyPSAEarthDashboard',  
+        'modules': FRONTEND_MODULES,
     }
-    return render(request, 'index.html', context)
+    # The country main.js opens with, as it spells it; empty disables the inline summary and preloads.
+    country = getattr(settings, 'INDEX_SUMMARY_COUNTRY', '')
+    if country:
+        context['initial_summary'] = country_summary(country)
+    response = render(request, 'index.html', context)
+    if country:
+        response['Link'] = preload_links(country)
+    return response
+
+def metrics(request):
+    if not metrics_allowed(request):
+        return HttpResponse(status=403)
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _capacity_response(request, model, **kwargs):
+    with timed(request, 'materialize'):
+        data = list(model.objects.all().values())
+
+    with timed(request, 'geometry'):
+        for item in data:
+            item['geom'] = item['geom'].coords  # Convert Point to tuple
+
+    record_rows(request, len(data))
+    with timed(request, 'encode'):
+        return ApiJsonResponse(data, **kwargs)
 
 @csrf_exempt
+@served_from_snapshot
+@cached_api_response
 def nominal_generator_capacity_json(request, country):
-    if country.lower() == 'nigeria':
-        data = list(NominalGeneratorCapacity.objects.all().values())
-    elif country.lower() == 'colombia':
-        data = list(NominalGeneratorCapacityCo.objects.all().values())
-    elif country.lower() == 'united states':
-        data = list(NominalGeneratorCapacityUS.objects.all().values())
-    else:
-        return JsonResponse({"error": "Country not supported"}, status=400)
-    
-    for item in data:
-        item['geom'] = item['geom'].coords  # Convert Point to tuple
+    model = NOMINAL_GENERATOR_MODELS.get(country.lower())
+    if model is None:
+        return ApiJsonResponse({"error": "Country not supported"}, status=400)
 
-    return JsonResponse(data, safe=False)
+    return _capacity_response(request, model, field_precision=GENERATOR_FIELD_PRECISION)
 
 @csrf_exempt
+@served_from_snapshot
+@cached_api_response
 def optimal_generator_capacity_json(request, country):
-    if country.lower() == 'nigeria':
-        data = list(OptimalGeneratorCapacity.objects.all().values())
-    elif country.lower() == 'colombia':
-        data = list(OptimalGeneratorCapacityCo.objects.all().values())
-    elif country.lower() == 'united states':
-        data = list(OptimalGeneratorCapacityUS.objects.all().values())
-    else:
-        return JsonResponse({"error": "Country not supported"}, status=400)
-    
-    for item in data:
-        item['geom'] = item['geom'].coords  
+    model = OPTIMAL_GENERATOR_MODELS.get(country.lower())
+    if model is None:
+        return ApiJsonResponse({"error": "Country not supported"}, status=400)
 
-    return JsonResponse(data, safe=False)
+    return _capacity_response(request, model, field_precision=GENERATOR_FIELD_PRECISION)
 
 @csrf_exempt
+@served_from_snapshot
+@cached_api_response
 def nominal_storage_capacity_json(request, country):
-    if country.lower() == 'nigeria':
-        data = list(NominalStorageCapacity.objects.all().values())
-    elif country.lower() == 'colombia':
-        data = list(NominalStorageCapacityCo.objects.all().values())
-    elif country.lower() == 'united states':
-        # data = list(NominalStorageCapacityUS.objects.all().values())
-        return JsonResponse({"message": "Storage data not available for United States"}, status=204)
-    else:
-        return JsonResponse({"error": "Country not supported"}, status=400)
-    
-    for item in data:
-        item['geom'] = item['geom'].coords
+    if country.lower() == 'united states':
+        return ApiJsonResponse({"message": "Storage data not available for United States"}, status=204)
+    model = NOMINAL_STORAGE_MODELS.get(country.lower())
+    if model is None:
+        return ApiJsonResponse({"error": "Country not supported"}, status=400)
 
-    return JsonResponse(data, safe=False)
+    return _capacity_response(request, model)
 
 @csrf_exempt
+@served_from_snapshot
+@cached_api_response
 def optimal_storage_capacity_json(request, country):
-    if country.lower() == 'nigeria':
-        data = list(OptimalStorageCapacity.objects.all().values())
-    elif country.lower() == 'colombia':
-        data = list(OptimalStorageCapacityCo.objects.all().values())
-    elif country.lower() == 'united states':
-        # data = list(OptimalStorageCapacityUS.objects.all().values())
-        return JsonResponse({"message": "Storage data not available for United States"}, status=204)
-    else:
-        return JsonResponse({"error": "Country not supported"}, status=400)
-    
-    for item in data:
-        item['geom'] = item['geom'].coords
+    if country.lower() == 'united states':
+        return ApiJsonResponse({"message": "Storage data not available for United States"}, status=204)
+    model = OPTIMAL_STORAGE_MODELS.get(country.lower())
+    if model is None:
+        return ApiJsonResponse({"error": "Country not supported"}, status=400)
 
-    return JsonResponse(data, safe=False)
+    return _capacity_response(request, model)
 
 @csrf_exempt
+@served_from_snapshot
+@cached_api_response
 def line_data_json(request, country):
     try:
-        if country.lower() == 'united states':
-            data = list(LinesUS.objects.all().values())
-        elif country.lower() == 'colombia':
-            data = list(LinesCo.objects.all().values())
-        else: 
-            data = list(Lines.objects.all().values())
+        model = LINE_MODELS.get(country.lower(), Lines)
+        with timed(request, 'materialize'):
+            data = list(model.objects.all().values())
 
-        for item in data:
-            if 'geom' in item and item['geom']:
-                item['line_geom'] = GEOSGeometry(item['geom']).coords
-                del item['geom']
-            elif 'line_geom' in item and item['line_geom']:
-                item['line_geom'] = item['line_geom'].coords
+        with timed(request, 'geometry'):
+            for item in data:
+                if 'geom' in item and item['geom']:
+                    item['line_geom'] = GEOSGeometry(item['geom']).coords
+                    del item['geom']
+                elif 'line_geom' in item and item['line_geom']:
+                    item['line_geom'] = item['line_geom'].coords
 
-        return JsonResponse(data, safe=False)
+        record_rows(request, len(data))
+        with timed(request, 'encode'):
+            return ApiJsonResponse(data)
     except Exception as e:
         logger.error(f"Error in line_data_json for {country}: {str(e)}", exc_info=True)
-        return JsonResponse({"error": str(e)}, status=500)
+        return ApiJsonResponse({"error": str(e)}, status=500)
     
 
 @csrf_exempt
+@cached_api_response
 def economic_data_json(request, country, scenario):
     if country.lower() != 'united states':
-        return JsonResponse({"error": "Data only available for United States"}, status=400)
+        return ApiJsonResponse({"error": "Data only available for United States"}, status=400)
     
     try:
         table_name = f'json_statistics_{scenario}_US'
-        print(f"Accessing table: {table_name}")  
-        
-        with connection.cursor() as cursor:
+        logger.debug(f"Accessing table: {table_name}")
+
+        with timed(request, 'materialize'), connections[read_alias()].cursor() as cursor:
             cursor.execute(f"""
                 SELECT *
                 FROM "{table_name}"
@@ -135,7 +241,611 @@ def economic_data_json(request, country, scenario):
             columns = [col[0] for col in cursor.description]
             data = [dict(zip(columns, row)) for row in cursor.fetchall()]
         
-        return JsonResponse(data, safe=False)
+        record_rows(request, len(data))
+        with timed(request, 'encode'):
+            return ApiJsonResponse(data)
+    except Exception as e:
+        logger.error(f"Error in economic_data_json for {scenario}: {str(e)}", exc_info=True)
+        return ApiJsonResponse({"error": str(e)}, status=500)
+
+
+def scenario_feature_table(country, scenario):
+    """Return the table holding the scenario generators, or None if unknown."""
+    template = SCENARIO_FEATURE_TABLES.get(country.lower())
+    if template is None or not SCENARIO_NAME_RE.match(scenario):
+        return None
+    return template.format(scenario=scenario)
+
+
+def _table_columns(table_name):
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute("""
+            SELECT column_name
+            FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+        """, [table_name])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _parse_time(value):
+    """Epoch seconds of an ISO 8601 date or datetime; naive values are taken as UTC."""
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=datetime.timezone.utc)
+    return int(moment.timestamp())
+
+
+def _parse_bbox(value):
+    """Parse ``minx,miny,maxx,maxy`` in EPSG:4326 into a tuple of floats."""
+    parts = [float(v) for v in value.split(',')]
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError(f"Invalid bbox '{value}'")
+    return tuple(parts)
+
+
+@csrf_exempt
+@cached_api_response
+def scenario_features_json(request, country, scenario):
+    """
+    GeoJSON features of a scenario generator table, paged by ``name``.
+
+    Query parameters: ``bbox`` (EPSG:4326), ``carrier`` (comma separated),
+    ``properties`` (comma separated columns to return), ``cursor`` (the
+    ``next_cursor`` of the previous page) and ``limit``.
+    """
+    table_name = scenario_feature_table(country, scenario)
+    if table_name is None:
+        return ApiJsonResponse({"error": "Scenario not supported"}, status=400)
+
+    columns = _table_columns(table_name)
+    if not columns:
+        return ApiJsonResponse({"error": f"Scenario '{scenario}' not available"}, status=404)
+
+    try:
+        limit = int(request.GET.get('limit', SCENARIO_FEATURE_PAGE_SIZE))
+        limit = max(1, min(limit, SCENARIO_FEATURE_MAX_PAGE_SIZE))
+        bbox = _parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else None
+    except ValueError as e:
+        return ApiJsonResponse({"error": str(e)}, status=400)
+
+    if 'properties' in request.GET:
+        properties = [p for p in request.GET['properties'].split(',') if p]
+        unknown = [p for p in properties if p not in columns]
+        if unknown:
+            return ApiJsonResponse({"error": f"Unknown properties: {', '.join(unknown)}"}, status=400)
+    else:
+        properties = [c for c in columns if c != 'geom']
+    properties = [p for p in properties if p not in ('name', 'geom')]
+
+    conditions = []
+    params = []
+    if bbox:
+        conditions.append("geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)")
+        params.extend(bbox)
+    if request.GET.get('carrier'):
+        conditions.append("carrier = ANY(%s)")
+        params.append(request.GET['carrier'].split(','))
+    if request.GET.get('cursor'):
+        conditions.append("name > %s")
+        params.append(request.GET['cursor'])
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    selected = ''.join(f', "{p}"' for p in properties)
+
+    try:
+        with timed(request, 'materialize'), connections[read_alias()].cursor() as cursor:
+            cursor.execute(f"""
+                SELECT name, ST_AsGeoJSON(geom, 6){selected}
+                FROM "{table_name}"
+                {where}
+                ORDER BY name
+                LIMIT %s
+            """, params + [limit + 1])
+            rows = cursor.fetchall()
+    except Exception as e:
+        logger.error(f"Error in scenario_features_json for {table_name}: {str(e)}", exc_info=True)
+        return ApiJsonResponse({"error": str(e)}, status=500)
+
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    features = []
+    with timed(request, 'geometry'):
+        for row in rows[:limit]:
+            feature_properties = dict(zip(properties, row[2:]))
+            feature_properties['name'] = row[0]
+            features.append({
+                "type": "Feature",
+                "id": row[0],
+                "geometry": json.loads(row[1]) if row[1] else None,
+                "properties": feature_properties,
+            })
+
+    record_rows(request, len(features))
+    with timed(request, 'encode'):
+        return ApiJsonResponse({
+            "type": "FeatureCollection",
+            "features": features,
+            "next_cursor": next_cursor,
+        })
+
+
+@csrf_exempt
+@cached_api_response
+def choropleth_statistics_json(request, country, scenario, carrier, variable):
+    """Legend statistics precomputed when the scenario table was uploaded."""
+    table_name = scenario_feature_table(country, scenario)
+    if table_name is None:
+        return ApiJsonResponse({"error": "Scenario not supported"}, status=400)
+
+    stats = (ChoroplethStatistics.objects
+             .filter(table_name=table_name, carrier=carrier, variable=variable)
+             .values('carrier', 'variable', 'count', 'min_value', 'max_value',
+                     'quantile_breaks', 'jenks_breaks', 'histogram')
+             .first())
+    if stats is None:
+        return ApiJsonResponse({"error": "Statistics not available"}, status=404)
+
+    return ApiJsonResponse(stats)
+
+
+def _network_graph(request, country):
+    """The line graph of ``country``, or an error response if it has no line model."""
+    model = LINE_MODELS.get(country.lower())
+    if model is None:
+        return None, ApiJsonResponse({"error": "Country not supported"}, status=400)
+    with timed(request, 'graph'):
+        return network_graph(country.lower(), model), None
+
+
+def _unknown_buses(graph, *buses):
+    unknown = [bus for bus in buses if bus not in graph]
+    if unknown:
+        return ApiJsonResponse({"error": f"Unknown bus: {', '.join(unknown)}"}, status=404)
+    return None
+
+
+@csrf_exempt
+@cached_api_response
+def network_neighbors_json(request, country, bus):
+    """Buses within ``hops`` lines of ``bus`` (default 1), with their hop distance."""
+    try:
+        hops = int(request.GET.get('hops', 1))
+    except ValueError:
+        return ApiJsonResponse({"error": "hops must be an integer"}, status=400)
+    if not 1 <= hops <= NETWORK_MAX_HOPS:
+        return ApiJsonResponse({"error": f"hops must be between 1 and {NETWORK_MAX_HOPS}"}, status=400)
+
+    graph, error = _network_graph(request, country)
+    if error is None:
+        error = _unknown_buses(graph, bus)
+    if error is not None:
+        return error
+
+    with timed(request, 'traverse'):
+        neighbors = graph.neighbors(bus, hops)
+    record_rows(request, len(neighbors))
+    return ApiJsonResponse({"bus": bus, "hops": hops, "neighbors": neighbors})
+
+
+@csrf_exempt
+@cached_api_response
+def network_components_json(request, country):
+    """Connected components, largest first; ``bus`` limits the result to that bus's component."""
+    graph, error = _network_graph(request, country)
+    if error is not None:
+        return error
+
+    bus = request.GET.get('bus')
+    if bus:
+        error = _unknown_buses(graph, bus)
+        if error is not None:
+            return error
+        with timed(request, 'traverse'):
+            components = [graph.component_of(bus)]
+    else:
+        with timed(request, 'traverse'):
+            components = graph.components()
+
+    record_rows(request, len(components))
+    return ApiJsonResponse({
+        "count": graph.component_count,
+        "components": [{"size": len(buses), "buses": buses} for buses in components],
+    })
+
+
+@csrf_exempt
+@cached_api_response
+def network_path_json(request, country, source, target):
+    """Shortest path between two buses, weighted by line reactance ``x`` or ``length``."""
+    weight = request.GET.get('weight', 'x')
+    if weight not in NETWORK_WEIGHTS:
+        return ApiJsonResponse({"error": f"weight must be one of {', '.join(NETWORK_WEIGHTS)}"}, status=400)
+
+    graph, error = _network_graph(request, country)
+    if error is None:
+        error = _unknown_buses(graph, source, target)
+    if error is not None:
+        return error
+
+    with timed(request, 'traverse'):
+        path = graph.shortest_path(source, target, weight)
+    if path is None:
+        return ApiJsonResponse({"error": f"No path between '{source}' and '{target}'"}, status=404)
+
+    buses, lines, total = path
+    record_rows(request, len(buses))
+    return ApiJsonResponse({"weight": weight, "total": total, "buses": buses, "lines": lines})
+
+
+def _nearest_features(model, lon, lat, limit):
+    """The ``limit`` features of ``model`` nearest to a point, using the KNN ``<->`` operator."""
+    geometry = next(f for f in model._meta.fields if isinstance(f, GeometryField))
+    columns = [f.column for f in model._meta.fields if f is not geometry]
+    geom = f'"{geometry.column}"::geometry'
+    point = "ST_SetSRID(ST_MakePoint(%s, %s), 4326)"
+    selected = ''.join(f'"{c}", ' for c in columns)
+
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {selected}ST_AsGeoJSON({geom}, 6),
+                   ST_Distance({geom}::geography, {point}::geography)
+            FROM "{model._meta.db_table}"
+            WHERE "{geometry.column}" IS NOT NULL
+            ORDER BY {geom} <-> {point}
+            LIMIT %s
+        """, [lon, lat, lon, lat, limit])
+        rows = cursor.fetchall()
+
+    return [{
+        "type": "Feature",
+        "geometry": json.loads(row[-2]),
+        "properties": dict(zip(columns, row[:-2])),
+        "distance": row[-1],
+    } for row in rows]
+
+
+def cluster_cell_size(zoom):
+    """Side of the cluster grid cells at ``zoom``, in degrees."""
+    return 360 / 2 ** zoom * CLUSTER_CELL_PIXELS / 256
+
+
+def _point_clusters(model, capacity, cell, bbox=None, carriers=None):
+    """
+    Points of ``model`` grouped by ``ST_SnapToGrid`` cell, as one row per cell and carrier.
+
+    Rows are ``(cell x, cell y, carrier, count, capacity, sum of x, sum of y,
+    min x, min y, max x, max y)``; the sums give the cells' centroids.
+    """
+    conditions = ["geom IS NOT NULL"]
+    params = [cell]
+    if bbox:
+        conditions.append("geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)")
+        params.extend(bbox)
+    if carriers:
+        conditions.append("carrier = ANY(%s)")
+        params.append(carriers)
+
+    with connections[read_alias()].cursor() as cursor:
+        cursor.execute(f"""
+            WITH points AS (
+                SELECT ST_SnapToGrid(geom::geometry, %s) AS cell, ST_X(geom::geometry) AS x,
+                       ST_Y(geom::geometry) AS y, carrier, "{capacity}" AS capacity
+                FROM "{model._meta.db_table}"
+                WHERE {' AND '.join(conditions)}
+            )
+            SELECT ST_X(cell), ST_Y(cell), carrier, count(*), coalesce(sum(capacity), 0),
+                   sum(x), sum(y), min(x), min(y), max(x), max(y)
+            FROM points
+            GROUP BY ST_X(cell), ST_Y(cell), carrier
+        """, params)
+        return cursor.fetchall()
+
+
+@csrf_exempt
+@cached_api_response
+def clusters_json(request, country):
+    """
+    Generators or storage units of ``country`` clustered on a grid matching the map's zoom.
+
+    Query parameters: ``layer`` (a name of ``CLUSTER_LAYERS``, default
+    ``nominal_generators``), ``zoom`` (web map zoom level), ``bbox``
+    (EPSG:4326) and ``carrier`` (comma separated). Each cluster is a point at
+    the mean position of its members, with their count, total capacity,
+    capacity per carrier and bounding box to zoom to when it is clicked.
+    """
+    layer = request.GET.get('layer', 'nominal_generators')
+    if layer not in CLUSTER_LAYERS:
+        return ApiJsonResponse({"error": f"layer must be one of {', '.join(CLUSTER_LAYERS)}"}, status=400)
+    models, capacity = CLUSTER_LAYERS[layer]
+    model = models.get(country.lower())
+    if model is None:
+        return ApiJsonResponse({"error": "Country not supported"}, status=400)
+
+    try:
+        zoom = int(request.GET['zoom'])
+        bbox = _parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else None
+    except KeyError as e:
+        return ApiJsonResponse({"error": f"Missing parameter {e}"}, status=400)
+    except ValueError as e:
+        return ApiJsonResponse({"error": str(e)}, status=400)
+    zoom = max(0, min(zoom, CLUSTER_MAX_ZOOM))
+    carriers = request.GET['carrier'].split(',') if request.GET.get('carrier') else None
+    cell = cluster_cell_size(zoom)
+
+    try:
+        with timed(request, 'materialize'):
+            rows = _point_clusters(model, capacity, cell, bbox, carriers)
+    except Exception as e:
+        logger.error(f"Error in clusters_json for {country}: {str(e)}", exc_info=True)
+        return ApiJsonResponse({"error": str(e)}, status=500)
+
+    with timed(request, 'geometry'):
+        clusters = {}
+        for cx, cy, carrier, count, total, sum_x, sum_y, min_x, min_y, max_x, max_y in rows:
+            cluster = clusters.setdefault((cx, cy), {
+                'count': 0, 'capacity': 0.0, 'sum_x': 0.0, 'sum_y': 0.0, 'carriers': {},
+                'bbox': [min_x, min_y, max_x, max_y],
+            })
+            cluster['count'] += count
+            cluster['capacity'] += total
+            cluster['sum_x'] += sum_x
+            cluster['sum_y'] += sum_y
+            cluster['carriers'][carrier] = total
+            bounds = cluster['bbox']
+            cluster['bbox'] = [min(bounds[0], min_x), min(bounds[1], min_y),
+                               max(bounds[2], max_x), max(bounds[3], max_y)]
+
+        features = [{
+            "type": "Feature",
+            "geometry": {
+                "type": "Point",
+                "coordinates": [cluster.pop('sum_x') / cluster['count'], cluster.pop('sum_y') / cluster['count']],
+            },
+            "properties": cluster,
+        } for cluster in clusters.values()]
+        features.sort(key=lambda f: -f['properties']['capacity'])
+
+    record_rows(request, len(features))
+    with timed(request, 'encode'):
+        return ApiJsonResponse({
+            "type": "FeatureCollection",
+            "layer": layer,
+            "zoom": zoom,
+            "cell_size": cell,
+            "features": features,
+        }, field_precision={'bbox': DEFAULT_COORD_PRECISION})
+
+
+@csrf_exempt
+def identify_json(request, country):
+    """
+    Features nearest to a clicked location, for click-to-inspect without loading the layers.
+
+    Query parameters: ``lon`` and ``lat`` (EPSG:4326), ``layers`` (comma
+    separated names of ``IDENTIFY_LAYERS``, all by default), ``limit`` per
+    layer and ``max_distance`` in metres. Features are sorted by distance.
+    Responses are not cached, since clicked locations rarely repeat.
+    """
+    try:
+        lon = float(request.GET['lon'])
+        lat = float(request.GET['lat'])
+        limit = int(request.GET.get('limit', IDENTIFY_LIMIT))
+        limit = max(1, min(limit, IDENTIFY_MAX_LIMIT))
+        max_distance = float(request.GET['max_distance']) if request.GET.get('max_distance') else None
+    except KeyError as e:
+        return ApiJsonResponse({"error": f"Missing parameter {e}"}, status=400)
+    except ValueError as e:
+        return ApiJsonResponse({"error": str(e)}, status=400)
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        return ApiJsonResponse({"error": "lon/lat out of range"}, status=400)
+
+    layers = [l for l in request.GET.get('layers', '').split(',') if l] or list(IDENTIFY_LAYERS)
+    unknown = [l for l in layers if l not in IDENTIFY_LAYERS]
+    if unknown:
+        return ApiJsonResponse({"error": f"Unknown layers: {', '.join(unknown)}"}, status=400)
+
+    features = []
+    try:
+        with timed(request, 'materialize'):
+            for layer in layers:
+                # Layers without data for the country, such as US storage, are skipped.
+                model = IDENTIFY_LAYERS[layer].get(country.lower())
+                if model is None:
+                    continue
+                for feature in _nearest_features(model, lon, lat, limit):
+                    feature['properties']['layer'] = layer
+                    features.append(feature)
     except Exception as e:
-        print(f"Error in economic_data_json: {str(e)}")  
-        return JsonResponse({"error": str(e)}, status=500)
\ No newline at end of file
+        logger.error(f"Error in identify_json for {country}: {str(e)}", exc_info=True)
+        return ApiJsonResponse({"error": str(e)}, status=500)
+
+    if max_distance is not None:
+        features = [f for f in features if f['distance'] <= max_distance]
+    features.sort(key=lambda f: f['distance'])
+
+    record_rows(request, len(features))
+    with timed(request, 'encode'):
+        return ApiJsonResponse({"type": "FeatureCollection", "features": features})
+
+
+@csrf_exempt
+@cached_api_response
+def regions_json(request, country):
+    """
+    Regions of ``country`` as GeoJSON, with the aggregates of one point layer per carrier.
+
+    Query parameters: ``source`` (a name of ``region_sources()``, default
+    ``nominal_generators``) and ``carrier`` (comma separated).
+    """
+    source = request.GET.get('source', 'nominal_generators')
+    sources = region_sources()
+    if source not in sources:
+        return ApiJsonResponse({"error": f"source must be one of {', '.join(sources)}"}, status=400)
+
+    country = country.lower()
+    with timed(request, 'materialize'):
+        regions = list(Region.objects.filter(country=country)
+                       .annotate(geojson=AsGeoJSON('geom', precision=6))
+                       .values('id', 'name', 'code', 'geojson'))
+        if not regions:
+            return ApiJsonResponse({"error": f"No regions loaded for {country}"}, status=404)
+
+        aggregates = RegionAggregate.objects.filter(region__country=country, source=source)
+        if request.GET.get('carrier'):
+            aggregates = aggregates.filter(carrier__in=request.GET['carrier'].split(','))
+        carriers = {}
+        for row in aggregates.values('region_id', 'carrier', 'count', 'capacity', *MEAN_COLUMNS):
+            carriers.setdefault(row.pop('region_id'), {})[row.pop('carrier')] = row
+
+    with timed(request, 'geometry'):
+        features = [{
+            "type": "Feature",
+            "id": region['id'],
+            "geometry": json.loads(region['geojson']),
+            "properties": {
+                "name": region['name'],
+                "code": region['code'],
+                "carriers": carriers.get(region['id'], {}),
+            },
+        } for region in regions]
+
+    record_rows(request, len(features))
+    with timed(request, 'encode'):
+        return ApiJsonResponse({"type": "FeatureCollection", "source": source, "features": features})
+
+
+@csrf_exempt
+@cached_api_response
+def line_metrics_json(request, country):
+    """
+    Derived line metrics, e.g. the most expanded corridors with ``order_by=-expansion&limit=100``.
+
+    Query parameters: ``order_by`` (a field of ``LINE_METRIC_SORT_FIELDS``,
+    ``-`` for descending), ``limit``, ``carrier`` (comma separated) and
+    ``min_<field>``/``max_<field>`` bounds. Lines where the sort field is
+    undefined are left out.
+    """
+    order_by = request.GET.get('order_by', '-expansion')
+    field = order_by.lstrip('-')
+    if field not in LINE_METRIC_SORT_FIELDS:
+        return ApiJsonResponse({"error": f"order_by must be one of {', '.join(LINE_METRIC_SORT_FIELDS)}"},
+                               status=400)
+
+    lines = LineMetrics.objects.filter(country=country.lower(), **{f'{field}__isnull': False})
+    try:
+        limit = int(request.GET.get('limit', LINE_METRIC_LIMIT))
+        limit = max(1, min(limit, LINE_METRIC_MAX_LIMIT))
+        for name in LINE_METRIC_SORT_FIELDS:
+            if request.GET.get(f'min_{name}'):
+                lines = lines.filter(**{f'{name}__gte': float(request.GET[f'min_{name}'])})
+            if request.GET.get(f'max_{name}'):
+                lines = lines.filter(**{f'{name}__lte': float(request.GET[f'max_{name}'])})
+    except ValueError as e:
+        return ApiJsonResponse({"error": str(e)}, status=400)
+    if request.GET.get('carrier'):
+        lines = lines.filter(carrier__in=request.GET['carrier'].split(','))
+
+    with timed(request, 'materialize'):
+        data = list(lines.order_by(order_by).values(
+            'line', 'bus0', 'bus1', 'carrier', 'length', 's_nom', 's_nom_opt',
+            *LINE_METRIC_FIELDS)[:limit])
+
+    record_rows(request, len(data))
+    with timed(request, 'encode'):
+        return ApiJsonResponse(data)
+
+
+@csrf_exempt
+@cached_api_response
+def timeseries_json(request, country, scenario, component, attribute):
+    """
+    Downsampled time series of imported networks, e.g. generator dispatch or bus prices.
+
+    ``names`` (comma separated, required) selects the elements. ``start`` and
+    ``end`` (ISO 8601) limit the range and ``width`` caps the points per
+    series. ``method`` is ``lttb`` (default, keeps the visual shape) or a
+    ``mean``/``min``/``max`` per window. Times are epoch milliseconds.
+    """
+    names = [n for n in request.GET.get('names', '').split(',') if n]
+    if not names:
+        return ApiJsonResponse({"error": "names is required"}, status=400)
+    if len(names) > TIMESERIES_MAX_NAMES:
+        return ApiJsonResponse({"error": f"At most {TIMESERIES_MAX_NAMES} names per request"}, status=400)
+    method = request.GET.get('method', 'lttb')
+    if method not in TIMESERIES_METHODS:
+        return ApiJsonResponse({"error": f"method must be one of {', '.join(TIMESERIES_METHODS)}"},
+                               status=400)
+    try:
+        width = max(3, min(int(request.GET.get('width', TIMESERIES_WIDTH)), TIMESERIES_MAX_WIDTH))
+        start = _parse_time(request.GET['start']) if request.GET.get('start') else None
+        end = _parse_time(request.GET['end']) if request.GET.get('end') else None
+    except ValueError as e:
+        return ApiJsonResponse({"error": str(e)}, status=400)
+
+    try:
+        with timed(request, 'load'):
+            series = open_series(country, scenario, component, attribute)
+    except SeriesNotFound as e:
+        return ApiJsonResponse({"error": str(e)}, status=404)
+    unknown = [n for n in names if n not in series.rows]
+    if unknown:
+        return ApiJsonResponse({"error": f"Unknown {component}: {', '.join(unknown)}"}, status=404)
+
+    with timed(request, 'downsample'):
+        data = downsample(series, names, start=start, end=end, width=width, method=method)
+    record_rows(request, sum(len(d['value']) for d in data.values()))
+    with timed(request, 'encode'):
+        return ApiJsonResponse(data)
+
+
+@csrf_exempt
+def export_dataset(request, dataset, country):
+    """
+    Download a layer table as ``format`` = gpkg, parquet or csv.zip.
+
+    Optional ``bbox`` (EPSG:4326) and ``fields`` (comma separated columns)
+    narrow the export. Files are cached per data version; the first request
+    streams parquet and zipped CSV while they are generated.
+    """
+    table = EXPORT_DATASETS.get(dataset, {}).get(country.lower())
+    if table is None:
+        return ApiJsonResponse({"error": f"No dataset '{dataset}' for {country}"}, status=404)
+
+    fmt = request.GET.get('format', 'gpkg')
+    if fmt not in EXPORT_FORMATS:
+        return ApiJsonResponse({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}, status=400)
+    if fmt == 'parquet' and not PARQUET_AVAILABLE:
+        return ApiJsonResponse({"error": "Parquet export requires pyarrow"}, status=501)
+
+    try:
+        bbox = _parse_bbox(request.GET['bbox']) if request.GET.get('bbox') else None
+        fields = [f for f in request.GET.get('fields', '').split(',') if f] or None
+        export = Export(table, fields=fields, bbox=bbox)
+    except ValueError as e:
+        return ApiJsonResponse({"error": str(e)}, status=400)
+    except ExportError as e:
+        return ApiJsonResponse({"error": str(e)}, status=404)
+
+    name = f"{country.replace(' ', '_')}_{dataset}"
+    filename = f"{name}.{fmt}"
+    content_type = EXPORT_FORMATS[fmt]
+    path = artifact_path(dataset, country.lower(), fmt, fields, bbox)
+
+    if not os.path.exists(path):
+        if fmt == 'gpkg':
+            partial = temporary_path(path)
+            try:
+                with timed(request, 'export'):
+                    write_gpkg(export, partial, name)
+                os.replace(partial, path)
+            except Exception as e:
+                logger.error(f"Error exporting {table} as {fmt}: {str(e)}", exc_info=True)
+                return ApiJsonResponse({"error": str(e)}, status=500)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+        else:
+            chunks = write_parquet(export) if fmt == 'parquet' else write_csv_zip(export, name)
+            response = StreamingHttpResponse(stream_and_store(chunks, path), content_type=content_type)
+            response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+            return response
+
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=filename, content_type=content_type)
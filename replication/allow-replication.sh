@@ -0,0 +1,7 @@
+#!/bin/bash
+# SPDX-FileCopyrightText: 2024 Bryan Ramirez <bryan.ramirez@openenergytransition.org>
+#
+# SPDX-License-Identifier: AGPL-3.0-or-later
+#
+# Let the replica container stream the WAL of the primary.
+echo "host replication all all scram-sha-256" >> "$PGDATA/pg_hba.conf"
@@ -68,37 +68,32 @@ export function createWFSDownloadUrl(layerName) {
   return `${window.GEOSERVER_URL}/ows?service=WFS&version=2.0.0&request=GetFeature&typeName=${window.GEOSERVER_WORKSPACE}:${cleanedLayerName}&outputFormat=application/json`;
 }
 
+// Format of the layer downloads: "gpkg", "parquet" or "csv.zip".
+const EXPORT_FORMAT = "gpkg";
+
+export function createExportUrl(layerName, format = EXPORT_FORMAT) {
+  const params = new URLSearchParams({ format: format });
+  return `/api/export/${encodeURIComponent(layerName)}/${encodeURIComponent(currentCountry)}/?${params}`;
+}
+
 export function downloadLayerData(layerName) {
   const mappingLayerName = layerName.replace(/-/g, '_');
   console.log(
     `Downloading data for country: ${currentCountry}, layer: ${mappingLayerName}`
   );
-  console.log(`GEOSERVER_URL: ${window.GEOSERVER_URL}`);
-  console.log(`GEOSERVER_WORKSPACE: ${window.GEOSERVER_WORKSPACE}`);
-  const url = createWFSDownloadUrl(mappingLayerName);
-  if (!url) {
-    console.error("Failed to create download URL");
+  if (!layerMappings[currentCountry] || !layerMappings[currentCountry][mappingLayerName]) {
+    console.error(`No layer ${mappingLayerName} to download for ${currentCountry}`);
     return;
   }
 
-  console.log(`Download URL: ${url}`);
-
-  fetch(url)
-    .then((response) => response.blob())
-    .then((blob) => {
-      const downloadUrl = window.URL.createObjectURL(blob);
-      const downloadLink = document.createElement("a");
-      downloadLink.href = downloadUrl;
-      downloadLink.download = `${currentCountry}_${layerName}.geojson`;
-      document.body.appendChild(downloadLink);
-      downloadLink.click();
-
-      document.body.removeChild(downloadLink);
-      window.URL.revokeObjectURL(downloadUrl);
-    })
-    .catch((error) => {
-      console.error("Error downloading the file:", error);
-    });
+  // Let the browser save the streamed export directly instead of buffering
+  // the whole layer in memory first.
+  const downloadLink = document.createElement("a");
+  downloadLink.href = createExportUrl(mappingLayerName);
+  downloadLink.download = `${currentCountry}_${layerName}.${EXPORT_FORMAT}`;
+  document.body.appendChild(downloadLink);
+  downloadLink.click();
+  document.body.removeChild(downloadLink);
 }
 
 export function addDownloadEventListeners() {
@@ -11,6 +11,34 @@ import {
 } from "./overlays.js";
 import { resetCharts, getCurrentCountry } from "./dataLoaders.js";
 
+// Search radius of the identify request, in screen pixels around the click.
+const IDENTIFY_TOLERANCE_PIXELS = 10;
+
+// The click handlers expect GeoJSON in the map projection, like the WMS
+// GetFeatureInfo responses they were written for.
+function toMapProjection(feature) {
+  const { type, coordinates } = feature.geometry;
+  const transformed =
+    type === "Point"
+      ? ol.proj.fromLonLat(coordinates)
+      : coordinates.map((coordinate) => ol.proj.fromLonLat(coordinate));
+  return { ...feature, geometry: { type, coordinates: transformed } };
+}
+
+// There is no bus layer to identify against. Generators carry the name of
+// their bus and are placed at its coordinates, so the bus of the nearest
+// generator stands in for the clicked bus.
+function busOfGenerator(feature) {
+  if (!feature || !feature.properties.Bus) {
+    return null;
+  }
+  return {
+    type: "Feature",
+    geometry: feature.geometry,
+    properties: { Bus: feature.properties.Bus },
+  };
+}
+
 export function addMapEventHandlers(map, busesLayer, linesLayer) {
   const overlays = createOverlays(map);
   const { labelElement, lineLabelElement } = overlays;
@@ -18,7 +46,6 @@ export function addMapEventHandlers(map, busesLayer, linesLayer) {
   map.on("singleclick", function (evt) {
     const viewResolution = map.getView().getResolution();
     const country = getCurrentCountry();
-    const buffer = 1000;
 
     const clickHandled = handleMapClick(
       evt,
@@ -31,63 +58,60 @@ export function addMapEventHandlers(map, busesLayer, linesLayer) {
     );
 
     if (!clickHandled) {
-      const busUrl = busesLayer
-        .getSource()
-        .getFeatureInfoUrl(evt.coordinate, viewResolution, "EPSG:3857", {
-          INFO_FORMAT: "application/json",
-          buffer: buffer,
-        });
-
-      if (busUrl) {
-        fetch(busUrl)
-          .then((response) => response.json())
-          .then((data) => {
-            console.log("Bus data received:", data);
-
-            if (data.features && data.features.length > 0) {
-              handleBusClick(evt, labelElement, map, country, data.features[0])
-                .then((handled) => {
-                  if (!handled) {
-                    resetCharts(country).catch((error) => console.error(error));
-                  }
-                })
-                .catch((error) => console.error(error));
-            } else {
-              resetCharts(country).catch((error) => console.error(error));
-            }
-          })
-          .catch((error) => console.error(error));
-      }
+      // Ask the server for the nearest bus and line instead of querying the
+      // WMS layers, whose features are never downloaded.
+      const [lon, lat] = ol.proj.toLonLat(evt.coordinate);
+      // The server measures geodesic metres, while Web Mercator units shrink by cos(latitude).
+      const metresPerPixel = ol.proj.getPointResolution(
+        map.getView().getProjection(),
+        viewResolution,
+        evt.coordinate,
+        "m"
+      );
+      const params = new URLSearchParams({
+        lon: lon,
+        lat: lat,
+        layers: "nominal_generators,lines",
+        limit: 1,
+        max_distance: metresPerPixel * IDENTIFY_TOLERANCE_PIXELS,
+      });
 
-      const lineUrl = linesLayer
-        .getSource()
-        .getFeatureInfoUrl(evt.coordinate, viewResolution, "EPSG:3857", {
-          INFO_FORMAT: "application/json",
-          buffer: buffer,
-        });
+      fetch(`/api/identify/${encodeURIComponent(country)}/?${params}`)
+        .then((response) => response.json())
+        .then((data) => {
+          const features = data.features || [];
+          const busFeature = busOfGenerator(
+            features.find((feature) => feature.properties.layer === "nominal_generators")
+          );
+          const lineFeature = features.find(
+            (feature) => feature.properties.layer === "lines"
+          );
 
-      if (lineUrl) {
-        fetch(lineUrl)
-          .then((response) => response.json())
-          .then((data) => {
-            console.log("Line data received:", data);
+          if (!busFeature && !lineFeature) {
+            resetCharts(country).catch((error) => console.error(error));
+            return;
+          }
 
-            if (data.features && data.features.length > 0) {
-              handleLineClick(evt, lineLabelElement, map, country, data.features[0])
-                .then((handled) => {
-                  if (!handled) {
-                    resetCharts(country).catch((error) => console.error(error));
-                  }
-                })
-                .catch((error) => console.error(error));
-            } else {
-              if (!busUrl) {
+          const handlers = [];
+          if (busFeature) {
+            handlers.push(
+              handleBusClick(evt, labelElement, map, country, toMapProjection(busFeature))
+            );
+          }
+          if (lineFeature) {
+            handlers.push(
+              handleLineClick(evt, lineLabelElement, map, country, toMapProjection(lineFeature))
+            );
+          }
+          Promise.all(handlers)
+            .then((handled) => {
+              if (!handled.some(Boolean)) {
                 resetCharts(country).catch((error) => console.error(error));
               }
-            }
-          })
-          .catch((error) => console.error(error));
-      }
+            })
+            .catch((error) => console.error(error));
+        })
+        .catch((error) => console.error(error));
     }
   });
 }
\ No newline at end of file
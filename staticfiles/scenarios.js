@@ -8,6 +8,7 @@ import {
   createScenarioCostDistributionChart,
   createScenarioCapacityComparisonChart,
 } from "./charts.js";
+import { getCurrentCountry } from "./dataLoaders.js";
 
 var mapInstances = {};
 let isSyncEnabled = true;
@@ -39,7 +40,9 @@ class SyncControl extends ol.control.Control {
   }
 }
 
-export function createScenarioControls() {
+// ``available`` lists the scenarios with statistics, from the inlined summary; empty keeps the defaults.
+export function createScenarioControls(available = []) {
+  const scenarioNames = available.length > 0 ? available : ["2021", "2050"];
   const scenarios = [
     { mapId: "map1", chartId: "chart1", carrier: "solar", variable: "cf", scenario: "2021" },
     { mapId: "map2", chartId: "chart2", carrier: "solar", variable: "cf", scenario: "2050" },
@@ -80,7 +83,7 @@ export function createScenarioControls() {
     const scenarioSelect = document.createElement("select");
     scenarioSelect.id = `scenarioSelector-${mapId}`;
     scenarioSelect.className = "map-scenario-selector";
-    ["2021", "2050"].forEach((s) => {
+    scenarioNames.forEach((s) => {
       const option = document.createElement("option");
       option.value = s;
       option.textContent = s;
@@ -122,10 +125,10 @@ export function createScenarioControls() {
     // Set initial values
     carrierSelect.value = carrier;
     variableSelect.value = variable;
-    scenarioSelect.value = scenario;
+    scenarioSelect.value = scenarioNames.includes(scenario) ? scenario : scenarioNames[0];
 
     // Initialize scenario map
-    initializeScenarioMap(mapId, carrier, variable, scenario);
+    initializeScenarioMap(mapId, carrier, variable, scenarioSelect.value);
 
     // Initialize economic charts
     updateEconomicCharts(chartId);
@@ -161,24 +164,73 @@ export function updateMap(mapId) {
     .find((layer) => layer instanceof ol.layer.Vector);
   if (vectorLayer) {
     const source = vectorLayer.getSource();
-    const newUrl = `${window.GEOSERVER_URL}/wfs?service=WFS&version=1.0.0&request=GetFeature&typeName=${window.GEOSERVER_WORKSPACE}:geojson_generators_combined_data_US_${scenario}&outputFormat=application/json`;
-    source.setUrl(newUrl);
-
+    source.set("scenario", scenario);
+    source.set("carrier", carrier);
+    source.set("generation", source.get("generation") + 1);
+    vectorLayer.setStyle((feature) =>
+      getChoroplethStyle(feature, variable, carrier, mapId)
+    );
+    loadScenarioStatistics(mapId, scenario, carrier, variable);
     source.clear();
     source.refresh();
-    source.once("change", function (e) {
-      if (source.getState() === "ready") {
-        vectorLayer.setStyle((feature) =>
-          getChoroplethStyle(feature, variable, carrier, mapId)
-        );
-        const features = source.getFeatures();
-        createLegend(mapId, variable, carrier, features);
-        map.updateSize();
-      }
-    });
+    map.updateSize();
   }
 }
 
+const SCENARIO_FEATURE_PROPERTIES = ["carrier", "geographic_name", "cf", "crt", "usdpt"];
+
+// Vector source backed by the paged scenario feature API. Features are requested
+// per view extent (bbox strategy) and carry their name as id, so each one is
+// only added once however often the extents overlap.
+function createScenarioSource(mapId, scenario, carrier) {
+  const format = new ol.format.GeoJSON();
+  const source = new ol.source.Vector({
+    strategy: ol.loadingstrategy.bbox,
+    loader: async function (extent, resolution, projection) {
+      const generation = source.get("generation");
+      const bbox = ol.proj.transformExtent(extent, projection, "EPSG:4326");
+      const params = new URLSearchParams({
+        bbox: bbox.join(","),
+        carrier: source.get("carrier"),
+        properties: SCENARIO_FEATURE_PROPERTIES.join(","),
+      });
+      const url = `/api/scenario-features/${getCurrentCountry()}/${source.get("scenario")}/`;
+
+      try {
+        let cursor = null;
+        do {
+          if (cursor) {
+            params.set("cursor", cursor);
+          }
+          const response = await fetch(`${url}?${params}`);
+          if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+          }
+          const data = await response.json();
+          if (source.get("generation") !== generation) {
+            return;
+          }
+          source.addFeatures(
+            format.readFeatures(data, { featureProjection: projection })
+          );
+          cursor = data.next_cursor;
+        } while (cursor);
+
+        source.set("loadedGeneration", generation);
+        if (scenarioStatistics[mapId] === null) {
+          const variable = document.getElementById(`variableSelector-${mapId}`).value;
+          applyFeatureStatistics(mapId, source, variable);
+        }
+      } catch (error) {
+        console.error(`Error fetching scenario features from ${url}:`, error);
+        source.removeLoadedExtent(extent);
+      }
+    },
+  });
+  source.setProperties({ scenario: scenario, carrier: carrier, generation: 0, loadedGeneration: -1 });
+  return source;
+}
+
 export async function initializeScenarioMap(
   mapId,
   carrier,
@@ -196,14 +248,8 @@ export async function initializeScenarioMap(
     mapInstances[mapId].setTarget(null);
   }
 
-  let wfsUrl = `${window.GEOSERVER_URL}/wfs?service=WFS&version=1.0.0&request=GetFeature&typeName=${window.GEOSERVER_WORKSPACE}:geojson_generators_combined_data_US_${scenario}&outputFormat=application/json`;
-  console.log("WFS URL:", wfsUrl);
-
-  const vectorSource = new ol.source.Vector({
-    format: new ol.format.GeoJSON(),
-    url: wfsUrl,
-    strategy: ol.loadingstrategy.all,
-  });
+  const vectorSource = createScenarioSource(mapId, scenario, carrier);
+  loadScenarioStatistics(mapId, scenario, carrier, variable);
 
   const vectorLayer = new ol.layer.Vector({
     source: vectorSource,
@@ -241,37 +287,6 @@ export async function initializeScenarioMap(
     syncMaps(mapId, "zoom");
   });
 
-  try {
-    const response = await fetch(wfsUrl);
-    if (!response.ok) {
-      throw new Error(`HTTP error! status: ${response.status}`);
-    }
-    const data = await response.json();
-    const features = new ol.format.GeoJSON().readFeatures(data);
-    console.log("Loaded features:", features);
-    if (features.length > 0) {
-      console.log("Sample feature properties:", features[0].getProperties());
-      console.log("Unique carriers:", [
-        ...new Set(features.map((f) => f.get("carrier"))),
-      ]);
-      console.log(
-        "Feature count by carrier:",
-        features.reduce((acc, f) => {
-          const carrier = f.get("carrier");
-          acc[carrier] = (acc[carrier] || 0) + 1;
-          return acc;
-        }, {})
-      );
-    }
-    features.forEach((feature) => {
-      vectorSource.addFeature(feature);
-    });
-    createLegend(mapId, variable, carrier, features);
-  } catch (error) {
-    console.error("Error fetching data:", error);
-    console.log("WFS URL that caused the error:", wfsUrl);
-  }
-
   const tooltip = document.createElement("div");
   tooltip.className = "tooltip";
   tooltip.style.position = "absolute";
@@ -320,38 +335,126 @@ export async function initializeScenarioMap(
   });
 }
 
-function createLegend(mapId, variable, carrier, features) {
-  const legendElement = document.getElementById(`map-legend-${mapId}`);
-  if (!legendElement) {
-    console.warn(`Legend element not found for mapId: ${mapId}`);
+// Legend and colour scale statistics per map. Undefined while the request to
+// /api/stats/ is pending, null when the server has none for the selection.
+const scenarioStatistics = {};
+const scenarioStatisticsKeys = {};
+
+async function loadScenarioStatistics(mapId, scenario, carrier, variable) {
+  const key = `${scenario}/${carrier}/${variable}`;
+  scenarioStatisticsKeys[mapId] = key;
+  delete scenarioStatistics[mapId];
+
+  let stats = null;
+  try {
+    const response = await fetch(`/api/stats/${getCurrentCountry()}/${key}/`);
+    if (!response.ok) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+    stats = await response.json();
+  } catch (error) {
+    console.warn(`No precomputed statistics for ${key}:`, error);
+  }
+
+  if (scenarioStatisticsKeys[mapId] !== key) {
     return;
   }
+  if (stats) {
+    setScenarioStatistics(mapId, stats);
+  } else {
+    scenarioStatistics[mapId] = null;
+    // The features may have finished loading before the request failed.
+    const source = scenarioSource(mapId);
+    if (source && source.get("loadedGeneration") === source.get("generation")) {
+      applyFeatureStatistics(mapId, source, variable);
+    }
+  }
+}
 
+function scenarioSource(mapId) {
+  const map = mapInstances[mapId];
+  const vectorLayer =
+    map &&
+    map
+      .getLayers()
+      .getArray()
+      .find((layer) => layer instanceof ol.layer.Vector);
+  return vectorLayer ? vectorLayer.getSource() : null;
+}
+
+function applyFeatureStatistics(mapId, source, variable) {
+  setScenarioStatistics(
+    mapId,
+    statisticsFromFeatures(source.getFeatures(), source.get("carrier"), variable)
+  );
+}
+
+// Fallback for scenario tables uploaded before statistics were precomputed.
+function statisticsFromFeatures(features, carrier, variable) {
   const values = features
     .filter((f) => f.get("carrier") === carrier)
     .map((f) => parseFloat(f.get(variable)))
-    .filter((v) => !isNaN(v) && isFinite(v))
-    .sort((a, b) => a - b);
+    .filter((v) => !isNaN(v) && isFinite(v));
 
   if (values.length === 0) {
-    legendElement.innerHTML = "<div><b>No data available</b></div>";
-    return;
+    return { carrier: carrier, variable: variable, count: 0 };
   }
+  return {
+    carrier: carrier,
+    variable: variable,
+    count: values.length,
+    min_value: Math.min(...values),
+    max_value: Math.max(...values),
+  };
+}
+
+function setScenarioStatistics(mapId, stats) {
+  if (stats.count > 0) {
+    const colorScale = carrierColorScales[stats.carrier] || defaultColorScale;
+    stats.scale = chroma
+      .scale(colorScale)
+      .domain([stats.min_value, stats.max_value]);
+  }
+  scenarioStatistics[mapId] = stats;
+  createLegend(mapId, stats);
 
-  const minValue = values[0];
-  const maxValue = values[values.length - 1];
+  const map = mapInstances[mapId];
+  const vectorLayer =
+    map &&
+    map
+      .getLayers()
+      .getArray()
+      .find((layer) => layer instanceof ol.layer.Vector);
+  if (vectorLayer) {
+    vectorLayer.changed();
+  }
+}
 
-  const colorScale = carrierColorScales[carrier] || defaultColorScale;
-  const chromaScale = chroma.scale(colorScale).domain([minValue, maxValue]);
+function createLegend(mapId, stats) {
+  const legendElement = document.getElementById(`map-legend-${mapId}`);
+  if (!legendElement) {
+    console.warn(`Legend element not found for mapId: ${mapId}`);
+    return;
+  }
 
-  const steps = 5;
-  const stepSize = (maxValue - minValue) / (steps - 1);
+  if (!stats.count) {
+    legendElement.innerHTML = "<div><b>No data available</b></div>";
+    return;
+  }
 
-  let legendHTML = `<div><b>Legend - ${carrier}</b></div>`;
-  for (let i = 0; i < steps; i++) {
-    const value = minValue + i * stepSize;
-    const color = chromaScale(value).hex();
-    const decimals = maxValue - minValue < 0.01 ? 4 : 3;
+  const minValue = stats.min_value;
+  const maxValue = stats.max_value;
+  let values = stats.jenks_breaks;
+  if (!values || values.length < 2) {
+    const steps = 5;
+    const stepSize = (maxValue - minValue) / (steps - 1);
+    values = Array.from({ length: steps }, (_, i) => minValue + i * stepSize);
+  }
+  const decimals = maxValue - minValue < 0.01 ? 4 : 3;
+
+  let legendHTML = `<div><b>Legend - ${stats.carrier}</b></div>`;
+  values.forEach((value) => {
+    const color = stats.scale(value).hex();
 
     legendHTML += `
       <div style="display: flex; align-items: center; margin-bottom: 5px;">
@@ -359,7 +462,7 @@ function createLegend(mapId, variable, carrier, features) {
         <span>${value.toFixed(decimals)}</span>
       </div>
     `;
-  }
+  });
 
   legendElement.innerHTML = legendHTML;
 }
@@ -381,55 +484,28 @@ const carrierColorScales = {
 
 const defaultColorScale = ["#FFFFFF", "#000000"];
 
+const noDataStyle = new ol.style.Style({
+  fill: new ol.style.Fill({
+    color: "rgba(200, 200, 200, 0.5)",
+  }),
+  stroke: new ol.style.Stroke({
+    color: "#000000",
+    width: 0.1,
+  }),
+});
+
 function getChoroplethStyle(feature, variable, carrier, mapId) {
   if (!feature || feature.get("carrier") !== carrier) {
     return null;
   }
 
-  let value = parseFloat(feature.get(variable));
-  if (isNaN(value) || !isFinite(value)) {
-    return new ol.style.Style({
-      fill: new ol.style.Fill({
-        color: "rgba(200, 200, 200, 0.5)",
-      }),
-      stroke: new ol.style.Stroke({
-        color: "#000000",
-        width: 0.1,
-      }),
-    });
+  const value = parseFloat(feature.get(variable));
+  const stats = scenarioStatistics[mapId];
+  if (isNaN(value) || !isFinite(value) || !stats || !stats.count) {
+    return noDataStyle;
   }
 
-  const allFeatures = mapInstances[mapId]
-    .getLayers()
-    .getArray()
-    .find((layer) => layer instanceof ol.layer.Vector)
-    .getSource()
-    .getFeatures();
-
-  const allValues = allFeatures
-    .filter((f) => f.get("carrier") === carrier)
-    .map((f) => parseFloat(f.get(variable)))
-    .filter((v) => !isNaN(v) && isFinite(v));
-
-  if (allValues.length === 0) {
-    return new ol.style.Style({
-      fill: new ol.style.Fill({
-        color: "rgba(200, 200, 200, 0.5)",
-      }),
-      stroke: new ol.style.Stroke({
-        color: "#000000",
-        width: 0.1,
-      }),
-    });
-  }
-
-  const minValue = Math.min(...allValues);
-  const maxValue = Math.max(...allValues);
-
-  const colorScale = carrierColorScales[carrier] || defaultColorScale;
-  const chromaScale = chroma.scale(colorScale).domain([minValue, maxValue]);
-
-  const color = chromaScale(value).rgba();
+  const color = stats.scale(value).rgba();
 
   return new ol.style.Style({
     fill: new ol.style.Fill({